@@ -0,0 +1,175 @@
+# backend/adaptive_batcher.py
+
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+# 可重试的 HTTP 状态码：限流和服务端错误
+RETRYABLE_STATUS = {408, 409, 429}
+# 没有状态码、但属于网络层面的临时错误（按异常类名判断，不依赖具体 SDK）
+RETRYABLE_ERRORS = ('APIConnectionError', 'APITimeoutError', 'Timeout', 'ConnectionError')
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """从 SDK 异常中取出 HTTP 状态码（openai / requests / dashscope 等）"""
+    for source in (error, getattr(error, 'response', None)):
+        status = getattr(source, 'status_code', None)
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """429、5xx 以及连接/超时错误可以重试，其余错误（如 400、401）直接抛出"""
+    status = error_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    return any(type(error).__name__.endswith(name) for name in RETRYABLE_ERRORS)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """读取服务端返回的 Retry-After（秒）"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    try:
+        value = headers.get('retry-after') if headers is not None else None
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveBatcher:
+    """
+    自适应 Embeddings 批大小
+
+    - 每批同时受 chunk 数（batch_size）和字符数（max_batch_chars，近似 token 预算）限制
+    - 请求耗时低于 target_latency 时批大小翻倍，直到 max_batch_size
+    - 遇到 429 / 5xx 时批大小减半，并按带随机抖动的指数退避重试
+    - 累计记录吞吐量（chunks/s），便于针对不同服务商调参
+
+    线程安全：多个工作线程可以共享同一个实例，批大小在所有请求之间共同调整。
+    """
+
+    def __init__(self,
+                 initial_batch_size: int = 64,
+                 min_batch_size: int = 1,
+                 max_batch_size: int = 512,
+                 max_batch_chars: int = 100_000,
+                 target_latency: float = 5.0,
+                 max_retries: int = 5,
+                 base_delay: float = 1.0,
+                 max_delay: float = 60.0):
+        """
+        Args:
+            initial_batch_size: 初始每批 chunk 数
+            min_batch_size: 批大小下限
+            max_batch_size: 批大小上限
+            max_batch_chars: 每批文本总字符数上限（单个超长文本单独成批）
+            target_latency: 单次请求耗时低于该值（秒）时增大批次
+            max_retries: 单个批次的最大重试次数
+            base_delay: 指数退避的初始等待（秒）
+            max_delay: 单次等待上限（秒）
+        """
+        self.min_batch_size = max(1, min_batch_size)
+        self.max_batch_size = max(self.min_batch_size, max_batch_size)
+        self.batch_size = min(max(initial_batch_size, self.min_batch_size), self.max_batch_size)
+        self.max_batch_chars = max_batch_chars
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+
+        # 累计统计
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.chunks = 0
+        self.seconds = 0.0
+
+    def take(self, texts: List[str], start: int) -> int:
+        """
+        从 texts[start:] 切出下一批，返回批次结束位置（不含）
+
+        至少包含一个文本，即使它本身超过字符预算。
+        """
+        with self._lock:
+            batch_size = self.batch_size
+        end = start
+        chars = 0
+        while end < len(texts) and end - start < batch_size:
+            chars += len(texts[end])
+            if end > start and chars > self.max_batch_chars:
+                break
+            end += 1
+        return end
+
+    def call(self, fn: Callable[[List[str]], List], batch: List[str]) -> List:
+        """
+        调用 fn(batch)，根据耗时和错误调整批大小
+
+        可重试错误按 base_delay * 2^attempt 的上限做全抖动（full jitter）退避，
+        服务端给出 Retry-After 时至少等待该时长；重试次数用尽或错误不可重试时抛出。
+        """
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                result = fn(batch)
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                delay = max(delay, _retry_after(e) or 0)
+                self._shrink(e)
+                attempt += 1
+                print(f"  ⏳ Embeddings 请求失败 ({error_status(e) or type(e).__name__})，"
+                      f"{delay:.1f}s 后重试 ({attempt}/{self.max_retries})，批大小调整为 {self.batch_size}")
+                time.sleep(delay)
+                continue
+
+            self._grow(time.perf_counter() - started)
+            return result
+
+    def _shrink(self, error: Exception):
+        with self._lock:
+            self.retries += 1
+            if error_status(error) == 429:
+                self.throttled += 1
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+
+    def _grow(self, latency: float):
+        with self._lock:
+            self.requests += 1
+            if latency < self.target_latency:
+                self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+
+    def run(self, texts: List[str], fn: Callable[[List[str]], List]) -> List:
+        """按自适应批大小顺序处理全部文本，返回拼接后的结果"""
+        started = time.perf_counter()
+        results = []
+        start = 0
+        while start < len(texts):
+            end = self.take(texts, start)
+            results.extend(self.call(fn, texts[start:end]))
+            start = end
+        self.record(len(texts), time.perf_counter() - started)
+        return results
+
+    def record(self, chunks: int, seconds: float):
+        """累加一次向量化的 chunk 数和墙钟耗时"""
+        with self._lock:
+            self.chunks += chunks
+            self.seconds += seconds
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'batch_size': self.batch_size,
+                'requests': self.requests,
+                'retries': self.retries,
+                'throttled': self.throttled,
+                'chunks': self.chunks,
+                'chunks_per_second': round(self.chunks / self.seconds, 2) if self.seconds > 0 else None
+            }
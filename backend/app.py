@@ -1,14 +1,19 @@
 # backend/app.py
 
+import logging
 import os
 from pathlib import Path
 from dotenv import load_dotenv
 from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 from knowledge_base import LocalKnowledgeBase
+from job_queue import JobQueue
 from pathlib import Path
 import traceback
 import json
+import shutil
+import time
+import uuid
 
 """
 Python为脚本语言，写在前面的部分会被优先执行
@@ -17,6 +22,9 @@ Python为脚本语言，写在前面的部分会被优先执行
 """
 load_dotenv()
 
+# 后端模块的失败（含堆栈）通过 logging 输出；其余进度信息仍直接打印
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
 """
 Python 是 “脚本语言 + 模块语言”，一个 .py 文件既可以作为可执行脚本，也可以作为模块被其他脚本导入。例如：
 如果你在另一个文件中写 import app，此时 app.py 会被当作模块加载，全局代码（如初始化 app、kb）仍会执行，
@@ -54,7 +62,29 @@ print("🚀 初始化本地知识库系统")
 print("="*60)
 
 try:
-    kb = LocalKnowledgeBase()
+    # KB_MMAP_INDEX=1：只读映射向量索引，多个 gunicorn worker 共享同一份页缓存
+    # KB_METRIC=cosine：归一化向量 + 内积索引，检索得分为余弦相似度
+    # KB_EMBEDDING_DIMENSIONS=512：缩短向量维度（未设置时沿用现有向量库的维度）
+    # KB_QUERY_CACHE_SIZE / KB_QUERY_CACHE_TTL：查询向量内存缓存的条目数和有效期（秒）
+    # KB_RESULT_CACHE_SIZE / KB_RESULT_CACHE_MAX_BYTES：检索结果缓存的条目数和总字节数
+    # KB_HYBRID_SEARCH=0：关闭 BM25 混合检索，只用向量检索
+    # KB_LEXICAL_MIN_MATCH：只被 BM25 命中的 chunk 至少包含的查询词项比例（0-1）
+    # KB_RERANK_MAX_BATCH / KB_RERANK_MAX_WAIT_MS：并发重排序合批的最大 pair 数和最长等待（毫秒）
+    # KB_RERANK_CACHE_SIZE：缓存的重排序得分数
+    kb = LocalKnowledgeBase(
+        mmap_index=os.getenv('KB_MMAP_INDEX', '0') == '1',
+        metric=os.getenv('KB_METRIC', 'l2'),
+        embedding_dimensions=int(os.getenv('KB_EMBEDDING_DIMENSIONS', '0')) or None,
+        query_cache_size=int(os.getenv('KB_QUERY_CACHE_SIZE', '1024')),
+        query_cache_ttl=float(os.getenv('KB_QUERY_CACHE_TTL', '3600')),
+        result_cache_size=int(os.getenv('KB_RESULT_CACHE_SIZE', '256')),
+        result_cache_max_bytes=int(os.getenv('KB_RESULT_CACHE_MAX_BYTES', str(32 * 1024 * 1024))),
+        hybrid_search=os.getenv('KB_HYBRID_SEARCH', '1') == '1',
+        lexical_min_match=float(os.getenv('KB_LEXICAL_MIN_MATCH', '0.5')),
+        rerank_max_batch_size=int(os.getenv('KB_RERANK_MAX_BATCH', '64')),
+        rerank_max_wait_ms=float(os.getenv('KB_RERANK_MAX_WAIT_MS', '5')),
+        rerank_cache_size=int(os.getenv('KB_RERANK_CACHE_SIZE', '20000'))
+    )
     print("✅ 知识库初始化成功！\n")
 except Exception as e:
     print(f"❌ 知识库初始化失败: {e}")
@@ -80,6 +110,68 @@ except Exception as e:
 
 
 
+# 初始化后台任务队列：上传和重建索引在工作线程中执行，请求只返回任务 id
+job_queue = None
+if kb:
+    job_queue = JobQueue(kb.db_path / 'jobs.sqlite')
+
+    def _run_upload_job(payload, report):
+        """后台上传任务：向量化已落盘的上传文件，并保存到知识库 documents 目录"""
+        files = [fp for fp in payload.get('files', []) if Path(fp).exists()]
+        try:
+            result = kb.add_documents(files, progress_callback=report)
+            kb.persist_uploaded_files(files)
+            return result
+        finally:
+            # 失败的任务不会重试：无论成败都删除暂存的上传文件（进程异常退出时任务重新排队，文件保留）
+            shutil.rmtree(payload['upload_dir'], ignore_errors=True)
+
+    def _run_reindex_job(payload, report):
+        """后台重建任务：默认增量同步，full=True 时全量重建，migrate_metric=True 时只转换相似度度量"""
+        if payload.get('migrate_metric'):
+            return {'migrated': kb.migrate_metric(), 'metric': kb.metric}
+        if payload.get('full'):
+            if not kb._rebuild_vector_store():
+                raise RuntimeError(f"重建失败: {kb.last_rebuild_error or '未知错误'}")
+            return {'message': '重建完成', **kb.last_rebuild_stats}
+        return kb.sync_documents(progress_callback=report)
+
+    job_queue.register('upload', _run_upload_job)
+    job_queue.register('reindex', _run_reindex_job)
+
+
+@app.before_request
+def _ensure_job_queue_started():
+    """收到第一个请求时启动任务线程（debug 重载器的父进程不处理请求，也就不会执行任务）"""
+    if job_queue:
+        job_queue.start()
+
+
+def _spool_uploads(files):
+    """
+    把上传的文件直接写入知识库目录下的任务上传目录（不读入内存）
+
+    文件在任务完成前一直保留在磁盘上，进程重启后任务可以继续处理。
+    Returns:
+        (上传目录, [(原始文件名, 磁盘路径), ...])
+    """
+    upload_dir = kb.db_path / 'uploads' / uuid.uuid4().hex
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    saved_files = []
+    try:
+        for idx, file in enumerate(files):
+            if not file.filename:
+                continue
+            temp_path = upload_dir / f"{idx}_{file.filename}"
+            file.save(str(temp_path))  # 分块写入磁盘
+            saved_files.append((file.filename, str(temp_path)))
+            print(f"  ✅ 已保存文件: {file.filename} ({temp_path.stat().st_size} bytes)")
+    except Exception:
+        shutil.rmtree(str(upload_dir), ignore_errors=True)
+        raise
+    return upload_dir, saved_files
+
+
 # ==================== API 端点 ====================
 
 @app.route('/api/kb/stats', methods=['GET', 'OPTIONS'])  
@@ -129,12 +221,20 @@ def upload_documents():
         for idx, file in enumerate(files):
             print(f"  文件 {idx+1}: {file.filename} (类型: {type(file).__name__})")
         
-        # ✅ 直接传递 FileStorage 列表
-        result = kb.add_documents_from_upload(files)
+        # ✅ 文件落盘后交给后台任务处理，立即返回任务 id
+        upload_dir, saved_files = _spool_uploads(files)
+        job_id = job_queue.submit('upload', {
+            'upload_dir': str(upload_dir),
+            'files': [path for _, path in saved_files]
+        })
         
         print("="*60)
-        print(f"✅ 上传结果: {result}\n")
-        return jsonify(result), 200
+        print(f"✅ 已加入后台任务: {job_id}\n")
+        return jsonify({
+            'job_id': job_id,
+            'status': 'queued',
+            'files': [name for name, _ in saved_files]
+        }), 202
     
     except Exception as e:
         print(f"❌ 上传失败: {e}")
@@ -156,11 +256,15 @@ def search_kb():
         data = request.get_json()
         query = data.get('query', '')
         top_k = data.get('top_k', 3)
+        # 可选：本次检索的索引参数（IVF 的 nprobe / HNSW 的 ef_search / 量化索引的 rescore_factor）
+        search_params = {
+            key: data[key] for key in ('nprobe', 'ef_search', 'rescore_factor') if data.get(key) is not None
+        }
         
         if not query:
             return jsonify({'error': '查询内容不能为空'}), 400
         
-        result = kb.search(query, top_k)
+        result = kb.search(query, top_k, search_params=search_params)
         return jsonify(result), 200
     except Exception as e:
         print(f"❌ 搜索失败: {e}")
@@ -410,7 +514,7 @@ def clear_kb():
 
 @app.route('/api/documents/list', methods=['GET', 'OPTIONS'])  
 def list_documents():
-    """列出所有文档"""
+    """列出所有文档（可用 ?status=indexed 过滤）"""
     if request.method == 'OPTIONS':  
         return '', 204
     
@@ -418,8 +522,7 @@ def list_documents():
         return jsonify({'error': '知识库未初始化'}), 500
     
     try:
-        stats = kb.get_stats()
-        return jsonify({'files': stats.get('files', [])}), 200
+        return jsonify({'files': kb.list_documents(request.args.get('status'))}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -451,82 +554,74 @@ def document_detail(filename):
         return jsonify({'error': '知识库未初始化'}), 500
 
     try:
-        stats = kb.get_stats()
-        files = stats.get('files', [])
-        for f in files:
-            if f.get('name') == filename:
-                # 从 kb.file_metadata 取 chunks_detail（如果存在）
-                meta = kb.file_metadata.get(filename, {})
-                chunks_detail = meta.get('chunks_detail')
-                # 如果没有 chunks_detail，尝试按需生成（不持久化）
-                if not chunks_detail:
-                    try:
-                        file_path = meta.get('path') or f.get('path')
-                        # 如果记录的 path 不存在，尝试在常见目录中查找（uploads/, knowledge_db/documents/）
-                        if not file_path or not os.path.exists(file_path):
-                            candidates = []
-                            # backend/uploads
-                            uploads_dir = Path(__file__).parent / 'uploads'
-                            if uploads_dir.exists():
-                                for p in uploads_dir.iterdir():
-                                    if p.name.endswith(filename) or p.name.endswith('_' + filename):
-                                        candidates.append(str(p))
-                            # knowledge_db/documents
-                            docs_dir = Path(__file__).parent / 'knowledge_db' / 'documents'
-                            if docs_dir.exists():
-                                for p in docs_dir.iterdir():
-                                    if p.name.endswith(filename) or p.name.endswith('_' + filename):
-                                        candidates.append(str(p))
-                            if candidates:
-                                file_path = candidates[0]
-                        if file_path and os.path.exists(file_path):
-                            docs, err = kb._load_file(Path(file_path))
-                            if not err and docs:
-                                splitter = None
-                                try:
-                                    from langchain_text_splitters import RecursiveCharacterTextSplitter
-                                    splitter = RecursiveCharacterTextSplitter(
-                                        chunk_size=kb.chunk_size,
-                                        chunk_overlap=kb.chunk_overlap
-                                    )
-                                except Exception:
-                                    splitter = None
-
-                                chunks_detail = []
-                                if splitter:
-                                    split_docs = splitter.split_documents(docs)
-                                    for idx, doc in enumerate(split_docs):
-                                        chunks_detail.append({'id': idx, 'content': doc.page_content[:2000]})
-                                # 持久化 chunks_detail 到 metadata（便于后续快速读取）
-                                try:
-                                    kb.file_metadata.setdefault(filename, {})
-                                    kb.file_metadata[filename]['chunks_detail'] = chunks_detail
-                                    kb.file_metadata[filename]['chunks'] = len(chunks_detail)
-                                    kb._save_metadata()
-                                except Exception as e:
-                                    print(f"⚠️ 持久化 chunks_detail 失败: {e}")
-                    except Exception as e:
-                        print(f"⚠️ 生成分块预览失败: {e}")
-
-                detail = {
-                    'name': f.get('name'),
-                    'path': f.get('path'),
-                    'upload_time': f.get('upload_time'),
-                    'size': f.get('size'),
-                    'chunks': f.get('chunks'),
-                    'status': f.get('status'),
-                    'chunks_detail': chunks_detail or []
-                }
-                return jsonify({'file': detail}), 200
-
-        return jsonify({'error': '文档未找到'}), 404
+        detail = kb.get_document(filename)
+        if detail is None:
+            return jsonify({'error': '文档未找到'}), 404
+
+        chunks_detail = detail['chunks_detail']
+        # 如果没有分块预览，尝试按需生成并写入元数据库
+        if not chunks_detail:
+            try:
+                file_path = detail.get('path')
+                # 如果记录的 path 不存在，尝试在常见目录中查找（uploads/, knowledge_db/documents/）
+                if not file_path or not os.path.exists(file_path):
+                    candidates = []
+                    # backend/uploads
+                    uploads_dir = Path(__file__).parent / 'uploads'
+                    if uploads_dir.exists():
+                        for p in uploads_dir.iterdir():
+                            if p.name.endswith(filename) or p.name.endswith('_' + filename):
+                                candidates.append(str(p))
+                    # knowledge_db/documents
+                    docs_dir = Path(__file__).parent / 'knowledge_db' / 'documents'
+                    if docs_dir.exists():
+                        for p in docs_dir.iterdir():
+                            if p.name.endswith(filename) or p.name.endswith('_' + filename):
+                                candidates.append(str(p))
+                    if candidates:
+                        file_path = candidates[0]
+                if file_path and os.path.exists(file_path):
+                    docs, err = kb._load_file(Path(file_path))
+                    if not err and docs:
+                        splitter = None
+                        try:
+                            from langchain_text_splitters import RecursiveCharacterTextSplitter
+                            splitter = RecursiveCharacterTextSplitter(
+                                chunk_size=kb.chunk_size,
+                                chunk_overlap=kb.chunk_overlap
+                            )
+                        except Exception:
+                            splitter = None
+
+                        chunks_detail = []
+                        if splitter:
+                            split_docs = splitter.split_documents(docs)
+                            for idx, doc in enumerate(split_docs):
+                                chunks_detail.append({'id': idx, 'content': doc.page_content[:2000]})
+                        # 持久化分块预览（只写入该文件的行），便于后续快速读取
+                        try:
+                            kb.file_metadata.set_chunk_previews(filename, chunks_detail)
+                            detail['chunks'] = len(chunks_detail)
+                        except Exception as e:
+                            print(f"⚠️ 持久化 chunks_detail 失败: {e}")
+            except Exception as e:
+                print(f"⚠️ 生成分块预览失败: {e}")
+
+        detail['chunks_detail'] = chunks_detail or []
+        detail.pop('added_time', None)
+        return jsonify({'file': detail}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/documents/<filename>/reindex', methods=['POST', 'OPTIONS'])
 def document_reindex(filename):
-    """触发基于当前元数据的全量重建索引（同步操作，可能耗时）"""
+    """
+    重建索引（后台任务，返回任务 id）
+    
+    默认执行增量同步：只重新向量化新增或已修改的文件，并移除已删除文件的向量；
+    请求体传入 {"full": true} 时执行全量重建。进度通过 /api/jobs/<id> 查询。
+    """
     if request.method == 'OPTIONS':
         return '', 204
 
@@ -538,16 +633,65 @@ def document_reindex(filename):
         if filename not in kb.file_metadata:
             return jsonify({'error': '文档未找到'}), 404
 
-        # 调用重建索引方法
-        success = kb._rebuild_vector_store()
-        if success:
-            return jsonify({'message': '重建完成'}), 200
-        else:
-            return jsonify({'error': '重建失败'}), 500
+        data = request.get_json(silent=True) or {}
+        job_id = job_queue.submit('reindex', {'full': bool(data.get('full')), 'filename': filename})
+        return jsonify({'message': '重建任务已加入后台队列', 'job_id': job_id}), 202
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/kb/sync', methods=['POST', 'OPTIONS'])
+def sync_kb():
+    """
+    增量同步整个知识库（后台任务），完成后任务结果为新增/更新/删除/未变化统计
+
+    请求体传入 {"migrate_metric": true} 时改为把现有向量转换为配置的相似度度量（KB_METRIC），
+    不重新向量化。
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    if not kb:
+        return jsonify({'error': '知识库未初始化'}), 500
+
+    try:
+        data = request.get_json(silent=True) or {}
+        job_id = job_queue.submit('reindex', {'full': False, 'migrate_metric': bool(data.get('migrate_metric'))})
+        return jsonify({'message': '同步任务已加入后台队列', 'job_id': job_id}), 202
+    except Exception as e:
+        print(f"❌ 增量同步失败: {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET', 'OPTIONS'])
+def get_job(job_id):
+    """查询后台任务：阶段、进度、吞吐量（chunks/s）、错误和结果"""
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    if not job_queue:
+        return jsonify({'error': '知识库未初始化'}), 500
+
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(job), 200
+
+
+@app.route('/api/jobs', methods=['GET', 'OPTIONS'])
+def list_jobs():
+    """列出最近的后台任务"""
+    if request.method == 'OPTIONS':
+        return '', 204
+
+    if not job_queue:
+        return jsonify({'error': '知识库未初始化'}), 500
+
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify({'jobs': job_queue.list(limit)}), 200
+
+
 @app.route('/api/health', methods=['GET', 'OPTIONS'])  
 def health_check():
     """健康检查"""
@@ -575,116 +719,90 @@ def upload_documents_with_progress():
         if not files or all(f.filename == '' for f in files):
             return jsonify({'error': '文件列表为空'}), 400
         
-        # 先读取所有文件内容到内存，而不是等到生成器中才读
-        file_data = []  # 存储 (filename, content) 元组
+        # 在生成器开始前把上传流直接写入磁盘（文件对象在请求结束后失效），
+        # 不把文件内容读入内存，然后交给后台任务处理
+        try:
+            upload_dir, saved_files = _spool_uploads(files)
+        except Exception as e:
+            error_msg = f'保存上传文件失败: {str(e)}'
+            print(f"  ❌ {error_msg}")
+            return jsonify({'error': error_msg}), 400
         
-        for idx, file in enumerate(files):
-            try:
-                # 立即读取文件内容（此时文件对象还是有效的）
-                content = file.read()
-                filename = file.filename
-                file_data.append((filename, content))
-                print(f"  ✅ 已读取文件: {filename} ({len(content)} bytes)")
-            except Exception as e:
-                error_msg = f'读取文件 {file.filename} 失败: {str(e)}'
-                print(f"  ❌ {error_msg}")
-                return jsonify({'error': error_msg}), 400
+        job_id = job_queue.submit('upload', {
+            'upload_dir': str(upload_dir),
+            'files': [path for _, path in saved_files]
+        })
         
-        # 现在生成器只需处理已在内存中的文件
+        # 生成器只负责把任务进度推送给客户端；客户端断开后任务继续在后台执行
         def generate():
-            # 从内存中处理文件
-            temp_files = []
-            total_files = len(file_data)
+            total_files = len(saved_files)
+            print(f"\n📤 开始上传，共 {total_files} 个文件 (任务 {job_id})")
             
-            # ======== 第一步：保存文件到磁盘 ========
-            print(f"\n📤 开始上传，共 {total_files} 个文件")
+            # ======== 第一步：文件已保存到磁盘 ========
+            for idx, (filename, _) in enumerate(saved_files):
+                # 📤 发送进度：文件保存完成 
+                # process计算原理： 已保存文件数 / 总文件数 * 20
+                # 这里假设保存文件阶段占总进度的前20%
+                # process 范围：0-20，超过20由后续处理文档阶段负责
+                progress = int((idx + 1) / total_files * 20) 
+                yield json.dumps({
+                    'type': 'progress', # 进度类型
+                    'stage': 'saving_files', # 阶段：保存文件
+                    'progress': progress, # 进度百分比
+                    'message': f'已保存文件 {idx+1}/{total_files}: {filename}', # 进度信息
+                    'job_id': job_id
+                }) + '\n'
             
-            try:
-                for idx, (filename, content) in enumerate(file_data):
-                    try:
-                        # 保存文件到临时目录
-                        uploads_dir = Path('./uploads')
-                        uploads_dir.mkdir(parents=True, exist_ok=True) # 确保目录存在，如果不存在则创建
-                        
-                        # 使用二进制写入
-                        temp_path = uploads_dir / f"{idx}_{filename}"
-                        with open(str(temp_path), 'wb') as f:
-                            f.write(content)
-                        
-                        temp_files.append(str(temp_path))
-                        
-                        # 📤 发送进度：文件保存完成 
-                        # process计算原理： 已保存文件数 / 总文件数 * 20
-                        # 这里假设保存文件阶段占总进度的前20%
-                        # process 范围：0-20，超过20由后续处理文档阶段负责
-                        progress = int((idx + 1) / total_files * 20) 
-                        message = f'已保存文件 {idx+1}/{total_files}: {filename}'
-                        
-                        print(f"  ✅ {message}")
-                        
-                        yield json.dumps({
-                            'type': 'progress', # 进度类型
-                            'stage': 'saving_files', # 阶段：保存文件
-                            'progress': progress, # 进度百分比
-                            'message': message # 进度信息
-                        }) + '\n'
-                        
-                    except Exception as e:
-                        error_msg = f'保存文件 {filename} 失败: {str(e)}'
-                        print(f"  ❌ {error_msg}")
-                        
-                        yield json.dumps({
-                            'type': 'error',
-                            'message': error_msg
-                        }) + '\n'
-                        return
-                
-                # ======== 第二步：处理文档（向量化） ========
-                print(f"\n📚 开始处理文档...")
+            # ======== 第二步：轮询后台任务（向量化） ========
+            last_state = None
+            while True:
+                job = job_queue.get(job_id)
+                if job is None:
+                    yield json.dumps({'type': 'error', 'message': '任务不存在', 'job_id': job_id}) + '\n'
+                    return
                 
-                try:
-                    # 调用 knowledge_base 添加文档
-                    result = kb.add_documents(temp_files)
-                    
-                    # 📤 发送完成前的最后进度，进度条process的进度为99%
-                    yield json.dumps({
-                        'type': 'progress',
-                        'stage': 'saving_index',
-                        'progress': 99,
-                        'message': '保存索引中...'
-                    }) + '\n'
-                    
+                if job['status'] == JobQueue.SUCCEEDED:
+                    result = job['result'] or {}
                     # 📤 发送最终结果，进度条process的进度为100%
                     yield json.dumps({
                         'type': 'complete',
                         'progress': 100,
-                        'added_chunks': result['added_chunks'],
-                        'files': result['files'],
-                        'errors': result['errors']
+                        'job_id': job_id,
+                        'added_chunks': result.get('added_chunks', 0),
+                        'files': result.get('files', []),
+                        'errors': result.get('errors', []),
+                        'embedding_cache': result.get('embedding_cache', {}),
+                        'skipped': result.get('skipped', []),
+                        'aliases': result.get('aliases', []),
+                        'replaced': result.get('replaced', []),
+                        'resumed': result.get('resumed', [])
                     }) + '\n'
-                    
-                    print(f"✅ 上传完成！共添加 {result['added_chunks']} 个 chunks\n")
-                    
-                except Exception as e:
-                    error_msg = f'处理文档失败: {str(e)}'
-                    print(f"❌ {error_msg}")
-                    import traceback
-                    traceback.print_exc()
-                    
+                    print(f"✅ 上传完成！共添加 {result.get('added_chunks', 0)} 个 chunks\n")
+                    return
+                
+                if job['status'] == JobQueue.FAILED:
+                    errors = job.get('errors') or [{'error': '未知错误'}]
                     yield json.dumps({
                         'type': 'error',
-                        'message': error_msg
+                        'message': f"处理文档失败: {errors[0].get('error')}",
+                        'job_id': job_id
                     }) + '\n'
-            
-            finally:
-                # ✅ 清理临时文件
-                print(f"\n🧹 清理临时文件...")
-                for temp_file in temp_files:
-                    try:
-                        Path(temp_file).unlink()
-                        print(f"  🗑️ 已删除: {Path(temp_file).name}")
-                    except Exception as e:
-                        print(f"  ⚠️ 删除失败: {e}")
+                    return
+                
+                # 任务进度 0-100 映射到 20-99
+                state = (job['stage'], job['progress'])
+                if state != last_state:
+                    last_state = state
+                    yield json.dumps({
+                        'type': 'progress',
+                        'stage': job['stage'],
+                        'progress': min(20 + int(job['progress'] * 0.79), 99),
+                        'message': f"处理中: {job['stage']}",
+                        'job_id': job_id,
+                        'chunks_done': job['chunks_done'],
+                        'chunks_per_second': job['chunks_per_second']
+                    }) + '\n'
+                time.sleep(0.5)
         
         return Response(generate(), mimetype='application/x-ndjson')
     
@@ -0,0 +1,287 @@
+# backend/chunk_store.py
+
+import json
+import mmap
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+class ChunkStore:
+    """
+    chunk 文本存储（SQLite，以 FAISS chunk id 为主键）
+
+    每行保存一个 chunk 的文本、来源文件、页码和其余元数据。检索时只按 id
+    读取 Top-k 候选，加载向量库时不读取任何文本，常驻内存与语料大小无关。
+
+    写入在一个未提交的事务中累积，由 commit() 与向量索引一起落盘；其他进程
+    （以及 read_only 打开的连接）只能看到已提交的数据。read_only 时通过
+    SQLite 的 mmap 读取，多个进程共享操作系统页缓存。
+
+    向量库按代（generation）发布快照，旧代的读者仍会按 id 读取文本，因此删除
+    只把行标记为从第 deleted_gen 代起不存在（墓碑），等不再有读者使用更早的代
+    之后再由 purge() 物理删除。除 get_many 外的查询只返回未删除的行。
+
+    使用标量量化索引（sq8 / sqfp16）时，每行还保存写入索引的 float32 原始向量，
+    检索时只读取候选的向量做精确重排，常驻内存中只有量化后的向量。
+    """
+
+    FILE = "chunks.sqlite"
+
+    # 早期版本的 chunk 库没有的列，打开时补充
+    _ADDED_COLUMNS = (('deleted_gen', 'INTEGER'), ('vector', 'BLOB'))
+
+    # SQLite 单条语句的参数个数有上限，批量操作时按此大小分组
+    _QUERY_BATCH = 500
+    # read_only 连接的 mmap 上限
+    _MMAP_SIZE = 1 << 40
+
+    def __init__(self, db_file: Path, read_only: bool = False):
+        self.db_file = Path(db_file)
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{self.db_file}?mode=ro", uri=True, check_same_thread=False)
+            self._conn.execute(f"PRAGMA mmap_size={self._MMAP_SIZE}")
+            if self._missing_columns():
+                # 由可写连接补充新列
+                ChunkStore(self.db_file).close()
+        else:
+            self.db_file.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id INTEGER PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    page INTEGER,
+                    content TEXT NOT NULL,
+                    metadata TEXT,
+                    deleted_gen INTEGER,
+                    vector BLOB
+                )
+                """
+            )
+            for name, column_type in self._missing_columns():
+                self._conn.execute(f"ALTER TABLE chunks ADD COLUMN {name} {column_type}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks (source)")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_chunks_deleted ON chunks (deleted_gen) WHERE deleted_gen IS NOT NULL"
+            )
+            self._conn.commit()
+
+    def _missing_columns(self) -> List[Tuple[str, str]]:
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")]
+        if not columns:
+            return []
+        return [(name, column_type) for name, column_type in self._ADDED_COLUMNS if name not in columns]
+
+    @staticmethod
+    def _row(doc: Document, chunk_id: int, vector: Optional[np.ndarray] = None) -> Tuple:
+        metadata = {k: v for k, v in doc.metadata.items() if k != 'source'}
+        page = metadata.get('page')
+        return (
+            int(chunk_id),
+            doc.metadata.get('source', 'Unknown'),
+            page if isinstance(page, int) else None,
+            doc.page_content,
+            json.dumps(metadata, ensure_ascii=False),
+            np.asarray(vector, dtype=np.float32).tobytes() if vector is not None else None
+        )
+
+    @staticmethod
+    def _document(source: str, content: str, metadata: Optional[str]) -> Document:
+        return Document(page_content=content, metadata={**json.loads(metadata or '{}'), 'source': source})
+
+    def _batches(self, ids: Iterable[int]) -> Iterator[List[int]]:
+        ids = [int(chunk_id) for chunk_id in ids]
+        for i in range(0, len(ids), self._QUERY_BATCH):
+            yield ids[i:i + self._QUERY_BATCH]
+
+    def put_many(self, items: Iterable[Tuple[int, Document]], vectors: Optional[np.ndarray] = None):
+        """写入（或覆盖）chunk，提交前其他连接不可见；vectors 为与 items 对应的原始向量（可选）"""
+        items = list(items)
+        rows = [
+            self._row(doc, chunk_id, vectors[i] if vectors is not None else None)
+            for i, (chunk_id, doc) in enumerate(items)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, source, page, content, metadata, vector, deleted_gen) "
+                "VALUES (?, ?, ?, ?, ?, ?, NULL)",
+                rows
+            )
+
+    def set_vectors(self, ids: Iterable[int], matrix: np.ndarray):
+        """为已有的 chunk 保存原始向量（转换为量化索引时使用）"""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE chunks SET vector = ? WHERE id = ?",
+                ((row.tobytes(), int(chunk_id)) for chunk_id, row in zip(ids, matrix))
+            )
+
+    def drop_vectors(self):
+        """清除全部原始向量（索引不再需要精确重排时释放磁盘空间）"""
+        with self._lock:
+            self._conn.execute("UPDATE chunks SET vector = NULL WHERE vector IS NOT NULL")
+
+    def get_vectors(self, ids: Iterable[int]) -> Dict[int, np.ndarray]:
+        """按 id 读取原始向量，返回 {chunk_id: float32 向量}，没有保存向量的 id 不出现在结果中"""
+        found = {}
+        with self._lock:
+            for batch in self._batches(ids):
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT id, vector FROM chunks WHERE id IN ({placeholders}) AND vector IS NOT NULL", batch
+                ).fetchall()
+                for chunk_id, vector in rows:
+                    found[chunk_id] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def get_many(self, ids: Iterable[int]) -> Dict[int, Document]:
+        """按 id 批量读取，返回 {chunk_id: Document}，不存在的 id 不出现在结果中"""
+        found = {}
+        with self._lock:
+            for batch in self._batches(ids):
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT id, source, content, metadata FROM chunks WHERE id IN ({placeholders})", batch
+                ).fetchall()
+                for chunk_id, source, content, metadata in rows:
+                    found[chunk_id] = self._document(source, content, metadata)
+        return found
+
+    def get(self, chunk_id: int) -> Optional[Document]:
+        return self.get_many([chunk_id]).get(int(chunk_id))
+
+    def existing(self, ids: Iterable[int]) -> List[int]:
+        """返回 ids 中实际存在（未删除）的 id"""
+        found = []
+        with self._lock:
+            for batch in self._batches(ids):
+                placeholders = ','.join('?' * len(batch))
+                found.extend(row[0] for row in self._conn.execute(
+                    f"SELECT id FROM chunks WHERE id IN ({placeholders}) AND deleted_gen IS NULL", batch
+                ))
+        return found
+
+    def delete_many(self, ids: Iterable[int], generation: int):
+        """标记删除：第 generation 代及之后的快照中不再包含这些 chunk"""
+        with self._lock:
+            for batch in self._batches(ids):
+                placeholders = ','.join('?' * len(batch))
+                self._conn.execute(
+                    f"UPDATE chunks SET deleted_gen = ? WHERE id IN ({placeholders}) AND deleted_gen IS NULL",
+                    [generation, *batch]
+                )
+
+    def delete_before(self, chunk_id: int, generation: int):
+        """标记删除 id 小于 chunk_id 的全部 chunk"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE chunks SET deleted_gen = ? WHERE id < ? AND deleted_gen IS NULL",
+                (generation, int(chunk_id))
+            )
+
+    def clear(self, generation: int):
+        """标记删除全部 chunk"""
+        with self._lock:
+            self._conn.execute("UPDATE chunks SET deleted_gen = ? WHERE deleted_gen IS NULL", (generation,))
+
+    def purge(self, oldest_generation: Optional[int] = None):
+        """
+        物理删除不再被任何快照引用的 chunk
+
+        Args:
+            oldest_generation: 仍可能有读者的最早一代；为 None 时删除全部墓碑
+        """
+        with self._lock:
+            if oldest_generation is None:
+                self._conn.execute("DELETE FROM chunks WHERE deleted_gen IS NOT NULL")
+            else:
+                self._conn.execute("DELETE FROM chunks WHERE deleted_gen <= ?", (oldest_generation,))
+            self._conn.commit()
+
+    def restore_after(self, generation: int):
+        """撤销第 generation 代之后的墓碑（上次保存在发布快照前中断时遗留）"""
+        with self._lock:
+            self._conn.execute("UPDATE chunks SET deleted_gen = NULL WHERE deleted_gen > ?", (generation,))
+            self._conn.commit()
+
+    def max_id(self) -> int:
+        """已使用过的最大 chunk id（含已删除的），库为空时为 0"""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM chunks").fetchone()[0]
+
+    def ids(self) -> np.ndarray:
+        """全部未删除的 chunk id（升序）"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM chunks WHERE deleted_gen IS NULL ORDER BY id").fetchall()
+        return np.asarray([row[0] for row in rows], dtype=np.int64)
+
+    def ids_for_source(self, source: str) -> List[int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM chunks WHERE source = ? AND deleted_gen IS NULL ORDER BY id", (source,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def rename_source(self, source: str, new_source: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE chunks SET source = ? WHERE source = ? AND deleted_gen IS NULL", (new_source, source)
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks WHERE deleted_gen IS NULL").fetchone()[0]
+
+    def commit(self):
+        if self.read_only:
+            return
+        with self._lock:
+            self._conn.commit()
+
+    def rollback(self):
+        """撤销上次 commit 之后的全部写入"""
+        if self.read_only:
+            return
+        with self._lock:
+            self._conn.rollback()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class ChunkFileReader:
+    """
+    读取旧版 chunk 文本文件（chunks.dat + chunks.idx），仅用于迁移到 ChunkStore
+
+    chunks.dat 中每条记录是 UTF-8 编码的 JSON [content, metadata]；
+    chunks.idx 是按 chunk id 排序的 (id, offset, length) 定长数组。
+    """
+
+    INDEX_DTYPE = np.dtype([('id', '<i8'), ('offset', '<i8'), ('length', '<i8')])
+
+    def __init__(self, data_file: Path, index_file: Path):
+        self.data_file = Path(data_file)
+        self.index_file = Path(index_file)
+
+    def items(self) -> Iterator[Tuple[int, Document]]:
+        """按 id 顺序逐条读取（mmap，不把整个文件读入内存）"""
+        if not self.index_file.stat().st_size or not self.data_file.stat().st_size:
+            return
+        index = np.memmap(self.index_file, dtype=self.INDEX_DTYPE, mode='r')
+        with open(self.data_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for chunk_id, offset, length in index:
+                content, metadata = json.loads(data[int(offset):int(offset) + int(length)].decode('utf-8'))
+                yield int(chunk_id), Document(page_content=content, metadata=metadata)
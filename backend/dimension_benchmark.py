@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""对比不同向量维度（text-embedding-3 的 dimensions 参数）在本地文档上的检索质量与延迟
+
+用法:
+    python dimension_benchmark.py [--db knowledge_db] [--dims 256,512,1024,1536] [--k 10]
+                                  [--queries 100] [--queries-file queries.txt] [--truncate]
+
+行为:
+ - 加载并分割 knowledge_db/documents 中的文档（与知识库默认的分块参数一致）
+ - 按每个维度向量化全部 chunk 和查询；向量写入知识库的 embedding_cache.sqlite
+   （键与知识库相同），重复运行或之后按该维度重建知识库时不再调用 API。
+   --truncate 时只按最大维度调用 API，较小维度由截断前 d 维并重新归一化得到
+   （text-embedding-3 缩短维度的方式，与 API 返回的结果等价）
+ - 查询默认从 chunk 中随机抽取，取开头一段文字作为问题，该 chunk 视为正确答案；
+   也可用 --queries-file 指定真实问题（每行一个，此时只计算 recall）
+ - 以最大维度的精确检索 Top-k 为基准计算 recall@k；抽样查询另算命中率（正确 chunk
+   出现在 Top-k 中）和 MRR；并输出索引内存、单次检索的平均 / P95 延迟
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from document_loader import SUPPORTED_SUFFIXES, load_and_split_files, start_process_pool
+from embedding_cache import EmbeddingCache, cache_model_key
+from index_benchmark import _recall, _search_latency
+from vector_store import build_index, normalize_vectors
+
+HERE = Path(__file__).parent
+
+DEFAULT_DIMS = (256, 512, 1024, 1536)
+# 每次 Embeddings 请求的文本数
+EMBED_BATCH = 256
+
+
+def embed_with_cache(embeddings, cache: EmbeddingCache, model_key: str, texts: List[str]) -> np.ndarray:
+    """向量化文本（优先读取缓存，未命中的分批请求并写回缓存），返回归一化后的矩阵"""
+    hashes = [EmbeddingCache.text_hash(text) for text in texts]
+    found = cache.get_many(model_key, hashes)
+    text_by_hash = dict(zip(hashes, texts))
+    missing = [h for h in dict.fromkeys(hashes) if h not in found]
+    for i in range(0, len(missing), EMBED_BATCH):
+        batch = missing[i:i + EMBED_BATCH]
+        vectors = dict(zip(batch, embeddings.embed_documents([text_by_hash[h] for h in batch])))
+        cache.put_many(model_key, vectors)
+        found.update(vectors)
+        print(f"  {model_key}: 已向量化 {min(i + EMBED_BATCH, len(missing))}/{len(missing)} 个新文本")
+    return normalize_vectors(np.asarray([found[h] for h in hashes], dtype=np.float32))
+
+
+def benchmark(doc_vectors: Dict[int, np.ndarray], query_vectors: Dict[int, np.ndarray], k: int = 10,
+              answers: Optional[np.ndarray] = None) -> List[Dict]:
+    """
+    按维度比较检索结果
+
+    Args:
+        doc_vectors / query_vectors: 维度 -> 归一化后的 chunk / 查询向量
+        answers: 每个查询对应的正确 chunk 行号（抽样查询时），为 None 时不计算命中率和 MRR
+
+    Returns:
+        每个维度一行：recall（相对最大维度）、命中率、MRR、延迟、索引内存
+    """
+    dims = sorted(doc_vectors)
+    num_docs = len(doc_vectors[dims[0]])
+    ids = np.arange(num_docs, dtype=np.int64)
+    k = min(k, num_docs)
+
+    rows = []
+    truth = None
+    for dim in reversed(dims):
+        index, _, _ = build_index('flat', dim, ids, doc_vectors[dim], metric='cosine')
+        found, latencies = _search_latency(index, query_vectors[dim], k, None)
+        if truth is None:
+            truth = found
+        row = {
+            'dim': dim,
+            'recall': _recall(found, truth),
+            'latency_ms': float(latencies.mean()),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'memory_mb': num_docs * dim * 4 / 1024 / 1024
+        }
+        if answers is not None:
+            ranks = [np.flatnonzero(labels == answer) for labels, answer in zip(found, answers)]
+            row['hit_rate'] = float(np.mean([len(rank) > 0 for rank in ranks]))
+            row['mrr'] = float(np.mean([1 / (rank[0] + 1) if len(rank) else 0.0 for rank in ranks]))
+        rows.append(row)
+    return sorted(rows, key=lambda row: row['dim'])
+
+
+def print_report(rows: List[Dict], k: int):
+    full = max(rows, key=lambda row: row['dim'])
+    print(f"\n{'维度':<8}{f'recall@{k}':>12}{f'命中@{k}':>10}{'MRR':>8}{'平均(ms)':>10}{'P95(ms)':>10}"
+          f"{'内存(MB)':>10}{'内存比':>8}")
+    for row in rows:
+        hit = f"{row['hit_rate']:.3f}" if 'hit_rate' in row else '-'
+        mrr = f"{row['mrr']:.3f}" if 'mrr' in row else '-'
+        print(f"{row['dim']:<8}{row['recall']:>12.3f}{hit:>10}{mrr:>8}{row['latency_ms']:>10.3f}"
+              f"{row['p95_ms']:>10.3f}{row['memory_mb']:>10.1f}{row['memory_mb'] / full['memory_mb']:>8.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='向量维度检索质量 / 延迟对比')
+    parser.add_argument('--db', default=str(HERE / 'knowledge_db'), help='知识库目录')
+    parser.add_argument('--dims', default=','.join(map(str, DEFAULT_DIMS)), help='参与对比的维度')
+    parser.add_argument('--model', default='text-embedding-3-small', help='Embedding 模型')
+    parser.add_argument('--k', type=int, default=10, help='Top-k')
+    parser.add_argument('--queries', type=int, default=100, help='抽样查询数（未指定 --queries-file 时）')
+    parser.add_argument('--queries-file', default=None, help='查询文件，每行一个问题')
+    parser.add_argument('--query-chars', type=int, default=200, help='抽样查询取 chunk 开头的字符数')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='分块大小')
+    parser.add_argument('--chunk-overlap', type=int, default=200, help='分块重叠')
+    parser.add_argument('--truncate', action='store_true', help='只按最大维度调用 API，较小维度截断得到')
+    args = parser.parse_args()
+
+    load_dotenv()
+    if not os.getenv('OPENAI_API_KEY'):
+        print('OPENAI_API_KEY 未设置')
+        sys.exit(1)
+    from langchain_openai import OpenAIEmbeddings
+
+    documents_dir = Path(args.db) / 'documents'
+    paths = sorted(str(p) for p in documents_dir.glob('*') if p.suffix.lower() in SUPPORTED_SUFFIXES)
+    if not paths:
+        print('documents not found at', documents_dir)
+        sys.exit(1)
+    texts = []
+    start_process_pool(os.cpu_count() or 1)
+    for path, records, _, error in load_and_split_files(paths, args.chunk_size, args.chunk_overlap,
+                                                        max_workers=os.cpu_count() or 1):
+        if error:
+            print(f"  ⚠️ 加载失败: {path} -> {error}")
+            continue
+        texts.extend(text for text, _ in records)
+    print(f"已加载 {len(paths)} 个文件，{len(texts)} 个 chunks")
+    if len(texts) < 2:
+        print('chunk 太少，无法对比')
+        sys.exit(1)
+
+    answers = None
+    if args.queries_file:
+        with open(args.queries_file, 'r', encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        rng = np.random.default_rng(0)
+        answers = rng.choice(len(texts), min(args.queries, len(texts)), replace=False)
+        queries = [texts[row][:args.query_chars] for row in answers]
+
+    dims = sorted(int(d) for d in args.dims.split(',') if d.strip())
+    cache = EmbeddingCache(Path(args.db) / 'embedding_cache.sqlite')
+    doc_vectors, query_vectors = {}, {}
+    for dim in (dims[-1:] if args.truncate else dims):
+        embeddings = OpenAIEmbeddings(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            model=args.model,
+            base_url=os.getenv('OPENAI_BASE_URL'),
+            dimensions=dim
+        )
+        model_key = cache_model_key(args.model, dim)
+        doc_vectors[dim] = embed_with_cache(embeddings, cache, model_key, texts)
+        query_vectors[dim] = embed_with_cache(embeddings, cache, model_key, queries)
+    if args.truncate:
+        full = dims[-1]
+        for dim in dims[:-1]:
+            doc_vectors[dim] = normalize_vectors(doc_vectors[full][:, :dim])
+            query_vectors[dim] = normalize_vectors(query_vectors[full][:, :dim])
+    cache.close()
+
+    rows = benchmark(doc_vectors, query_vectors, k=args.k, answers=answers)
+    print_report(rows, min(args.k, len(texts)))
+
+
+if __name__ == '__main__':
+    main()
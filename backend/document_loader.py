@@ -0,0 +1,227 @@
+# backend/document_loader.py
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from langchain_community.document_loaders import PDFPlumberLoader, TextLoader
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+
+SUPPORTED_SUFFIXES = ('.pdf', '.txt', '.md')
+
+# chunk 记录：(文本, 元数据)，可以在进程间传递（pickle）
+ChunkRecord = Tuple[str, Dict]
+
+
+def clean_filename(filename: str) -> str:
+    """清理文件名前缀（去掉如 '0_' 或 '123_' 的前缀）"""
+    if '_' in filename:
+        parts = filename.split('_', 1)
+        if len(parts) == 2 and parts[0].isdigit():
+            return parts[1]
+    return filename
+
+
+def load_file(file_path: Path) -> tuple:
+    """加载单个文件，返回 (Document 列表, 错误)"""
+    try:
+        if file_path.suffix.lower() == '.pdf':
+            loader = PDFPlumberLoader(str(file_path))
+            docs = loader.load()
+        elif file_path.suffix.lower() in ['.txt', '.md']:
+            loader = TextLoader(str(file_path), encoding='utf-8')
+            docs = loader.load()
+        else:
+            return [], {'file': str(file_path), 'error': f'不支持的格式: {file_path.suffix}'}
+
+        for doc in docs:
+            doc.metadata['source'] = clean_filename(file_path.name)
+
+        print(f"  ✅ {file_path.name}: {len(docs)} 个文档")
+        return docs, None
+
+    except Exception as e:
+        print(f"  ❌ {file_path.name}: {e}")
+        return [], {'file': str(file_path), 'error': str(e)}
+
+
+def iter_pdf_windows(file_path: Path, pages_per_window: int,
+                     start_page: int = 0) -> Iterator[Tuple[List[Document], int, int]]:
+    """
+    按页窗口流式读取 PDF
+
+    每次只解析 pages_per_window 页，解析完的页面立即释放缓存，
+    峰值内存与窗口大小相关，而与整个 PDF 的大小无关。
+    元数据与 PDFPlumberLoader 保持一致。start_page 之前的页不解析
+    （从检查点恢复时使用）。
+
+    Yields:
+        (本窗口的 Document 列表, 已读取的页数, 总页数)
+    """
+    import pdfplumber
+
+    source = clean_filename(file_path.name)
+    with pdfplumber.open(str(file_path)) as pdf:
+        total_pages = len(pdf.pages)
+        extra = {k: v for k, v in pdf.metadata.items() if type(v) in [str, int]}
+        for start in range(start_page, total_pages, pages_per_window):
+            end = min(start + pages_per_window, total_pages)
+            docs = []
+            for page_no in range(start, end):
+                page = pdf.pages[page_no]
+                docs.append(Document(
+                    page_content=page.extract_text() or '',
+                    metadata={
+                        **extra,
+                        'source': source,
+                        'file_path': str(file_path),
+                        'page': page_no,
+                        'total_pages': total_pages
+                    }
+                ))
+                # 释放页面解析缓存
+                if hasattr(page, 'close'):
+                    page.close()
+                else:
+                    page.flush_cache()
+            yield docs, end, total_pages
+
+
+def load_and_split_file(file_path: str, chunk_size: int, chunk_overlap: int) -> Tuple[List[ChunkRecord], int, Optional[Dict]]:
+    """
+    加载并分割单个文件（可在子进程中执行）
+
+    Returns:
+        (chunk 记录列表, 加载得到的文档/页数, 错误)
+    """
+    try:
+        docs, error = load_file(Path(file_path))
+        if error:
+            return [], 0, error
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
+        )
+        records = [(doc.page_content, doc.metadata) for doc in splitter.split_documents(docs)]
+        return records, len(docs), None
+    except Exception as e:
+        return [], 0, {'file': str(file_path), 'error': str(e)}
+
+
+# 加载文档的进程池：启动阶段 fork 一次，之后各次导入复用
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def start_process_pool(max_workers: int) -> bool:
+    """
+    创建加载文档的进程池，须在启动阶段、本进程创建任何线程之前调用
+
+    只使用 fork：spawn/forkserver 会在子进程中重新导入主模块（app.py），从而重复初始化
+    知识库。运行期间不再 fork（任务队列、重排序合批等线程可能正持有锁，fork 出的子进程
+    会继承这些锁而死锁），因此进程池只在这里创建一次；进程池不可用时
+    load_and_split_files 回退到进程内加载。
+
+    Returns:
+        进程池是否可用
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            return True
+        if max_workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            return False
+        if threading.active_count() > 1:
+            print(f"⚠️ 已有 {threading.active_count() - 1} 个后台线程，不再 fork 进程池，文档在进程内加载")
+            return False
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('fork'))
+        # fork 方式下第一次提交时一次性创建全部子进程（在进程池的管理线程启动之前）
+        executor.submit(int).result()
+        _pool, _pool_workers = executor, max_workers
+        print(f"  ⚙️ 已创建 {max_workers} 个进程的文档加载进程池")
+        return True
+
+
+def _discard_pool(executor: ProcessPoolExecutor):
+    """子进程异常退出后进程池不可再用：丢弃，之后在进程内加载"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is executor:
+            _pool, _pool_workers = None, 0
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def load_and_split_files(file_paths: List[str],
+                         chunk_size: int,
+                         chunk_overlap: int,
+                         max_workers: int = 1,
+                         min_parallel_files: int = 4,
+                         on_file_done=None) -> List[Tuple[str, List[ChunkRecord], int, Optional[Dict]]]:
+    """
+    批量加载并分割文件
+
+    文件数达到 min_parallel_files、max_workers > 1 且已调用 start_process_pool 时使用
+    进程池并行处理，否则在当前进程内依次处理。返回结果与输入顺序一致。
+
+    Args:
+        file_paths: 文件路径列表
+        chunk_size: 文本块大小
+        chunk_overlap: 文本块重叠
+        max_workers: 大于 1 时允许使用进程池（进程数在 start_process_pool 时确定）
+        min_parallel_files: 启用进程池的最小文件数
+        on_file_done: 每处理完一个文件时回调，参数为已完成的文件数
+
+    Returns:
+        [(文件路径, chunk 记录列表, 文档/页数, 错误), ...]
+    """
+    results = [None] * len(file_paths)
+    executor = _pool
+    use_pool = max_workers > 1 and len(file_paths) >= min_parallel_files and executor is not None
+
+    if use_pool:
+        print(f"  ⚙️ 使用 {min(_pool_workers, len(file_paths))} 个进程并行加载 {len(file_paths)} 个文件")
+        try:
+            futures = {
+                executor.submit(load_and_split_file, file_path, chunk_size, chunk_overlap): idx
+                for idx, file_path in enumerate(file_paths)
+            }
+        except (BrokenProcessPool, RuntimeError) as e:
+            print(f"  ⚠️ 进程池不可用，改为进程内加载: {e}")
+            _discard_pool(executor)
+            use_pool = False
+
+    if not use_pool:
+        for idx, file_path in enumerate(file_paths):
+            records, doc_count, error = load_and_split_file(file_path, chunk_size, chunk_overlap)
+            results[idx] = (file_path, records, doc_count, error)
+            if on_file_done:
+                on_file_done(idx + 1)
+        return results
+
+    done = 0
+    broken = False
+    for future in as_completed(futures):
+        idx = futures[future]
+        file_path = file_paths[idx]
+        try:
+            records, doc_count, error = future.result()
+        except BrokenProcessPool:
+            # 子进程异常退出（如内存不足被杀）：进程池作废，剩余文件在进程内加载
+            broken = True
+            records, doc_count, error = load_and_split_file(file_path, chunk_size, chunk_overlap)
+        except Exception as e:
+            records, doc_count, error = [], 0, {'file': str(file_path), 'error': str(e)}
+        results[idx] = (file_path, records, doc_count, error)
+        done += 1
+        if on_file_done:
+            on_file_done(done)
+    if broken:
+        print(f"  ⚠️ 加载进程异常退出，进程池已停用，之后在进程内加载")
+        _discard_pool(executor)
+    return results
@@ -0,0 +1,139 @@
+# backend/embedding_cache.py
+
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+# 各 Embedding 模型的原生维度（支持 dimensions 参数缩短）
+NATIVE_DIMENSIONS = {
+    'text-embedding-3-small': 1536,
+    'text-embedding-3-large': 3072,
+}
+
+
+def cache_model_key(model: str, dimensions: Optional[int] = None) -> str:
+    """
+    缓存键中的模型部分：缩短维度的向量与原生维度的向量分开缓存
+
+    原生维度（或未指定）时为模型名本身，与早期版本写入的缓存兼容。
+    """
+    if not dimensions or dimensions == NATIVE_DIMENSIONS.get(model):
+        return model
+    return f"{model}@{dimensions}"
+
+
+class EmbeddingCache:
+    """
+    磁盘向量缓存（内容寻址）
+
+    以 (Embedding 模型, chunk 文本 SHA-256) 为键，将 float32 向量以 BLOB
+    形式存入 SQLite（模型部分见 cache_model_key，不同维度互不混用）。文本未变化的
+    chunk 在重建或重新上传时直接命中缓存，不再调用 Embeddings API。
+    """
+
+    # SQLite 单条语句的参数个数有上限，批量查询时按此大小分组
+    _QUERY_BATCH = 500
+
+    def __init__(self, db_file: Path):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = None
+
+        # 累计命中统计（进程生命周期内）
+        self.hits = 0
+        self.misses = 0
+
+        self._connect()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        """计算 chunk 文本的内容哈希"""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """批量查询缓存，返回 {text_hash: 向量}，未命中的键不出现在结果中"""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            for i in range(0, len(unique), self._QUERY_BATCH):
+                batch = unique[i:i + self._QUERY_BATCH]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]):
+        """批量写入缓存 {text_hash: 向量}"""
+        if not items:
+            return
+        rows = []
+        for text_hash, vector in items.items():
+            arr = np.asarray(vector, dtype=np.float32)
+            rows.append((model, text_hash, int(arr.shape[0]), arr.tobytes()))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector) "
+                "VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def record(self, hits: int, misses: int):
+        """累加命中统计"""
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self, model: Optional[str] = None) -> Dict:
+        """返回缓存条目数和累计命中统计"""
+        with self._lock:
+            if model:
+                entries = self._conn.execute(
+                    "SELECT COUNT(*) FROM embeddings WHERE model = ?", (model,)
+                ).fetchone()[0]
+            else:
+                entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return {
+                'entries': entries,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def reopen(self):
+        """关闭后重新连接（例如知识库目录被清空后）"""
+        self.close()
+        with self._lock:
+            self._connect()
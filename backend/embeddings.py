@@ -2,6 +2,15 @@
 from typing import List
 from abc import ABC, abstractmethod
 from backend.config import EmbeddingConfig
+from backend.adaptive_batcher import AdaptiveBatcher
+
+
+class EmbeddingAPIError(Exception):
+    """服务商返回了非 200 状态码（带 status_code，供 AdaptiveBatcher 判断是否重试）"""
+
+    def __init__(self, status_code: int, message: str = ""):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
 
 
 class BaseEmbedding(ABC):
@@ -9,10 +18,16 @@ class BaseEmbedding(ABC):
 
     def __init__(self, config: EmbeddingConfig):
         self.config = config
+        # config.batch_size 作为初始批大小，之后按响应耗时和 429/5xx 自适应调整
+        self.batcher = AdaptiveBatcher(initial_batch_size=config.batch_size)
 
-    @abstractmethod
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """嵌入文档列表"""
+        """嵌入文档列表（自适应分批，失败的批次退避重试）"""
+        return self.batcher.run(texts, self._embed_batch)
+
+    @abstractmethod
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """嵌入一批文档，失败时抛出异常"""
         pass
 
     @abstractmethod
@@ -33,17 +48,13 @@ class OpenAIEmbedding(BaseEmbedding):
             base_url=config.api_base,
         )
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """批量嵌入文档"""
-        embeddings = []
-        for i in range(0, len(texts), self.config.batch_size):
-            batch = texts[i : i + self.config.batch_size]
-            response = self.client.embeddings.create(
-                model=self.config.model,
-                input=batch,
-            )
-            embeddings.extend([item.embedding for item in response.data])
-        return embeddings
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """嵌入一批文档"""
+        response = self.client.embeddings.create(
+            model=self.config.model,
+            input=texts,
+        )
+        return [item.embedding for item in response.data]
 
     def embed_query(self, text: str) -> List[float]:
         """嵌入单个查询"""
@@ -63,20 +74,17 @@ class ZhipuEmbedding(BaseEmbedding):
 
         zhipuai.api_key = config.api_key
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """批量嵌入文档"""
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """嵌入一批文档"""
         import zhipuai
 
-        embeddings = []
-        for i in range(0, len(texts), self.config.batch_size):
-            batch = texts[i : i + self.config.batch_size]
-            response = zhipuai.model_api.embedding(
-                model=self.config.model,
-                texts=batch,
-            )
-            if response["code"] == 200:
-                embeddings.extend([item["embedding"] for item in response["data"]])
-        return embeddings
+        response = zhipuai.model_api.embedding(
+            model=self.config.model,
+            texts=texts,
+        )
+        if response["code"] != 200:
+            raise EmbeddingAPIError(response["code"], response.get("msg", ""))
+        return [item["embedding"] for item in response["data"]]
 
     def embed_query(self, text: str) -> List[float]:
         """嵌入单个查询"""
@@ -100,21 +108,16 @@ class QwenEmbedding(BaseEmbedding):
 
         self.client = TextEmbedding
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """批量嵌入文档"""
-        embeddings = []
-        for i in range(0, len(texts), self.config.batch_size):
-            batch = texts[i : i + self.config.batch_size]
-            response = self.client.call(
-                model=self.config.model,
-                input=batch,
-                api_key=self.config.api_key,
-            )
-            if response.status_code == 200:
-                embeddings.extend(
-                    [item["embedding"] for item in response.output["embeddings"]]
-                )
-        return embeddings
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """嵌入一批文档"""
+        response = self.client.call(
+            model=self.config.model,
+            input=texts,
+            api_key=self.config.api_key,
+        )
+        if response.status_code != 200:
+            raise EmbeddingAPIError(response.status_code, getattr(response, "message", ""))
+        return [item["embedding"] for item in response.output["embeddings"]]
 
     def embed_query(self, text: str) -> List[float]:
         """嵌入单个查询"""
@@ -138,12 +141,20 @@ class OllamaEmbedding(BaseEmbedding):
         self.base_url = config.api_base or "http://localhost:11434"
         self.requests = requests
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """批量嵌入文档"""
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """嵌入一批文档（Ollama 接口每次只接受一个文本）"""
         embeddings = []
         for text in texts:
-            embedding = self.embed_query(text)
-            embeddings.append(embedding)
+            response = self.requests.post(
+                f"{self.base_url}/api/embeddings",
+                json={
+                    "model": self.config.model,
+                    "prompt": text,
+                },
+            )
+            if response.status_code != 200:
+                raise EmbeddingAPIError(response.status_code, response.text)
+            embeddings.append(response.json()["embedding"])
         return embeddings
 
     def embed_query(self, text: str) -> List[float]:
@@ -1,26 +1,30 @@
 #!/usr/bin/env python3
-"""修复 metadata.json 中每个文件的 chunks 字段
+"""迁移 metadata.json 到元数据库（metadata.sqlite），并修复每个文件的 chunks 字段
 
 用法:
     python fix_metadata_chunks.py
 
 行为:
- - 备份原始 metadata.json 到 metadata.json.bak.<ts>
- - 对每个条目:
-     * 如果存在 chunks_detail，则使用其长度作为 chunks
+ - 元数据库为空且存在旧版 metadata.json 时：备份到 metadata.json.bak.<ts>，
+   导入元数据库（原文件改名为 metadata.json.migrated）
+ - 对每个文件:
+     * 如果存在分块预览，则使用其数量作为 chunks
      * 否则尝试根据记录的 path 或在 uploads/ 与 knowledge_db/documents/ 中查找文件
        并对文本内容进行分割计数（优先使用 langchain 的 RecursiveCharacterTextSplitter，如果不可用则按字符长度估算）
- - 将更新写回 metadata.json
+ - 逐行写回元数据库
 """
-import json
 import shutil
 import time
 from pathlib import Path
 import os
 import sys
 
+from metadata_store import MetadataStore
+
 HERE = Path(__file__).parent
-METADATA_PATH = HERE / 'knowledge_db' / 'metadata.json'
+DB_PATH = HERE / 'knowledge_db'
+# 旧版元数据文件
+METADATA_PATH = DB_PATH / 'metadata.json'
 
 def backup(path: Path):
     ts = int(time.time())
@@ -77,24 +81,28 @@ def find_candidate_path(filename: str):
     return candidates[0] if candidates else None
 
 def main():
-    if not METADATA_PATH.exists():
-        print('metadata.json not found at', METADATA_PATH)
+    store = MetadataStore(DB_PATH / MetadataStore.FILE)
+    if METADATA_PATH.exists() and not len(store):
+        bak = backup(METADATA_PATH)
+        print('Backup saved to', bak)
+        store.migrate_json(METADATA_PATH)
+
+    if not len(store):
+        print('no metadata found in', DB_PATH)
         sys.exit(1)
 
-    data = json.loads(METADATA_PATH.read_text(encoding='utf-8'))
-    bak = backup(METADATA_PATH)
-    print('Backup saved to', bak)
-
     updated = {}
-    stats_before = {k: v.get('chunks') for k, v in data.items()}
+    stats_before = {}
 
-    for name, meta in data.items():
+    for name, meta in store.items():
         print(f'Processing {name}...')
+        stats_before[name] = meta.get('chunks')
         chunks = None
-        chunks_detail = meta.get('chunks_detail')
+        chunks_detail = store.get_chunk_previews(name)
         if chunks_detail:
             chunks = len(chunks_detail)
             print(f'  using chunks_detail length {chunks}')
+            store.update(name, chunks=chunks)
         else:
             # try metadata path
             p = meta.get('path')
@@ -108,20 +116,20 @@ def main():
                 cnt, cdetail = try_load_and_split(candidate)
                 chunks = cnt
                 if cdetail:
-                    meta['chunks_detail'] = [{'id': i, 'content': cdetail[i][:2000]} for i in range(len(cdetail))]
+                    store.set_chunk_previews(name, [c[:2000] for c in cdetail])
                     print(f'  generated chunks_detail with {chunks} chunks')
                 else:
+                    store.update(name, chunks=chunks)
                     print(f'  estimated chunks: {chunks} (no preview)')
             else:
                 # fallback: use existing chunks or 1
                 chunks = meta.get('chunks') or 1
+                store.update(name, chunks=chunks)
                 print(f'  file not found, fallback chunks={chunks}')
 
-        meta['chunks'] = chunks
         updated[name] = chunks
 
-    # write back
-    METADATA_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding='utf-8')
+    store.close()
     print('\nSummary:')
     for k, v in updated.items():
         print(f'  {k}: chunks={v} (before={stats_before.get(k)})')
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""对比不同 FAISS 索引类型在本地知识库数据上的召回率与延迟
+
+用法:
+    python index_benchmark.py [--db knowledge_db] [--k 10] [--queries 200] [--types flat,ivf,hnsw,ivfpq,sq8,sqfp16]
+
+行为:
+ - 从 knowledge_db/vector_store 读取已存储的向量（不调用 Embeddings API）
+ - 随机留出 --queries 个 chunk 向量作为查询（近似真实问题），其余向量作为库
+ - 以 flat 精确检索的 Top-k 为基准，对每种索引和不同的 nprobe / ef_search
+   计算 recall@k、单次查询的平均 / P95 延迟，并输出构建耗时和索引大小
+ - sq8 / sqfp16 分别测试不重排和 rescore_factor 倍候选的 float32 精确重排，
+   并给出相对 flat（全精度）节省的内存比例
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+
+from vector_store import (
+    INDEX_TYPES, RESCORED_INDEX_TYPES, FaissVectorStore, build_index, exact_scores, search_parameters
+)
+
+HERE = Path(__file__).parent
+
+# 每种索引扫描的检索参数
+NPROBE_SWEEP = (1, 4, 16, 64)
+EF_SEARCH_SWEEP = (16, 32, 64, 128, 256)
+# 量化索引的重排倍数（0 表示只用量化向量的得分）
+RESCORE_SWEEP = (0, 2, 4, 8)
+
+
+def _search_latency(index, queries: np.ndarray, k: int, params, rescore=None, rescore_factor: int = 0) -> tuple:
+    """
+    逐条检索（与线上单次请求一致），返回 (结果 id, 每次耗时毫秒)
+
+    rescore_factor > 0 时先取 k * rescore_factor 个候选，再由 rescore(query, 候选 id) 精确重排，
+    重排耗时计入延迟。
+    """
+    labels = np.empty((len(queries), k), dtype=np.int64)
+    latencies = []
+    fetch = min(k * rescore_factor, index.ntotal) if rescore_factor else k
+    for row, query in enumerate(queries):
+        started = time.perf_counter()
+        _, found = index.search(query.reshape(1, -1), fetch, params=params)
+        found = found[0]
+        if rescore_factor:
+            found = rescore(query, found[found != -1])
+        latencies.append((time.perf_counter() - started) * 1000)
+        labels[row] = found[:k]
+    return labels, np.asarray(latencies)
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def benchmark(ids: np.ndarray, matrix: np.ndarray, k: int = 10, num_queries: int = 200,
+              index_types=INDEX_TYPES, params: Optional[Dict] = None,
+              train_sample_size: int = 100_000, metric: str = 'l2') -> List[Dict]:
+    """
+    在给定向量上比较各索引类型（metric 为 cosine 时向量须已归一化）
+
+    Returns:
+        每个 (索引类型, 检索参数) 一行：recall、延迟、构建耗时、索引大小、相对 flat 节省的内存
+    """
+    rng = np.random.default_rng(0)
+    num_queries = min(num_queries, len(ids) // 2)
+    query_rows = rng.choice(len(ids), num_queries, replace=False)
+    base_mask = np.ones(len(ids), dtype=bool)
+    base_mask[query_rows] = False
+    queries = matrix[query_rows]
+    base_ids, base_matrix = ids[base_mask], matrix[base_mask]
+    k = min(k, len(base_ids))
+    # 重排时按 chunk id 取 float32 原始向量（ids 升序，掩码后仍有序）
+    def rescore(query, found):
+        scores = exact_scores(query, base_matrix[np.searchsorted(base_ids, found)], metric)
+        order = np.argsort(-scores if metric == 'cosine' else scores, kind='stable')
+        return found[order]
+
+    rows = []
+    truth = None
+    flat_size_mb = None
+    for index_type in ['flat'] + [t for t in index_types if t != 'flat']:
+        started = time.perf_counter()
+        index, actual_type, used = build_index(index_type, matrix.shape[1], base_ids, base_matrix,
+                                               params, train_sample_size, metric=metric)
+        build_seconds = time.perf_counter() - started
+        if actual_type != index_type:
+            continue
+        size_mb = len(faiss.serialize_index(index)) / 1024 / 1024
+        if index_type == 'flat':
+            flat_size_mb = size_mb
+
+        if index_type in ('ivf', 'ivfpq'):
+            sweep = [{'nprobe': n} for n in NPROBE_SWEEP if n <= used['nlist']]
+        elif index_type == 'hnsw':
+            sweep = [{'ef_search': ef} for ef in EF_SEARCH_SWEEP]
+        elif index_type in RESCORED_INDEX_TYPES:
+            sweep = [{'rescore_factor': factor} for factor in RESCORE_SWEEP]
+        else:
+            sweep = [{}]
+
+        for search in sweep:
+            found, latencies = _search_latency(index, queries, k, search_parameters(index_type, search),
+                                               rescore, search.get('rescore_factor', 0))
+            if truth is None:
+                truth = found
+            rows.append({
+                'index_type': index_type,
+                'search_params': search,
+                'recall': _recall(found, truth),
+                'latency_ms': float(latencies.mean()),
+                'p95_ms': float(np.percentile(latencies, 95)),
+                'build_seconds': build_seconds,
+                'size_mb': size_mb,
+                'memory_saved': 1 - size_mb / flat_size_mb if flat_size_mb else 0.0
+            })
+    return rows
+
+
+def print_report(rows: List[Dict], k: int):
+    print(f"\n{'索引':<8}{'检索参数':<20}{f'recall@{k}':>10}{'平均(ms)':>10}{'P95(ms)':>10}"
+          f"{'构建(s)':>10}{'大小(MB)':>10}{'节省内存':>10}")
+    for row in rows:
+        search = ', '.join(f"{key}={value}" for key, value in row['search_params'].items()) or '-'
+        print(f"{row['index_type']:<8}{search:<20}{row['recall']:>10.3f}{row['latency_ms']:>10.3f}"
+              f"{row['p95_ms']:>10.3f}{row['build_seconds']:>10.2f}{row['size_mb']:>10.1f}"
+              f"{row['memory_saved']:>10.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FAISS 索引召回率 / 延迟对比')
+    parser.add_argument('--db', default=str(HERE / 'knowledge_db'), help='知识库目录')
+    parser.add_argument('--k', type=int, default=10, help='Top-k')
+    parser.add_argument('--queries', type=int, default=200, help='留出作为查询的向量数')
+    parser.add_argument('--types', default=','.join(INDEX_TYPES), help='参与对比的索引类型')
+    parser.add_argument('--nlist', type=int, default=None, help='IVF 聚类数（默认自动）')
+    args = parser.parse_args()
+
+    store_path = Path(args.db) / 'vector_store'
+    if not FaissVectorStore.exists(store_path):
+        print('vector_store not found at', store_path)
+        sys.exit(1)
+
+    store = FaissVectorStore.load(store_path)
+    if store.index_type == 'ivfpq':
+        print('⚠️ 当前索引为 ivfpq，取回的是量化后的近似向量，建议在 flat 索引上运行')
+    ids, matrix = store.export_vectors()
+    print(f"已加载 {len(ids)} 个向量（维度 {store.dim}）")
+    if len(ids) < 2:
+        print('向量数太少，无法对比')
+        sys.exit(1)
+
+    rows = benchmark(ids, matrix, k=args.k, num_queries=args.queries,
+                     index_types=[t.strip() for t in args.types.split(',') if t.strip()],
+                     params={'nlist': args.nlist}, metric=store.metric)
+    print_report(rows, args.k)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# backend/ingest_checkpoint.py
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class IngestCheckpoint:
+    """
+    向量化检查点
+
+    记录每个正在导入的文件已经写入索引的 chunk id（按文件内顺序排列，
+    即已完成的游标），与向量库一起定期落盘。导入中途失败后，再次导入
+    内容相同的文件时跳过已完成的 chunk，从断点继续，不再重复调用
+    Embeddings API。
+
+    每个条目（以清理后的文件名为键）：
+        hash: 文件内容哈希，内容变化后检查点失效
+        chunk_ids: 已写入索引的 chunk id
+        old_ids: 开始导入前该文件名下已有的向量（替换旧版本时，全部完成后才删除）
+        其余字段（total_chunks / pages_done 等）由调用方写入，用于校验和恢复
+    """
+
+    def __init__(self, checkpoint_file: Path):
+        self.checkpoint_file = Path(checkpoint_file)
+        self.entries: Dict[str, Dict] = self._load()
+
+    def _load(self) -> Dict:
+        if self.checkpoint_file.exists():
+            try:
+                with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"⚠️ 读取向量化检查点失败: {e}")
+        return {}
+
+    def get(self, file_name: str) -> Optional[Dict]:
+        return self.entries.get(file_name)
+
+    def begin(self, file_name: str, file_hash: str, old_ids: List[int], **fields) -> Dict:
+        """为文件新建检查点（覆盖该文件名下已有的检查点）"""
+        entry = {
+            'hash': file_hash,
+            'chunk_ids': [],
+            'old_ids': [int(chunk_id) for chunk_id in old_ids],
+            'started_time': datetime.now().isoformat(),
+            **fields
+        }
+        self.entries[file_name] = entry
+        return entry
+
+    def advance(self, file_name: str, chunk_ids: List[int], **fields):
+        """记录新完成的 chunk（只更新内存，调用 save 后才落盘）"""
+        entry = self.entries[file_name]
+        entry['chunk_ids'].extend(int(chunk_id) for chunk_id in chunk_ids)
+        entry.update(fields)
+        entry['updated_time'] = datetime.now().isoformat()
+
+    def finish(self, file_name: str):
+        """文件导入完成，移除其检查点"""
+        self.entries.pop(file_name, None)
+
+    def clear(self):
+        self.entries = {}
+        self.save()
+
+    def save(self):
+        """原子地写入检查点文件（先写临时文件再替换）"""
+        if not self.entries:
+            if self.checkpoint_file.exists():
+                self.checkpoint_file.unlink()
+            return
+        self.checkpoint_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.checkpoint_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_file, self.checkpoint_file)
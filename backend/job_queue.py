@@ -0,0 +1,246 @@
+# backend/job_queue.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+
+class JobQueue:
+    """
+    进程内后台任务队列
+
+    任务记录保存在 SQLite 中，由一个后台工作线程按提交顺序执行。
+    请求线程只负责提交任务并返回任务 id，客户端断开不会影响任务执行；
+    进程重启后，未完成的任务会重新排队并从头执行（上传任务依赖内容哈希去重和
+    向量缓存，已完成的部分不会重复付费）。
+
+    取任务使用带条件的 UPDATE 原子认领，多个进程共享同一个数据库时
+    同一任务也只会被执行一次。
+    """
+
+    # 任务状态
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    def __init__(self, db_file: Path, poll_interval: float = 1.0):
+        """
+        Args:
+            db_file: 任务数据库文件
+            poll_interval: 队列为空时检查新任务的间隔（秒）
+        """
+        self.db_file = Path(db_file)
+        self.poll_interval = poll_interval
+        self._handlers: Dict[str, Callable] = {}
+        self._wakeup = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # 每次操作使用独立连接：知识库被清空（目录被删除）后也能自动重建
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_file), timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT,
+                progress INTEGER DEFAULT 0,
+                chunks_done INTEGER DEFAULT 0,
+                chunks_per_second REAL,
+                payload TEXT,
+                result TEXT,
+                errors TEXT,
+                attempts INTEGER DEFAULT 0,
+                owner_pid INTEGER,
+                created_at TEXT,
+                started_at TEXT,
+                finished_at TEXT
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        return conn
+
+    @contextmanager
+    def _db(self):
+        conn = self._connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def register(self, job_type: str, handler: Callable):
+        """
+        注册任务处理函数
+
+        handler(payload, report) -> result 字典
+        report(stage, progress, chunks_done=None) 用于上报进度
+        """
+        self._handlers[job_type] = handler
+
+    def start(self):
+        """启动工作线程（重复调用无副作用）"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._recover()
+            self._thread = threading.Thread(target=self._run, name='job-queue-worker', daemon=True)
+            self._thread.start()
+            print(f"✅ 后台任务队列已启动: {self.db_file}")
+
+    def _recover(self):
+        """把上次异常退出时仍处于 running 状态的任务重新排队"""
+        with self._db() as conn:
+            rows = conn.execute(
+                "SELECT id, owner_pid FROM jobs WHERE status = ?", (self.RUNNING,)
+            ).fetchall()
+            for row in rows:
+                if row['owner_pid'] and row['owner_pid'] != os.getpid() and self._pid_alive(row['owner_pid']):
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET status = ?, stage = 'queued', owner_pid = NULL WHERE id = ?",
+                    (self.QUEUED, row['id'])
+                )
+                print(f"🔁 恢复未完成的任务: {row['id']}")
+
+    @staticmethod
+    def _pid_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+            return True
+        except OSError:
+            return False
+
+    def submit(self, job_type: str, payload: Dict) -> str:
+        """提交任务，返回任务 id"""
+        if job_type not in self._handlers:
+            raise ValueError(f"未注册的任务类型: {job_type}")
+        job_id = uuid.uuid4().hex
+        with self._db() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, type, status, stage, payload, errors, created_at) "
+                "VALUES (?, ?, ?, 'queued', ?, '[]', ?)",
+                (job_id, job_type, self.QUEUED, json.dumps(payload, ensure_ascii=False),
+                 datetime.now().isoformat())
+            )
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """查询任务记录"""
+        with self._db() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, limit: int = 20) -> List[Dict]:
+        """最近提交的任务"""
+        with self._db() as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row) -> Dict:
+        job = dict(row)
+        for key in ('payload', 'result', 'errors'):
+            job[key] = json.loads(job[key]) if job.get(key) else None
+        job['errors'] = job['errors'] or []
+        job.pop('owner_pid', None)
+        return job
+
+    def _claim_next(self) -> Optional[sqlite3.Row]:
+        """原子地认领最早排队的任务"""
+        with self._db() as conn:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (self.QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            claimed = conn.execute(
+                "UPDATE jobs SET status = ?, stage = 'starting', owner_pid = ?, "
+                "attempts = attempts + 1, started_at = ? WHERE id = ? AND status = ?",
+                (self.RUNNING, os.getpid(), datetime.now().isoformat(), row['id'], self.QUEUED)
+            ).rowcount
+            if not claimed:
+                return None
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone()
+
+    def _run(self):
+        while True:
+            try:
+                job = self._claim_next()
+            except Exception as e:
+                print(f"⚠️ 读取任务队列失败: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._execute(job)
+
+    def _update(self, job_id: str, **fields):
+        columns = ', '.join(f"{key} = ?" for key in fields)
+        with self._db() as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def _execute(self, job: sqlite3.Row):
+        job_id = job['id']
+        handler = self._handlers.get(job['type'])
+        payload = json.loads(job['payload']) if job['payload'] else {}
+        print(f"\n⚙️ 开始执行任务 {job_id} ({job['type']})")
+
+        # 吞吐量按任务开始以来的总耗时计算
+        started = time.perf_counter()
+
+        def report(stage: str, progress: int, chunks_done: Optional[int] = None):
+            fields = {'stage': stage, 'progress': int(progress)}
+            if chunks_done is not None:
+                fields['chunks_done'] = chunks_done
+                elapsed = time.perf_counter() - started
+                if elapsed > 0:
+                    fields['chunks_per_second'] = round(chunks_done / elapsed, 2)
+            try:
+                self._update(job_id, **fields)
+            except Exception as e:
+                print(f"⚠️ 更新任务进度失败: {e}")
+
+        try:
+            if handler is None:
+                raise ValueError(f"未注册的任务类型: {job['type']}")
+            result = handler(payload, report) or {}
+            errors = result.get('errors', [])
+            self._update(
+                job_id,
+                status=self.SUCCEEDED,
+                stage='done',
+                progress=100,
+                result=json.dumps(result, ensure_ascii=False, default=str),
+                errors=json.dumps(errors, ensure_ascii=False, default=str),
+                finished_at=datetime.now().isoformat()
+            )
+            print(f"✅ 任务完成 {job_id}")
+        except Exception as e:
+            traceback.print_exc()
+            self._update(
+                job_id,
+                status=self.FAILED,
+                stage='failed',
+                errors=json.dumps([{'error': str(e)}], ensure_ascii=False),
+                finished_at=datetime.now().isoformat()
+            )
+            print(f"❌ 任务失败 {job_id}: {e}")
@@ -1,11 +1,24 @@
 # backend/knowledge_base.py
 
+import functools
+import logging
 import os
-import json
 from typing import List, Dict, Optional, Tuple
 from pathlib import Path
 import hashlib
+import time
 from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from adaptive_batcher import AdaptiveBatcher
+from embedding_cache import NATIVE_DIMENSIONS, EmbeddingCache, cache_model_key
+from ingest_checkpoint import IngestCheckpoint
+from lexical_index import reciprocal_rank_fusion
+from metadata_store import MetadataStore
+from query_cache import QueryEmbeddingCache, RerankScoreCache, SearchResultCache
+from rerank_batcher import RerankBatcher
+from rw_lock import ReadWriteLock
+from stats_cache import StatsCache
 
 
 from dotenv import load_dotenv
@@ -27,16 +40,53 @@ os.environ['TRANSFORMERS_CACHE'] = str((models_cache_path / 'transformers').abso
 #
 
 try:
-    from langchain_community.document_loaders import PDFPlumberLoader, TextLoader
     from langchain_text_splitters import RecursiveCharacterTextSplitter  # ✅ 改这里
     from langchain_openai import OpenAIEmbeddings
     from langchain_community.vectorstores import FAISS
+    from vector_store import FaissVectorStore, INDEX_TYPES, METRICS
+    from langchain_core.documents import Document
+    from document_loader import (
+        SUPPORTED_SUFFIXES, clean_filename, load_file, load_and_split_files, iter_pdf_windows,
+        start_process_pool
+    )
     LANGCHAIN_AVAILABLE = True
 except ImportError as e:
     print(f"Warning: langchain components not fully installed: {e}")
     LANGCHAIN_AVAILABLE = False
 
 
+logger = logging.getLogger(__name__)
+
+# 流式导入的大文件在元数据中只保留较短的分块预览
+STREAM_PREVIEW_CHARS = 200
+# 清空知识库时保留的条目：后台任务队列（含 SQLite 的 -wal / -shm）和任务尚未处理的上传文件
+CLEAR_PRESERVED_PREFIXES = ('jobs.sqlite', 'uploads')
+
+
+def _progress_range(progress_callback, low: float, high: float, chunks_before: int = 0):
+    """
+    把某一阶段报告的 0-100 进度映射到总进度的 [low, high] 区间，chunks_done 加上之前各阶段
+    已完成的 chunk 数（progress_callback 为 None 时返回 None）
+    """
+    if progress_callback is None:
+        return None
+
+    def report(stage, progress, chunks_done=None):
+        if chunks_done is not None:
+            chunks_done += chunks_before
+        progress_callback(stage, int(low + progress * (high - low) / 100), chunks_done=chunks_done)
+    return report
+
+
+def _serialized(method):
+    """写操作全程持有写者互斥：同一时刻只有一个写者，检索不受影响"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock.writer():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class LocalKnowledgeBase:
     """本地知识库管理类"""
     
@@ -44,7 +94,34 @@ class LocalKnowledgeBase:
                  db_path: str = "./knowledge_db",
                  chunk_size: int = 1000,
                  chunk_overlap: int = 200,
-                 openai_api_key: Optional[str] = None):
+                 openai_api_key: Optional[str] = None,
+                 embedding_batch_size: int = 64,
+                 embedding_max_workers: int = 4,
+                 embedding_max_batch_size: int = 512,
+                 embedding_max_batch_chars: int = 100_000,
+                 load_max_workers: int = os.cpu_count() or 1,
+                 parallel_load_min_files: int = 4,
+                 stream_pdf_min_bytes: int = 20 * 1024 * 1024,
+                 pdf_pages_per_window: int = 20,
+                 checkpoint_interval: int = 500,
+                 index_type: str = 'flat',
+                 index_params: Optional[Dict] = None,
+                 train_sample_size: int = 100_000,
+                 mmap_index: bool = False,
+                 metric: str = 'l2',
+                 embedding_dimensions: Optional[int] = None,
+                 query_cache_size: int = 1024,
+                 query_cache_ttl: float = 3600,
+                 query_cache_disk: bool = True,
+                 result_cache_size: int = 256,
+                 result_cache_max_bytes: int = 32 * 1024 * 1024,
+                 result_cache_max_entry_bytes: int = 1024 * 1024,
+                 hybrid_search: bool = True,
+                 rrf_k: int = 60,
+                 lexical_min_match: float = 0.5,
+                 rerank_max_batch_size: int = 64,
+                 rerank_max_wait_ms: float = 5.0,
+                 rerank_cache_size: int = 20000):
         """
         初始化知识库
         Args:
@@ -52,6 +129,39 @@ class LocalKnowledgeBase:
             chunk_size: 文本块大小
             chunk_overlap: 文本块重叠
             openai_api_key: OpenAI API Key (如果为None，则从环境变量读取)
+            embedding_batch_size: 每次 Embeddings 请求的初始 chunk 数（之后按响应自适应调整）
+            embedding_max_workers: 同时在途的 Embeddings 请求数上限（1 表示串行）
+            embedding_max_batch_size: 自适应批大小的上限
+            embedding_max_batch_chars: 每次请求的文本总字符数上限（近似 token 预算）
+            load_max_workers: 加载/分割文档的进程数（1 表示在当前进程内加载）；进程池在构造时
+                              创建，须在启动任务队列等后台线程之前构造知识库
+            parallel_load_min_files: 文件数达到该值才启用进程池，小批量直接在进程内加载
+            stream_pdf_min_bytes: 不小于该大小的 PDF 按页窗口流式导入
+            pdf_pages_per_window: 流式导入时每个窗口的页数（决定峰值内存）
+            checkpoint_interval: 向量化时每写入多少个 chunk 保存一次检查点
+            index_type: 向量索引类型 flat / ivf / hnsw / ivfpq / sq8 / sqfp16（全量重建时生效）
+            index_params: 索引参数（nlist、nprobe、hnsw_m、ef_search、pq_m 等）
+            train_sample_size: 训练 IVF 类索引时抽样的向量数
+            mmap_index: 以只读 mmap 方式加载向量索引和 chunk 文本（多进程共享页缓存，
+                        启动耗时与索引大小无关；第一次写入时自动转为内存副本）
+            metric: 相似度度量 l2 / cosine（新建向量库和全量重建时生效，已有向量库用
+                    migrate_metric 转换，不重新向量化）
+            embedding_dimensions: 向量维度（text-embedding-3 系列的 dimensions 参数，如 256 / 512 / 1024），
+                                  文档和查询都按该维度向量化；为 None 时沿用现有向量库的维度，
+                                  没有向量库时为模型原生维度。与现有向量库不一致时需全量重建
+            query_cache_size: 内存中缓存的查询向量数（LRU，0 表示不缓存）
+            query_cache_ttl: 内存中查询向量的有效期（秒，0 表示不过期）
+            query_cache_disk: 查询向量同时写入 embedding_cache.sqlite，重启后仍可命中
+            result_cache_size: 缓存的检索结果数（LRU，0 表示不缓存）
+            result_cache_max_bytes: 检索结果缓存的总字节数上限（按结果文本估算）
+            result_cache_max_entry_bytes: 单个检索结果超过该字节数时不缓存
+            hybrid_search: 向量检索之外同时做 BM25 词项检索，两路结果按倒数排名融合（RRF）
+            rrf_k: RRF 的平滑常数，越大名次靠后的结果权重越高
+            lexical_min_match: 只被 BM25 命中的 chunk 至少包含的查询词项比例（按 idf 加权），
+                               低于该比例时不作为候选（只命中常见词的无关问题不会召回结果）
+            rerank_max_batch_size: 并发检索的重排序合批时，每次前向计算的最大 pair 数
+            rerank_max_wait_ms: 重排序请求等待与其他请求合批的最长时间（毫秒）
+            rerank_cache_size: 缓存的重排序得分数（按问题、chunk 和模型，0 表示不缓存）
         """
 
         self.db_path = Path(db_path)
@@ -65,10 +175,80 @@ class LocalKnowledgeBase:
         
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        # 旧版元数据文件，首次启动时迁移到 metadata.sqlite
         self.metadata_file = self.db_path / "metadata.json"
+        self.vector_store_path = self.db_path / "vector_store"
+        # 旧版 LangChain FAISS 索引目录（index.faiss + index.pkl），加载时自动迁移
+        self.legacy_faiss_path = self.db_path / "faiss_index"
+        self.documents_dir = self.db_path / "documents"
+
+        # 向量化并发配置
+        self.embedding_batch_size = max(1, embedding_batch_size)
+        self.embedding_max_workers = max(1, embedding_max_workers)
+        # 批大小随响应耗时增大、遇到 429/5xx 减半并退避重试，状态在多次导入之间保留
+        self.embedding_batcher = AdaptiveBatcher(
+            initial_batch_size=self.embedding_batch_size,
+            max_batch_size=embedding_max_batch_size,
+            max_batch_chars=embedding_max_batch_chars
+        )
+
+        # 文档加载/分割并行配置：进程池在此（尚未启动任务队列等线程时）创建一次
+        self.load_max_workers = max(1, load_max_workers)
+        self.parallel_load_min_files = parallel_load_min_files
+        start_process_pool(self.load_max_workers)
+
+        # 大 PDF 流式导入配置
+        self.stream_pdf_min_bytes = stream_pdf_min_bytes
+        self.pdf_pages_per_window = max(1, pdf_pages_per_window)
+
+        # 向量缓存：按 (模型, chunk 哈希) 复用已生成的向量
+        self.embedding_model = "text-embedding-3-small"
+        self.embedding_dimensions = embedding_dimensions or self._stored_dimensions()
+        # 缩短维度的向量单独缓存
+        self.embedding_cache_model = cache_model_key(self.embedding_model, self.embedding_dimensions)
+        self.embedding_cache = EmbeddingCache(self.db_path / "embedding_cache.sqlite")
+        # 查询向量缓存：重复的问题不再调用 Embeddings API
+        self.query_cache = QueryEmbeddingCache(
+            max_entries=query_cache_size,
+            ttl=query_cache_ttl,
+            disk_cache=self.embedding_cache if query_cache_disk else None
+        )
+        # 检索结果缓存：按索引代号失效，任何导入、删除、重建、清空之后不再命中旧结果
+        self.result_cache = SearchResultCache(
+            max_entries=result_cache_size,
+            max_bytes=result_cache_max_bytes,
+            max_entry_bytes=result_cache_max_entry_bytes
+        )
+        self.last_rebuild_stats = {}
+        # 上次全量重建失败的原因（成功时为 None），后台任务据此记录失败详情
+        self.last_rebuild_error = None
+
+        # 向量索引类型：新增的向量先写入当前索引，全量重建时按配置重新构建/训练
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"不支持的索引类型: {index_type}（可选: {', '.join(INDEX_TYPES)}）")
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        self.train_sample_size = train_sample_size
+        self.mmap_index = mmap_index
+        if metric not in METRICS:
+            raise ValueError(f"不支持的相似度度量: {metric}（可选: {', '.join(METRICS)}）")
+        self.metric = metric
+
+        # 向量化检查点：中途失败后重新导入时从断点继续
+        self.checkpoint_interval = max(1, checkpoint_interval)
+        self.checkpoints = IngestCheckpoint(self.db_path / "ingest_checkpoint.json")
 
         self.reranker = None
         self.reranker_model = 'light'
+        self.reranker_model_name = None
+        # 重排序得分缓存：同一问题与 chunk 的得分只计算一次
+        self.rerank_cache = RerankScoreCache(max_entries=rerank_cache_size)
+        # 重排序合批：并发检索的 (query, passage) 对合并为一次前向计算（模型在第一次使用时加载）
+        self.rerank_batcher = RerankBatcher(
+            lambda pairs: self.reranker.predict(pairs, batch_size=self.rerank_batcher.max_batch_size),
+            max_batch_size=rerank_max_batch_size,
+            max_wait_ms=rerank_max_wait_ms
+        )
         
         # 2.改为延迟加载：不在 __init__ 中加载模型
         # 而是在 search() 方法中第一次需要时加载
@@ -78,6 +258,10 @@ class LocalKnowledgeBase:
                 
         # 3. 添加相关性阈值配置
         self.relevance_threshold = 0.3  # 相关性阈值（可调整）
+        # 混合检索：BM25 补充向量检索漏掉的精确词项（型号、缩写等）
+        self.hybrid_search = hybrid_search
+        self.rrf_k = rrf_k
+        self.lexical_min_match = lexical_min_match
 
         # 4. OpenAI API Key
         self.api_key = os.getenv("OPENAI_API_KEY")
@@ -99,8 +283,16 @@ class LocalKnowledgeBase:
         else:
             print(f"⚠️ 警告：LangChain 不可用，知识库功能将受限")
         
+        # 统计缓存：导入、删除、重建时增量更新，其他进程的修改通过版本号发现
+        self.stats = StatsCache()
+
+        # 读写锁：检索共享读，写操作互斥；修改内存中的向量库时短暂独占
+        self.lock = ReadWriteLock()
+
         # 6. 初始化向量数据库
         self.vector_store = None
+        # 全量重建期间继续对外检索的旧向量库（新库在副本上构建，完成后再切换）
+        self._serving_store = None
         if self.embeddings:
             self.load_vector_store()
         
@@ -110,7 +302,8 @@ class LocalKnowledgeBase:
     def _init_embeddings(self):
         """初始化 OpenAI Embeddings"""
         try:
-            print(f"📦 初始化 OpenAI Embeddings (模型: text-embedding-3-small)...")
+            print(f"📦 初始化 OpenAI Embeddings (模型: {self.embedding_model}, "
+                  f"维度: {self.embedding_dimensions or '原生'})...")
             
             # 🔴 清除代理环境变量，因为 OpenAI 不支持 SOCKS 代理
             os.environ.pop('http_proxy', None)
@@ -125,8 +318,9 @@ class LocalKnowledgeBase:
 
             embeddings = OpenAIEmbeddings(
                 api_key=self.api_key,
-                model="text-embedding-3-small",
-                base_url=api_base
+                model=self.embedding_model,
+                base_url=api_base,
+                dimensions=self.embedding_dimensions
             )
             print(f"✅ OpenAI Embeddings 初始化成功！")
             if api_base:
@@ -138,74 +332,181 @@ class LocalKnowledgeBase:
             traceback.print_exc()
             return None
     
-    def _load_metadata(self) -> Dict:
-        """加载文件元数据"""
-        if self.metadata_file.exists():
-            try:
-                with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"警告：无法加载元数据: {e}")
-        return {}
-    
-    def _save_metadata(self):
-        """保存文件元数据"""
+    def _stored_dimensions(self) -> Optional[int]:
+        """现有向量库的维度（原生维度时为 None，不传 dimensions 参数）"""
+        if not LANGCHAIN_AVAILABLE:
+            return None
         try:
-            with open(self.metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(self.file_metadata, f, ensure_ascii=False, indent=2)
+            dim = FaissVectorStore.stored_dim(self.vector_store_path)
         except Exception as e:
-            print(f"错误：无法保存元数据: {e}")
+            print(f"⚠️ 读取向量库维度失败: {e}")
+            return None
+        return dim if dim and dim != NATIVE_DIMENSIONS.get(self.embedding_model) else None
+
+    def _dimension_error(self) -> Optional[str]:
+        """现有向量库与配置的向量维度不一致时返回错误信息（只能全量重建）"""
+        store = self._search_store()
+        expected = self.embedding_dimensions or NATIVE_DIMENSIONS.get(self.embedding_model)
+        if store is None or not expected or store.dim == expected:
+            return None
+        return (f"向量库维度为 {store.dim}，当前配置为 {expected}，不同维度的向量不能混用，"
+                f"请执行全量重建")
+
+    def _load_metadata(self) -> MetadataStore:
+        """
+        打开文件元数据库（首次启动时从旧版 metadata.json 迁移）
+
+        迁移在挂上统计缓存的回调之前进行（回调会读取 self.file_metadata）；迁移失败时
+        直接抛出，避免以不完整的元数据启动（metadata.json 保留，下次启动重试）。
+        """
+        metadata = MetadataStore(self.db_path / MetadataStore.FILE)
+        try:
+            metadata.migrate_json(self.metadata_file)
+        except Exception as e:
+            metadata.close()
+            raise RuntimeError(f"无法从 {self.metadata_file.name} 迁移元数据: {e}") from e
+        metadata.on_change = self._on_metadata_change
+        self.stats.invalidate_files()
+        return metadata
     
     def _clean_filename(self, filename: str) -> str:
         """清理文件名前缀（去掉如 '0_' 或 '123_' 的前缀）"""
-        if '_' in filename:
-            parts = filename.split('_', 1)
-            if len(parts) == 2 and parts[0].isdigit():
-                return parts[1]
-        return filename
+        return clean_filename(filename)
     
     def load_vector_store(self):
         """加载向量数据库"""
-        faiss_path = self.db_path / "faiss_index"
-        
-        if faiss_path.exists() and self.embeddings:
+        # 先取签名再加载：加载期间被其他进程覆盖时，下次检查会再加载一次
+        signature = FaissVectorStore.signature(self.vector_store_path)
+        if FaissVectorStore.exists(self.vector_store_path):
             try:
-                self.vector_store = FAISS.load_local(
-                    str(faiss_path),
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
-                )
-                print(f"✅ 向量库已加载: {self.vector_store.index.ntotal} 个向量")
+                store = FaissVectorStore.load(self.vector_store_path, mmap=self.mmap_index)
+                print(f"✅ 向量库已加载: {store.ntotal} 个向量 ({store.index_type} 索引)")
+                if store.index_type != self.index_type:
+                    print(f"   配置的索引类型为 {self.index_type}，全量重建后生效")
+                if store.metric != self.metric:
+                    print(f"   配置的相似度度量为 {self.metric}，当前为 {store.metric}，"
+                          f"执行 migrate_metric 或全量重建后生效")
+                expected = self.embedding_dimensions or NATIVE_DIMENSIONS.get(self.embedding_model)
+                if expected and store.dim != expected:
+                    print(f"⚠️ 向量库维度为 {store.dim}，配置为 {expected}：全量重建前拒绝检索和导入")
             except Exception as e:
                 print(f"⚠️ 向量库加载失败: {e}")
-                self.vector_store = None
+                store = None
+            with self.lock.write():
+                self.vector_store = store
+            self._record_index_stats(signature)
+        elif self.legacy_faiss_path.exists() and self.embeddings:
+            self._migrate_legacy_vector_store()
+        else:
+            self._record_index_stats(signature)
+
+    def _record_index_stats(self, signature):
+        """记录当前向量库的磁盘签名、向量数和占用字节数"""
+        self.stats.set_index(
+            signature,
+            self.vector_store.ntotal if self.vector_store is not None else 0,
+            FaissVectorStore.disk_bytes(self.vector_store_path)
+        )
+
+    def _on_metadata_change(self, filename: Optional[str]):
+        """元数据库写入后增量更新统计缓存（filename 为 None 表示整体变化）"""
+        if filename is None:
+            self.stats.invalidate_files()
+            return
+        metadata = self.file_metadata.get(filename)
+        self.stats.update_file(filename, self._file_info(filename, metadata) if metadata is not None else None)
+
+    def _refresh_stats(self):
+        """
+        发现其他进程对知识库的修改并刷新统计缓存
+        
+        只比较向量库签名（一次 stat）和元数据库 data_version，都未变化时为 O(1)；
+        向量库被其他进程重新保存时重新加载，元数据变化时重新读取文件列表（O(文件数)）。
+        本进程有写操作进行中时不重新加载（签名随写操作保存时更新）。
+        """
+        self._refresh_vector_store()
+        with self.lock.read():
+            version = self.file_metadata.data_version()
+            if self.stats.metadata_stale(version):
+                self.stats.set_files(
+                    {name: self._file_info(name, meta) for name, meta in self.file_metadata.items()},
+                    version
+                )
+
+    def _refresh_vector_store(self):
+        """向量库被其他进程重新保存时重新加载（一次 stat，签名未变化时为 O(1)）"""
+        if self.stats.index_stale(FaissVectorStore.signature(self.vector_store_path)):
+            with self.lock.writer(blocking=False) as acquired:
+                if acquired:
+                    print("🔄 向量库已被其他进程更新，重新加载")
+                    self.load_vector_store()
+
+    def _migrate_legacy_vector_store(self):
+        """将旧版 LangChain FAISS 索引迁移为带稳定 chunk id 的向量库（不重新向量化）"""
+        try:
+            print(f"🔄 检测到旧版向量库，开始迁移: {self.legacy_faiss_path}")
+            legacy = FAISS.load_local(
+                str(self.legacy_faiss_path),
+                self.embeddings,
+                allow_dangerous_deserialization=True
+            )
+            self.vector_store = FaissVectorStore.from_langchain(legacy, self.vector_store_path, self.metric)
+            if self.save_vector_store():
+                import shutil
+                shutil.rmtree(str(self.legacy_faiss_path), ignore_errors=True)
+            print(f"✅ 迁移完成: {self.vector_store.ntotal} 个向量")
+        except Exception as e:
+            print(f"⚠️ 旧版向量库迁移失败: {e}")
+            self.vector_store = None
     
+    def _remove_chunks(self, ids: List[int]) -> int:
+        """从向量库删除 chunk，同时使这些 chunk 的重排序得分失效"""
+        removed = self.vector_store.remove_chunks(ids)
+        self.rerank_cache.invalidate_chunks(ids)
+        return removed
+
+    def _remove_file(self, filename: str) -> int:
+        """从向量库删除某个文件的全部 chunk，同时使其重排序得分失效"""
+        ids = self.vector_store.chunk_ids_for(filename)
+        removed = self.vector_store.remove_file(filename)
+        self.rerank_cache.invalidate_chunks(ids)
+        return removed
+
+    def _new_vector_store(self, dim: int):
+        return FaissVectorStore.create(self.vector_store_path, dim, self.metric)
+
     def save_vector_store(self):
         """保存向量数据库"""
         if not self.vector_store:
             print(f"⚠️ 向量库为空，无法保存")
             return False
         
-        faiss_path = self.db_path / "faiss_index"
         try:
-            self.vector_store.save_local(str(faiss_path))
-            print(f"✅ 向量库已保存: {self.vector_store.index.ntotal} 个向量")
+            self.vector_store.save(self.vector_store_path)
+            self._record_index_stats(FaissVectorStore.signature(self.vector_store_path))
+            print(f"✅ 向量库已保存: {self.vector_store.ntotal} 个向量")
             return True
         except Exception as e:
             print(f"❌ 向量库保存失败: {e}")
             return False
 
+    @_serialized
     def _rebuild_vector_store(self):
         """根据当前元数据重建向量索引（从磁盘文件加载所有文档并重建 FAISS）。
         说明：该方法只重建向量索引，不会修改 `file_metadata` 的时间等字段。
+        新索引在旧索引之外单独构建，期间检索继续使用旧索引，保存后才切换。
         """
         if not self.embeddings:
             print("⚠️ Embeddings 未初始化，无法重建索引")
             return False
 
+        self.last_rebuild_error = None
         # 收集所有文件路径
         file_paths = []
         for fname, meta in self.file_metadata.items():
+            if meta.get('alias_of'):
+                # 别名共享原文件的向量，不单独建索引
+                continue
             path = meta.get('path')
             if path:
                 p = Path(path)
@@ -214,65 +515,250 @@ class LocalKnowledgeBase:
 
         if not file_paths:
             print("⚠️ 未找到可用于重建的文档文件，清空向量库")
-            self.vector_store = None
-            # 删除已存在的 faiss_index 目录以避免不一致
+            with self.lock.write():
+                self.vector_store = None
+            # 删除已存在的向量库以避免不一致（正在检索的旧快照在释放后回收）
             try:
-                faiss_path = self.db_path / "faiss_index"
-                if faiss_path.exists():
-                    import shutil
-                    shutil.rmtree(str(faiss_path))
+                FaissVectorStore.destroy(self.vector_store_path)
             except Exception as e:
                 print(f"⚠️ 删除旧向量库失败: {e}")
+            self._record_index_stats(None)
             return True
 
         try:
             print(f"🔧 重建向量库：将从 {len(file_paths)} 个文件创建索引...")
+            # 全量重建会重新分配 chunk id，之前的检查点全部失效
+            self.checkpoints.clear()
 
-            all_documents = []
-            for fp in file_paths:
-                try:
-                    docs, err = self._load_file(Path(fp))
-                    if err:
-                        print(f"  ⚠️ 加载文档失败: {fp} -> {err}")
-                        continue
-                    all_documents.extend(docs)
-                except Exception as e:
-                    print(f"  ❌ 读取文件 {fp} 失败: {e}")
+            # 大 PDF 稍后流式导入，其余文件加载并分割（大批量时使用进程池）
+            stream_paths = [fp for fp in file_paths if self._should_stream(fp)]
+            split_docs = []
+            for fp, records, _, err in self._load_and_split([fp for fp in file_paths if fp not in stream_paths]):
+                if err:
+                    print(f"  ⚠️ 加载文档失败: {fp} -> {err}")
+                    continue
+                split_docs.extend(Document(page_content=text, metadata=meta) for text, meta in records)
 
-            if not all_documents:
+            if not split_docs and not stream_paths:
                 print("⚠️ 没有可用文档内容来重建索引")
-                self.vector_store = None
+                with self.lock.write():
+                    self.vector_store = None
                 return True
 
-            # 分割文档
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=self.chunk_size,
-                chunk_overlap=self.chunk_overlap
-            )
-            split_docs = splitter.split_documents(all_documents)
             print(f"✅ 分割完成，共 {len(split_docs)} 个 chunks，开始创建/替换 FAISS 索引...")
 
-            # 使用 FAISS.from_documents 重新创建索引
+            # 并发生成向量后一次性创建索引；重建期间检索使用旧向量库
+            previous = self.vector_store
+            self._serving_store = previous
+            discarded = None
             try:
-                self.vector_store = FAISS.from_documents(split_docs, self.embeddings)
+                vectors, cache_stats = self._embed_texts([doc.page_content for doc in split_docs])
+                # 新库与旧库共用 chunk 库，旧 chunk 在新库保存时才删除
+                dim = len(vectors[0]) if vectors else (previous.dim if previous else None)
+                if previous is not None and dim is not None:
+                    # mmap 加载的旧库在此转为可写副本，需与检索互斥
+                    with self.lock.write():
+                        self.vector_store = previous.successor(dim, self.metric)
+                else:
+                    self.vector_store = None
+                self._add_vectors_to_store(split_docs, vectors)
+                rebuilt_chunks = len(split_docs)
+                for fp in stream_paths:
+                    chunks, _, err, stats = self._add_document_streaming(fp, checkpoint=False)
+                    cache_stats = {k: cache_stats[k] + stats[k] for k in cache_stats}
+                    rebuilt_chunks += chunks
+                    if err:
+                        print(f"  ⚠️ 流式导入失败: {fp} -> {err}")
+                if self.vector_store is None:
+                    print("⚠️ 没有可用文档内容来重建索引")
+                    return True
+                # 按配置的索引类型构建 ANN 索引（IVF 类在抽样向量上训练）
+                if self.index_type != 'flat':
+                    self.vector_store.build_ann_index(self.index_type, self.index_params, self.train_sample_size)
                 # 保存到磁盘
                 self.save_vector_store()
-                print(f"✅ 向量库重建完成: {self.vector_store.index.ntotal} 个向量")
+                # 旧 chunk 已全部删除（新库重新分配 chunk id）
+                self.rerank_cache.clear()
+                self.last_rebuild_stats = {
+                    'files': len(file_paths),
+                    'chunks': rebuilt_chunks,
+                    'embedding_cache': cache_stats
+                }
+                print(f"✅ 向量库重建完成: {self.vector_store.ntotal} 个向量 "
+                      f"(缓存命中 {cache_stats['hits']}, 未命中 {cache_stats['misses']})")
                 return True
             except Exception as e:
-                print(f"❌ 创建向量库失败: {e}")
-                import traceback
-                traceback.print_exc()
+                logger.exception("❌ 创建向量库失败")
+                self.last_rebuild_error = f'创建向量库失败: {e}'
+                if self.vector_store is not None and self.vector_store is not previous:
+                    # 撤销已写入 chunk 库的新数据，从磁盘重新加载旧向量库；
+                    # 切换前检索仍由 previous 提供，它与新库共用的 chunk 库此时不能关闭
+                    discarded = self.vector_store
+                    discarded.discard_changes()
+                    self.vector_store = None
+                    self.load_vector_store()
                 return False
+            finally:
+                # 切换到新向量库（失败时为重新加载的旧向量库）
+                with self.lock.write():
+                    self._serving_store = None
+                    if discarded is not None:
+                        # 已切换到重新加载的库：关闭被取代的旧库，释放其快照持有和 chunk 库连接
+                        (previous if previous is not None else discarded).close()
 
         except Exception as e:
-            print(f"❌ 重建向量库错误: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("❌ 重建向量库错误")
+            self.last_rebuild_error = f'重建向量库错误: {e}'
             return False
     
+    @_serialized
+    def migrate_metric(self) -> bool:
+        """
+        把现有向量库转换为配置的相似度度量（如 l2 -> cosine）
+
+        从索引中取回已存储的向量，归一化后按原索引类型重建，不调用 Embeddings API。
+        转换在副本上进行，期间检索继续使用旧向量库，保存后切换。
+
+        Returns:
+            是否执行了转换
+        """
+        previous = self.vector_store
+        if previous is None or previous.metric == self.metric:
+            return False
+        print(f"🔄 转换相似度度量: {previous.metric} -> {self.metric}（{previous.ntotal} 个向量）")
+        self._serving_store = previous
+        try:
+            self.vector_store = previous.with_metric(self.metric, self.train_sample_size)
+            if not self.save_vector_store():
+                self.vector_store = previous
+                return False
+            return True
+        except Exception as e:
+            logger.exception("❌ 相似度度量转换失败")
+            self.vector_store = previous
+            return False
+        finally:
+            with self.lock.write():
+                self._serving_store = None
+
+    def _resolve_document_path(self, filename: str, meta: Dict) -> Optional[Path]:
+        """定位文档的磁盘文件：优先使用元数据记录的路径，其次是知识库 documents 目录"""
+        recorded = meta.get('path')
+        if recorded and Path(recorded).exists():
+            return Path(recorded)
+        candidate = self.documents_dir / filename
+        if candidate.exists():
+            return candidate
+        return None
+
+    @_serialized
+    def sync_documents(self, progress_callback=None) -> Dict:
+        """
+        增量同步：对比文件当前哈希与元数据中记录的哈希
+        
+        - 新文件（documents 目录中未入库的文件）和已修改的文件：重新分割、向量化
+        - 磁盘上已不存在的文件：移除其向量和元数据
+        - 未变化的文件：不做任何处理
+        
+        Returns:
+            {'added', 'updated', 'removed', 'unchanged': 数量,
+             'files': 各类别的文件名, 'added_chunks', 'errors',
+             'embedding_cache', 'elapsed_seconds'}
+        """
+        start = time.perf_counter()
+        files = {'added': [], 'updated': [], 'removed': [], 'unchanged': []}
+        to_index = []
+
+        dimension_error = self._dimension_error()
+        if dimension_error:
+            print(f"❌ {dimension_error}")
+            return {
+                **{k: 0 for k in files},
+                'files': files,
+                'added_chunks': 0,
+                'errors': [{'error': dimension_error}],
+                'embedding_cache': {'hits': 0, 'misses': 0},
+                'elapsed_seconds': round(time.perf_counter() - start, 3)
+            }
+
+        print(f"\n🔄 开始增量同步，已记录 {len(self.file_metadata)} 个文件...")
+
+        indexed_sources = self.vector_store.files if self.vector_store else {}
+        paths = {}
+        for filename, meta in list(self.file_metadata.items()):
+            path = self._resolve_document_path(filename, meta)
+            if path is None:
+                files['removed'].append(filename)
+                continue
+            paths[filename] = path
+            owner = meta.get('alias_of') or filename
+            if meta.get('hash') == self._calculate_file_hash(str(path)) and owner in indexed_sources:
+                files['unchanged'].append(filename)
+            else:
+                files['updated'].append(filename)
+                to_index.append(str(path))
+
+        # 别名共享所有者的向量：所有者已修改或删除时，别名按自身内容重新导入
+        # （内容仍与所有者相同时在导入时重新登记为别名）
+        changed_owners = set(files['updated']) | set(files['removed'])
+        for filename in list(files['unchanged']):
+            if self.file_metadata.get(filename, {}).get('alias_of') in changed_owners:
+                files['unchanged'].remove(filename)
+                files['updated'].append(filename)
+                to_index.append(str(paths[filename]))
+
+        # documents 目录中尚未入库的文件视为新增
+        if self.documents_dir.exists():
+            for path in sorted(self.documents_dir.iterdir()):
+                if not path.is_file() or path.suffix.lower() not in SUPPORTED_SUFFIXES:
+                    continue
+                filename = self._clean_filename(path.name)
+                if filename not in self.file_metadata:
+                    files['added'].append(filename)
+                    to_index.append(str(path))
+
+        # 移除已删除文件和已修改文件的旧向量
+        if self.vector_store is not None:
+            with self.lock.write():
+                for filename in files['removed'] + files['updated']:
+                    self._remove_file(filename)
+        for filename in files['removed']:
+            self.file_metadata.delete(filename)
+
+        added_chunks = 0
+        errors = []
+        cache_stats = {'hits': 0, 'misses': 0}
+        if to_index:
+            result = self.add_documents(to_index, progress_callback=progress_callback)
+            added_chunks = result.get('added_chunks', 0)
+            errors = result.get('errors', [])
+            cache_stats = result.get('embedding_cache', cache_stats)
+        elif files['removed']:
+            self.save_vector_store()
+
+        report = {k: len(v) for k, v in files.items()}
+        report.update({
+            'files': files,
+            'added_chunks': added_chunks,
+            'errors': errors,
+            'embedding_cache': cache_stats,
+            'elapsed_seconds': round(time.perf_counter() - start, 3)
+        })
+        print(f"✅ 增量同步完成: 新增 {report['added']}, 更新 {report['updated']}, "
+              f"删除 {report['removed']}, 未变化 {report['unchanged']} "
+              f"({report['elapsed_seconds']}s)")
+        return report
+
+    @_serialized
     def add_documents(self, file_paths: List[str], progress_callback=None) -> Dict:
-        """添加文档 - 支持进度回调"""
+        """
+        添加文档 - 支持进度回调
+        
+        progress_callback(stage, progress, chunks_done=None)：stage 依次为
+        streaming / loading / splitting / vectorizing / saving，progress 为 0-100 且不回退：
+        每个流式导入的大 PDF 和其余文件（整体）按文件大小各占 0-95 中固定的一段；
+        vectorizing 和 streaming 阶段额外传入已完成的 chunk 数，用于计算吞吐量。
+        """
         print(f"\n📂 开始处理 {len(file_paths)} 个文件...")
         
         if not self.embeddings:
@@ -281,48 +767,100 @@ class LocalKnowledgeBase:
                 'files': [],
                 'errors': [{'error': 'Embeddings 未初始化，无法添加文档'}]
             }
+
+        dimension_error = self._dimension_error()
+        if dimension_error:
+            print(f"❌ {dimension_error}")
+            return {
+                'added_chunks': 0,
+                'files': [],
+                'errors': [{'error': dimension_error}]
+            }
         
-        all_documents = []
+        # 第零步：按内容哈希去重，重复内容不再加载/分割/向量化
+        file_paths, file_hashes, duplicates = self._deduplicate_files(file_paths)
+        if not file_paths:
+            self._apply_aliases(duplicates['aliases'])
+            print("✅ 所有文件内容均已存在，无需向量化")
+            return {
+                'added_chunks': 0,
+                'files': [],
+                'errors': [],
+                **duplicates
+            }
+
+        split_docs = []
         processed_files = {}
         added_chunks = 0
         errors = []
+        cache_stats = {'hits': 0, 'misses': 0}
+
+        # 大 PDF：按页窗口流式分割、向量化并写入索引，峰值内存与窗口大小相关
+        stream_paths = [fp for fp in file_paths if self._should_stream(fp)]
+        file_paths = [fp for fp in file_paths if fp not in stream_paths]
+        # 进度区间：各流式文件和其余文件按大小各占 0-95 中的一段，保存占 95-100
+        sizes = {fp: max(Path(fp).stat().st_size if Path(fp).exists() else 0, 1)
+                 for fp in stream_paths + file_paths}
+        total_size = sum(sizes.values())
+        progress_start = 0.0
+        for file_path in stream_paths:
+            progress_end = progress_start + 95 * sizes[file_path] / total_size
+            chunks, doc_count, error, stats = self._add_document_streaming(
+                file_path, _progress_range(progress_callback, progress_start, progress_end, added_chunks),
+                file_hash=file_hashes.get(file_path)
+            )
+            progress_start = progress_end
+            cache_stats = {k: cache_stats[k] + stats[k] for k in cache_stats}
+            if error:
+                errors.append(error)
+                continue
+            added_chunks += chunks
+            processed_files[file_path] = doc_count
+
+        if not file_paths:
+            if not processed_files:
+                return {
+                    'added_chunks': 0,
+                    'files': [],
+                    'errors': errors,
+                    **duplicates
+                }
+            return self._finalize_added_files(
+                processed_files, file_hashes, duplicates, added_chunks, errors, cache_stats, progress_callback
+            )
+
         total_files = len(file_paths)
+        # 以下各阶段的 0-100 映射到流式导入之后剩余的区间，最终的保存阶段仍报告 100
+        report = _progress_range(progress_callback, progress_start, 95, added_chunks)
         
-        # 第一步：加载所有文档
-        print("\n📖 第一步：加载文档...")
-        for idx, file_path in enumerate(file_paths):
-            try:
-                docs, error = self._load_file(Path(file_path))
-                if error:
-                    errors.append(error)
-                else:
-                    all_documents.extend(docs)
-                    processed_files[file_path] = len(docs)
-                    
-                    # 📤 发送加载进度（0-40%）
-                    progress = int((idx + 1) / total_files * 40)
-                    if progress_callback:
-                        progress_callback('loading', progress)
-            
-            except Exception as e:
-                print(f"❌ 加载文件失败: {file_path}, {e}")
-                errors.append({'file': str(file_path), 'error': str(e)})
+        # 第一步、第二步：加载并分割文档（大批量时使用进程池）
+        print("\n📖 第一步：加载并分割文档...")
+
+        def on_file_done(done_files):
+            # 📤 发送加载进度（0-40%）
+            if report:
+                report('loading', int(done_files / total_files * 40))
+
+        for file_path, records, doc_count, error in self._load_and_split(file_paths, on_file_done):
+            if error:
+                errors.append(error)
+                continue
+            split_docs.extend(Document(page_content=text, metadata=meta) for text, meta in records)
+            processed_files[file_path] = doc_count
         
-        if not all_documents:
+        if not split_docs:
             print("⚠️ 没有有效的文档")
+            if processed_files:
+                return self._finalize_added_files(
+                    processed_files, file_hashes, duplicates, added_chunks, errors, cache_stats, progress_callback
+                )
             return {
                 'added_chunks': 0,
                 'files': [],
-                'errors': errors
+                'errors': errors,
+                **duplicates
             }
         
-        # 第二步：分割文档
-        print("\n✂️ 第二步：分割文档...")
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap
-        )
-        split_docs = splitter.split_documents(all_documents)
         print(f"✅ 分割完成，共 {len(split_docs)} 个 chunks")
         # ===== 保存分块内容到元数据（按文件分组） =====
         try:
@@ -335,57 +873,103 @@ class LocalKnowledgeBase:
                 }
                 chunks_by_file.setdefault(source, []).append(entry)
 
-            # 将分块详情合并到 file_metadata 中
+            # 将分块详情写入元数据库（同时记录 chunks 数）
             for file_path, doc_count in processed_files.items():
                 file_name = self._clean_filename(Path(file_path).name)
                 if file_name in chunks_by_file:
-                    self.file_metadata.setdefault(file_name, {})
-                    self.file_metadata[file_name]['chunks_detail'] = chunks_by_file[file_name]
-                    # ensure chunks count recorded
-                    self.file_metadata[file_name]['chunks'] = len(chunks_by_file[file_name])
+                    self.file_metadata.set_chunk_previews(file_name, chunks_by_file[file_name])
         except Exception as e:
             print(f"⚠️ 保存分块详情失败: {e}")
         
         # 📤 发送分割进度（40-60%）
-        if progress_callback:
-            progress_callback('splitting', 60)
+        if report:
+            report('splitting', 60)
         
-        # 第三步：生成向量（这是最耗时的步骤）
+        # 第三步：分段生成向量并写入 FAISS（这是最耗时的步骤）
+        # 每写入 checkpoint_interval 个 chunk 保存一次向量库和检查点，
+        # 之前中断过的文件从检查点继续，只向量化尚未完成的 chunk
         print("\n🔢 第三步：生成向量（这可能需要一些时间）...")
         total_chunks = len(split_docs)
         
         try:
-            # 批量处理 chunks，每批 10 个
-            batch_size = 10
-            for batch_idx in range(0, len(split_docs), batch_size):
-                batch = split_docs[batch_idx:batch_idx + batch_size]
-                
-                try:
-                    if self.vector_store is None:
-                        # 第一批：创建向量库
-                        self.vector_store = FAISS.from_documents(batch, self.embeddings)
-                    else:
-                        # 后续批：添加到现有向量库
-                        self.vector_store.add_documents(batch)
-                    
-                    added_chunks += len(batch)
-                    
-                    # 📤 发送向量化进度（60-95%）
-                    progress = 60 + int((batch_idx + len(batch)) / total_chunks * 35)
-                    if progress_callback:
-                        progress_callback('vectorizing', min(progress, 95))
-                    
-                    print(f"✅ 处理了 {added_chunks}/{total_chunks} chunks")
-                
-                except Exception as e:
-                    print(f"❌ 向量化失败: {e}")
-                    errors.append({'error': f'向量化失败: {e}'})
-                    return {
-                        'added_chunks': added_chunks,
-                        'files': list(processed_files.keys()),
-                        'errors': errors
-                    }
-            
+            docs_by_file = {}
+            for doc in split_docs:
+                docs_by_file.setdefault(doc.metadata.get('source', 'Unknown'), []).append(doc)
+            hash_by_name = {
+                self._clean_filename(Path(fp).name): file_hashes.get(fp) or self._calculate_file_hash(fp)
+                for fp in processed_files
+            }
+
+            pending_docs = []
+            for file_name, file_docs in docs_by_file.items():
+                entry = self._resume_checkpoint(
+                    file_name, hash_by_name.get(file_name, ''),
+                    total_chunks=len(file_docs),
+                    chunk_size=self.chunk_size,
+                    chunk_overlap=self.chunk_overlap
+                )
+                done = len(entry['chunk_ids'])
+                if done:
+                    print(f"  ⏩ {file_name}: 从检查点继续（已完成 {done}/{len(file_docs)} 个 chunks）")
+                pending_docs.extend(file_docs[done:])
+            resumed_chunks = total_chunks - len(pending_docs)
+
+            try:
+                for start in range(0, len(pending_docs), self.checkpoint_interval):
+                    segment = pending_docs[start:start + self.checkpoint_interval]
+
+                    # 自适应分批，最多 embedding_max_workers 个请求并发
+                    def on_batch_done(done_chunks, start=start):
+                        # 📤 发送向量化进度（60-95%）
+                        done_total = resumed_chunks + start + done_chunks
+                        progress = 60 + int(done_total / total_chunks * 40)
+                        if report:
+                            report('vectorizing', min(progress, 100), chunks_done=start + done_chunks)
+                        print(f"✅ 处理了 {done_total}/{total_chunks} chunks")
+
+                    vectors, stats = self._embed_texts(
+                        [doc.page_content for doc in segment],
+                        on_batch_done=on_batch_done
+                    )
+                    cache_stats = {k: cache_stats[k] + stats[k] for k in cache_stats}
+                    self._add_vectors_to_store(segment, vectors)
+                    self._save_checkpoint(segment)
+            except Exception as e:
+                logger.exception("❌ 向量化失败")
+                errors.append({'error': f'向量化失败: {e}（已完成的部分已保存检查点，重新导入将从断点继续）'})
+                return {
+                    'added_chunks': added_chunks,
+                    'files': list(processed_files.keys()),
+                    'errors': errors,
+                    **duplicates
+                }
+
+            # 同名文件内容已更新：新向量全部就绪后再移除旧向量（流式导入的文件已自行替换）
+            with self.lock.write():
+                for file_name in docs_by_file:
+                    entry = self.checkpoints.get(file_name)
+                    if entry and entry['old_ids']:
+                        self._remove_chunks(entry['old_ids'])
+            added_chunks += len(pending_docs)
+
+            return self._finalize_added_files(
+                processed_files, file_hashes, duplicates, added_chunks, errors, cache_stats, progress_callback
+            )
+        
+        except Exception as e:
+            logger.exception("❌ 处理失败")
+            return {
+                'added_chunks': added_chunks,
+                'files': list(processed_files.keys()),
+                'errors': errors + [{'error': f'处理失败: {e}'}],
+                **duplicates
+            }
+
+    def _finalize_added_files(self, processed_files: Dict, file_hashes: Dict, duplicates: Dict,
+                              added_chunks: int, errors: List, cache_stats: Dict,
+                              progress_callback=None) -> Dict:
+        """保存向量库并更新已处理文件的元数据，返回 add_documents 的结果"""
+        try:
             # 第四步：保存向量库
             print("\n💾 第四步：保存向量库...")
             self.save_vector_store()
@@ -397,64 +981,407 @@ class LocalKnowledgeBase:
             # 更新元数据
             for file_path, doc_count in processed_files.items():
                 file_name = self._clean_filename(Path(file_path).name)
-                # 不要覆盖已有 metadata（例如 chunks_detail），而是更新字段
-                self.file_metadata.setdefault(file_name, {})
+                # 不要覆盖已有 metadata（例如分块详情），只更新本行的字段
                 # 如果之前已经计算了分块详情，则优先使用其长度作为 chunks
-                existing_chunks = self.file_metadata[file_name].get('chunks')
+                existing_chunks = self.file_metadata.get(file_name, {}).get('chunks')
                 if existing_chunks is None:
-                    # 如果没有，尝试使用 chunks_detail 长度
-                    existing_chunks = len(self.file_metadata[file_name].get('chunks_detail', [])) or doc_count
+                    # 如果没有，尝试使用分块预览数
+                    existing_chunks = len(self.file_metadata.get_chunk_previews(file_name)) or doc_count
 
-                self.file_metadata[file_name].update({
-                    'path': file_path,
-                    'hash': self._calculate_file_hash(file_path),
-                    'added_time': datetime.now().isoformat(),
-                    'chunks': existing_chunks,
-                    'size': Path(file_path).stat().st_size if Path(file_path).exists() else None,
-                    'status': 'indexed'
-                })
+                self.file_metadata.update(
+                    file_name,
+                    alias_of=None,
+                    path=file_path,
+                    hash=file_hashes.get(file_path) or self._calculate_file_hash(file_path),
+                    added_time=datetime.now().isoformat(),
+                    chunks=existing_chunks,
+                    size=Path(file_path).stat().st_size if Path(file_path).exists() else None,
+                    status='indexed'
+                )
             
-            self._save_metadata()
+            self._apply_aliases(duplicates['aliases'])
+
+            # 已完成的文件不再需要检查点
+            for file_path in processed_files:
+                self.checkpoints.finish(self._clean_filename(Path(file_path).name))
+            self.checkpoints.save()
             
-            print(f"✅ 完成！共添加 {added_chunks} 个 chunks\n")
+            print(f"✅ 完成！共添加 {added_chunks} 个 chunks "
+                  f"(缓存命中 {cache_stats['hits']}, 未命中 {cache_stats['misses']})\n")
             
             return {
                 'added_chunks': added_chunks,
                 'files': list(processed_files.keys()),
-                'errors': errors
+                'errors': errors,
+                'embedding_cache': cache_stats,
+                **duplicates
             }
         
         except Exception as e:
-            print(f"❌ 处理失败: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("❌ 处理失败")
             return {
                 'added_chunks': added_chunks,
                 'files': list(processed_files.keys()),
-                'errors': [{'error': f'处理失败: {e}'}]
+                'errors': errors + [{'error': f'处理失败: {e}'}],
+                **duplicates
             }
     
-    def _load_file(self, file_path: Path) -> tuple:
-        """加载单个文件"""
+    def _should_stream(self, file_path: str) -> bool:
+        """大 PDF 走流式导入"""
+        path = Path(file_path)
+        return (path.suffix.lower() == '.pdf'
+                and path.exists()
+                and path.stat().st_size >= self.stream_pdf_min_bytes)
+
+    def _add_document_streaming(self, file_path: str, progress_callback=None,
+                                file_hash: Optional[str] = None,
+                                checkpoint: bool = True) -> Tuple[int, int, Optional[Dict], Dict]:
+        """
+        按页窗口流式导入单个 PDF
+        
+        每个窗口依次分割、向量化并立即写入索引，处理完即释放，峰值内存由
+        pdf_pages_per_window 决定。同名文件的旧向量在全部窗口成功后才移除。
+        
+        checkpoint 为 True 时，每写入 checkpoint_interval 个 chunk 保存一次向量库
+        和检查点（已完成的页数 + chunk id），中途失败后再次导入同一文件时从断点
+        所在的页继续；为 False 时（全量重建）不落盘，失败时撤回本次写入的向量。
+        
+        Returns:
+            (新增 chunk 数, 页数, 错误, 缓存统计)
+        """
+        file_name = self._clean_filename(Path(file_path).name)
+        print(f"\n🌊 流式导入: {file_name} (每 {self.pdf_pages_per_window} 页一个窗口)")
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap
+        )
+        if checkpoint:
+            entry = self._resume_checkpoint(
+                file_name, file_hash or self._calculate_file_hash(file_path),
+                pages_per_window=self.pdf_pages_per_window,
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap
+            )
+            old_ids = entry['old_ids']
+            new_ids = list(entry['chunk_ids'])
+            start_page = entry.get('pages_done', 0)
+            if start_page:
+                print(f"  ⏩ 从检查点继续：第 {start_page + 1} 页起（已完成 {len(new_ids)} 个 chunks）")
+        else:
+            old_ids = self.vector_store.chunk_ids_for(file_name) if self.vector_store else []
+            new_ids = []
+            start_page = 0
+        # 流式导入只保留较短的预览，避免元数据随文件大小膨胀
+        chunks_detail = [
+            {'id': i, 'content': doc.page_content[:STREAM_PREVIEW_CHARS]}
+            for i, doc in enumerate(self.vector_store.get_documents(new_ids) if new_ids else [])
+        ]
+        resumed_chunks = len(new_ids)
+        unsaved_chunks = 0
+        cache_stats = {'hits': 0, 'misses': 0}
+        total_pages = start_page
+
         try:
-            if file_path.suffix.lower() == '.pdf':
-                loader = PDFPlumberLoader(str(file_path))
-                docs = loader.load()
-            elif file_path.suffix.lower() in ['.txt', '.md']:
-                loader = TextLoader(str(file_path), encoding='utf-8')
-                docs = loader.load()
-            else:
-                return [], {'file': str(file_path), 'error': f'不支持的格式: {file_path.suffix}'}
-            
+            for window_docs, pages_done, total_pages in iter_pdf_windows(
+                    Path(file_path), self.pdf_pages_per_window, start_page=start_page):
+                chunks = splitter.split_documents(window_docs)
+                window_ids = []
+                if chunks:
+                    vectors, stats = self._embed_texts([doc.page_content for doc in chunks])
+                    cache_stats = {k: cache_stats[k] + stats[k] for k in cache_stats}
+                    with self.lock.write():
+                        if self.vector_store is None:
+                            self.vector_store = self._new_vector_store(len(vectors[0]))
+                        window_ids = self.vector_store.add_file_chunks(file_name, chunks, vectors)
+                    new_ids.extend(window_ids)
+                    chunks_detail.extend(
+                        {'id': len(chunks_detail) + i, 'content': doc.page_content[:STREAM_PREVIEW_CHARS]}
+                        for i, doc in enumerate(chunks)
+                    )
+                if checkpoint:
+                    self.checkpoints.advance(file_name, window_ids, pages_done=pages_done)
+                    unsaved_chunks += len(window_ids)
+                    if unsaved_chunks >= self.checkpoint_interval:
+                        self._save_checkpoint()
+                        unsaved_chunks = 0
+                print(f"  ✅ {pages_done}/{total_pages} 页, 累计 {len(new_ids)} 个 chunks")
+                if progress_callback:
+                    progress_callback('streaming', int(pages_done / max(total_pages, 1) * 100),
+                                      chunks_done=len(new_ids) - resumed_chunks)
+        except Exception as e:
+            logger.exception("  ❌ 流式导入失败: %s", file_name)
+            if checkpoint:
+                # 保留已完成的窗口，重新导入时从断点继续
+                if self.vector_store is not None:
+                    self._save_checkpoint()
+            elif self.vector_store is not None:
+                with self.lock.write():
+                    self._remove_chunks(new_ids)
+            return 0, 0, {'file': str(file_path), 'error': str(e)}, cache_stats
+
+        if old_ids:
+            with self.lock.write():
+                self._remove_chunks(old_ids)
+        self.file_metadata.set_chunk_previews(file_name, chunks_detail)
+        return len(new_ids) - resumed_chunks, total_pages, None, cache_stats
+
+    def _resume_checkpoint(self, file_name: str, file_hash: str, **fields) -> Dict:
+        """
+        取得文件的向量化检查点
+        
+        检查点的内容哈希和 fields（chunk 数、分割参数等）与本次一致，且记录的
+        chunk 仍在索引中时从断点继续；否则新建检查点，并把该文件名下现有的
+        向量记为待替换的旧向量。两种情况下都会移除上次中断时写入索引、
+        但未记入检查点的向量。
+        """
+        existing = set(self.vector_store.chunk_ids_for(file_name)) if self.vector_store else set()
+        entry = self.checkpoints.get(file_name)
+        resumable = (
+            entry is not None
+            and entry['hash'] == file_hash
+            and all(entry.get(key) == value for key, value in fields.items())
+            and set(entry['chunk_ids']) <= existing
+        )
+        if resumable:
+            keep = set(entry['old_ids']) | set(entry['chunk_ids'])
+        else:
+            # 上次未完成的检查点作废：只有开始导入前就存在的向量才是旧版本
+            old_ids = [i for i in entry['old_ids'] if i in existing] if entry else sorted(existing)
+            entry = self.checkpoints.begin(file_name, file_hash, old_ids, **fields)
+            keep = set(old_ids)
+
+        orphans = [chunk_id for chunk_id in existing if chunk_id not in keep]
+        if orphans:
+            with self.lock.write():
+                self._remove_chunks(orphans)
+        return entry
+
+    def _save_checkpoint(self, docs: Optional[List] = None):
+        """
+        保存向量库和检查点（先写向量库，再写检查点）
+        
+        docs 为刚写入索引的一段 chunk，会先按来源文件追加到检查点中。
+        """
+        if docs:
+            ids_by_file = {}
             for doc in docs:
-                doc.metadata['source'] = self._clean_filename(file_path.name)
-            
-            print(f"  ✅ {file_path.name}: {len(docs)} 个文档")
-            return docs, None
+                ids_by_file.setdefault(doc.metadata.get('source', 'Unknown'), []).append(doc.metadata['chunk_id'])
+            for file_name, chunk_ids in ids_by_file.items():
+                self.checkpoints.advance(file_name, chunk_ids)
+        self.save_vector_store()
+        self.checkpoints.save()
+        print(f"  💾 已保存检查点")
+
+    def _deduplicate_files(self, file_paths: List[str]) -> Tuple[List[str], Dict[str, str], Dict]:
+        """
+        按文件内容哈希去重（在加载/分割/向量化之前执行）
         
-        except Exception as e:
-            print(f"  ❌ {file_path.name}: {e}")
-            return [], {'file': str(file_path), 'error': str(e)}
+        - 同名且内容相同：跳过（skipped）
+        - 不同名但内容与已入库文件相同：登记为该文件的别名（aliases），不生成向量
+        - 同名但内容已变化：重新向量化并替换旧向量（replaced）
+        - 内容已变化的文件的别名：内容与新内容不同时转为独立文件，一并向量化
+        - 上次导入中断、检查点与当前内容一致：从断点继续（resumed），已写入的部分向量
+          不算旧版本；检查点中还记有更早版本的向量时同时计入 replaced
+        
+        Returns:
+            (需要向量化的路径, {路径: 哈希}, {'skipped', 'aliases', 'replaced', 'resumed'})
+        """
+        indexed_sources = self.vector_store.files if self.vector_store else {}
+        # 已入库内容的哈希 -> 持有向量的文件名
+        owners = {
+            meta.get('hash'): name
+            for name, meta in self.file_metadata.items()
+            if meta.get('hash') and not meta.get('alias_of') and name in indexed_sources
+        }
+
+        remaining = []
+        file_hashes = {file_path: self._calculate_file_hash(file_path) for file_path in file_paths}
+        # 本批次中内容已变化的文件：旧内容的向量将被替换，不能再作为别名的所有者
+        changed = {self._clean_filename(Path(fp).name): h for fp, h in file_hashes.items()}
+        owners = {h: name for h, name in owners.items() if changed.get(name, h) == h}
+        duplicates = {'skipped': [], 'aliases': [], 'replaced': [], 'resumed': []}
+        queue = list(file_paths)
+        queued = set(changed)
+        while queue:
+            file_path = queue.pop(0)
+            file_name = self._clean_filename(Path(file_path).name)
+            file_hash = file_hashes[file_path]
+            owner = owners.get(file_hash) if file_hash else None
+            existing = self.file_metadata.get(file_name, {})
+
+            if owner == file_name or (owner and existing.get('alias_of') == owner):
+                print(f"  ⏭️ {file_name}: 内容未变化，跳过")
+                duplicates['skipped'].append(file_name)
+            elif owner:
+                print(f"  🔗 {file_name}: 与 {owner} 内容相同，登记为别名")
+                duplicates['aliases'].append({
+                    'file': file_name,
+                    'alias_of': owner,
+                    'path': file_path,
+                    'hash': file_hash
+                })
+            else:
+                checkpoint = self.checkpoints.get(file_name)
+                if checkpoint is not None and checkpoint['hash'] == file_hash:
+                    print(f"  ⏩ {file_name}: 上次导入未完成，将从检查点继续")
+                    duplicates['resumed'].append(file_name)
+                    if checkpoint['old_ids']:
+                        duplicates['replaced'].append(file_name)
+                elif file_name in indexed_sources:
+                    print(f"  ♻️ {file_name}: 内容已更新，将替换旧向量")
+                    duplicates['replaced'].append(file_name)
+                remaining.append(file_path)
+                if file_hash:
+                    # 同一批次中后续的相同内容登记为本文件的别名
+                    owners[file_hash] = file_name
+                # 别名共享本文件的向量：内容与新内容不同的别名转为独立文件，随本次导入重新向量化
+                for alias in self.file_metadata.aliases_of(file_name):
+                    alias_meta = self.file_metadata.get(alias, {})
+                    if alias in queued or alias_meta.get('hash') == file_hash:
+                        continue
+                    alias_path = self._resolve_document_path(alias, alias_meta)
+                    if alias_path is None:
+                        print(f"  ⚠️ {alias}: 别名文件已不存在，移除其元数据")
+                        self.file_metadata.delete(alias)
+                        continue
+                    print(f"  ✂️ {alias}: 与 {file_name} 的新内容不同，转为独立文件")
+                    queue.append(str(alias_path))
+                    queued.add(alias)
+                    file_hashes[str(alias_path)] = self._calculate_file_hash(str(alias_path))
+        return remaining, file_hashes, duplicates
+
+    def _apply_aliases(self, aliases: List[Dict]):
+        """将别名写入元数据：别名共享原文件的向量，不单独占用索引空间"""
+        for alias in aliases:
+            owner_meta = self.file_metadata.get(alias['alias_of'], {})
+            # 别名原本可能是独立文件，先移除它自己的旧向量
+            if self.vector_store is not None and alias['file'] in self.vector_store.files:
+                with self.lock.write():
+                    self._remove_file(alias['file'])
+            self.file_metadata.put(alias['file'], {
+                'path': alias['path'],
+                'hash': alias['hash'],
+                'alias_of': alias['alias_of'],
+                'added_time': datetime.now().isoformat(),
+                'chunks': owner_meta.get('chunks', 0),
+                'size': Path(alias['path']).stat().st_size if Path(alias['path']).exists() else None,
+                'status': 'indexed'
+            })
+        for alias in aliases:
+            # 对外返回的结果中不包含临时路径和哈希
+            alias.pop('path', None)
+            alias.pop('hash', None)
+
+    def _embed_texts(self, texts: List[str], on_batch_done=None) -> Tuple[List[List[float]], Dict]:
+        """
+        并发生成向量（优先使用磁盘缓存）
+        
+        先按 (模型, 文本哈希) 查询 embedding_cache，只把未命中的文本交给
+        embedding_batcher 分批：批大小同时受 chunk 数和字符预算限制，响应快时
+        增大、遇到 429/5xx 时减半并退避重试。每完成一批才切出下一批，因此新的
+        批大小立即生效，同时在途的请求数不超过 embedding_max_workers。每完成一批
+        立即写入缓存，中途失败时已完成的批次不会白白浪费。返回结果与输入顺序
+        一致；任一批次重试用尽后取消尚未开始的批次并抛出异常。
+        
+        Args:
+            texts: 待向量化的文本
+            on_batch_done: 进度回调，参数为已完成（含缓存命中）的 chunk 数
+        
+        Returns:
+            (向量列表, {'hits': 命中数, 'misses': 未命中数})
+        """
+        hashes = [EmbeddingCache.text_hash(text) for text in texts]
+        vectors_by_hash = self.embedding_cache.get_many(self.embedding_cache_model, hashes)
+
+        # 未命中的文本去重后再请求
+        missing = {}
+        for text_hash, text in zip(hashes, texts):
+            if text_hash not in vectors_by_hash:
+                missing.setdefault(text_hash, text)
+        hits = sum(1 for text_hash in hashes if text_hash in vectors_by_hash)
+        misses = len(texts) - hits
+        done_chunks = hits
+        if on_batch_done and hits:
+            on_batch_done(done_chunks)
+
+        missing_hashes = list(missing.keys())
+        missing_texts = list(missing.values())
+
+        if missing_hashes:
+            started = time.perf_counter()
+            executor = ThreadPoolExecutor(max_workers=self.embedding_max_workers)
+            try:
+                in_flight = {}
+                next_start = 0
+                while next_start < len(missing_texts) or in_flight:
+                    while next_start < len(missing_texts) and len(in_flight) < self.embedding_max_workers:
+                        end = self.embedding_batcher.take(missing_texts, next_start)
+                        future = executor.submit(
+                            self.embedding_batcher.call,
+                            self.embeddings.embed_documents,
+                            missing_texts[next_start:end]
+                        )
+                        in_flight[future] = missing_hashes[next_start:end]
+                        next_start = end
+
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        batch = in_flight.pop(future)
+                        batch_vectors = dict(zip(batch, future.result()))
+                        self.embedding_cache.put_many(self.embedding_cache_model, batch_vectors)
+                        vectors_by_hash.update(batch_vectors)
+                        done_chunks += len(batch)
+                        if on_batch_done:
+                            on_batch_done(min(done_chunks, len(texts)))
+            finally:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+            elapsed = time.perf_counter() - started
+            self.embedding_batcher.record(len(missing_hashes), elapsed)
+            throughput = self.embedding_batcher.stats()
+            print(f"  📈 Embeddings 吞吐: {len(missing_hashes) / max(elapsed, 1e-9):.1f} chunks/s "
+                  f"(当前批大小 {throughput['batch_size']}, 累计重试 {throughput['retries']} 次)")
+
+        self.embedding_cache.record(hits, misses)
+        if on_batch_done and done_chunks < len(texts):
+            # 重复文本只请求一次，这里补齐进度
+            on_batch_done(len(texts))
+
+        vectors = [vectors_by_hash[text_hash] for text_hash in hashes]
+        return vectors, {'hits': hits, 'misses': misses}
+
+    def _add_vectors_to_store(self, docs: List, vectors: List[List[float]]):
+        """将已生成的向量按来源文件批量写入 FAISS（不再调用 Embeddings API）"""
+        if not docs:
+            return
+
+        grouped = {}
+        for doc, vector in zip(docs, vectors):
+            source = doc.metadata.get('source', 'Unknown')
+            file_docs, file_vectors = grouped.setdefault(source, ([], []))
+            file_docs.append(doc)
+            file_vectors.append(vector)
+
+        with self.lock.write():
+            if self.vector_store is None:
+                self.vector_store = self._new_vector_store(len(vectors[0]))
+            for source, (file_docs, file_vectors) in grouped.items():
+                self.vector_store.add_file_chunks(source, file_docs, file_vectors)
+
+    def _load_file(self, file_path: Path) -> tuple:
+        """加载单个文件"""
+        return load_file(file_path)
+
+    def _load_and_split(self, file_paths: List[str], on_file_done=None) -> List[Tuple]:
+        """加载并分割文件，返回 [(路径, (文本, 元数据) 列表, 文档数, 错误), ...]"""
+        return load_and_split_files(
+            file_paths,
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
+            max_workers=self.load_max_workers,
+            min_parallel_files=self.parallel_load_min_files,
+            on_file_done=on_file_done
+        )
     
     def _split_documents(self, documents: List) -> List:
         """分割文档"""
@@ -476,7 +1403,8 @@ class LocalKnowledgeBase:
         except:
             return ""
     
-    def search(self, query: str, top_k: int = 3, use_reranking: bool = True) -> Dict:
+    def search(self, query: str, top_k: int = 3, use_reranking: bool = True,
+               search_params: Optional[Dict] = None) -> Dict:
         """
         搜索知识库（支持重排序）
         
@@ -484,34 +1412,74 @@ class LocalKnowledgeBase:
             query: 查询文本
             top_k: 返回的结果数
             use_reranking: 是否使用重排序器
+            search_params: 本次检索的索引参数，如 {'nprobe': 32}（IVF）或 {'ef_search': 128}（HNSW）
         """
-        if not self.vector_store:
+        # 其他进程（多 worker 部署）发布了新快照时先重新加载，不继续检索旧的一代
+        self._refresh_vector_store()
+        # 代号在检索前读取：检索期间发生写入时，结果记在旧代号下，不会再被命中；
+        # 同时记入所检索快照的代号，重新加载到其他进程发布的快照后旧结果不再命中
+        store = self._search_store()
+        key = self.result_cache.make_key(query, top_k, use_reranking, self.relevance_threshold,
+                                         search_params,
+                                         (self.lock.generation, store.generation if store else None))
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            print(f"⚡ 检索结果缓存命中: '{query}' (Top {top_k})")
+            return {'question': query, 'results': [dict(result) for result in cached],
+                    'has_results': bool(cached)}
+
+        result = self._search(query, top_k, use_reranking, search_params)
+        # 出错或重排序模型未能加载（降级为向量相似度）时不缓存
+        if 'error' not in result and not (use_reranking and self.reranker is None):
+            self.result_cache.put(key, [dict(item) for item in result['results']])
+        return result
+
+    def _search(self, query: str, top_k: int, use_reranking: bool,
+                search_params: Optional[Dict]) -> Dict:
+        if not self._search_store():
             print(f"知识库不存在或未加载")
             return {'question': query, 'results': [], 'has_results': False}
-        else:
-            print(f"🔍 开始搜索: '{query}' (Top {top_k}, 重排序: {'启用' if use_reranking else '禁用'})")
+        dimension_error = self._dimension_error()
+        if dimension_error:
+            print(f"❌ {dimension_error}")
+            return {'question': query, 'results': [], 'has_results': False, 'error': dimension_error}
+        print(f"🔍 开始搜索: '{query}' (Top {top_k}, 重排序: {'启用' if use_reranking else '禁用'})")
         
         try:
             # 第一步：向量检索（召回更多候选）
-            candidates = self.vector_store.similarity_search_with_score(
-                query, 
-                k=top_k * 3  # 召回 3 倍的候选
-            )
+            query_vector = self.query_cache.get_or_embed(
+                self.embedding_cache_model, query, self.embeddings.embed_query)
+            # 只在索引检索和读取 chunk 文本期间持有读锁，向量化和重排序不持锁
+            with self.lock.read():
+                store = self._search_store()
+                metric = store.metric if store else self.metric
+                candidates = store.similarity_search_with_score_by_vector(
+                    query_vector,
+                    k=top_k * 3,  # 召回 3 倍的候选
+                    search_params=search_params
+                ) if store else []
+                lexical_hits = store.lexical_search(
+                    query, k=top_k * 3, min_match=self.lexical_min_match
+                ) if store and self.hybrid_search else []
+                # BM25 命中的 chunk 的向量得分（向量检索未召回的单独计算），score 仍为相似度
+                lexical_distances = {}
+                if lexical_hits:
+                    vector_distances = {doc.metadata.get('chunk_id'): distance for doc, distance in candidates}
+                    lexical_ids = [doc.metadata.get('chunk_id') for doc, _ in lexical_hits]
+                    lexical_distances = store.scores_for(
+                        query_vector, [chunk_id for chunk_id in lexical_ids if chunk_id not in vector_distances])
+                    lexical_distances.update((chunk_id, vector_distances[chunk_id])
+                                             for chunk_id in lexical_ids if chunk_id in vector_distances)
 
             # 使用提供的阈值或默认值
             threshold = self.relevance_threshold
 
-            # 距离越小越相似，所以要用 1 / (1 + distance) 转换为相似度
             filtered_candidates = []
             for doc, distance in candidates:
-                # ✅ 正确的相似度计算：距离 → 相似度
-                # distance 范围：[0, ∞)
-                # similarity 范围：(0, 1]
-                # 使用公式：similarity = 1 / (1 + distance)
-                similarity = 1 / (1 + distance)
+                similarity = self._to_similarity(distance, metric)
                 
                 source_name = doc.metadata.get('source', 'Unknown')
-                print(f"📊 搜索结果: {source_name} (距离: {distance:.3f}, 相似度: {similarity:.3f})")
+                print(f"📊 搜索结果: {source_name} (得分: {distance:.3f}, 相似度: {similarity:.3f})")
                 
                 # ✅ 按相关性阈值过滤
                 if similarity >= threshold:
@@ -519,13 +1487,21 @@ class LocalKnowledgeBase:
                         'content': doc.page_content, # 文档内容
                         'source': source_name, # 文档来源
                         'score': similarity, # 使用相似度作为分数
-                        'distance': distance  # 保留原始距离用于调试
+                        'distance': distance,  # 保留索引返回的原始得分用于调试
+                        'chunk_id': doc.metadata.get('chunk_id')
                     })
                 else:
                     print(f"   ❌ 相似度过低，过滤掉")
 
+            # 混合检索：向量结果（已按阈值过滤）与 BM25 结果按名次融合
+            if lexical_hits:
+                filtered_candidates = self._fuse_candidates(filtered_candidates, lexical_hits,
+                                                            lexical_distances, metric)
+
             # ✅ 只返回 top_k 个结果
             filtered_candidates = filtered_candidates[:top_k]
+            # 不重排序（或重排序失败）时直接返回过滤、融合后的候选（融合时按 RRF 名次排列，分数为相似度）
+            candidates = [(cand, cand['score']) for cand in filtered_candidates]
             
             # 第二步：重排序
             if use_reranking:
@@ -553,6 +1529,7 @@ class LocalKnowledgeBase:
                                 model_name,
                                 cache_folder=cache_folder  # ✅ 指定缓存位置
                             )
+                            self.reranker_model_name = model_name
                             print(f"✅ 重排序器加载成功 (缓存: {cache_folder})")
                         except Exception as load_error:
                             print(f"⚠️ 重排序器加载失败: {load_error}")
@@ -564,10 +1541,17 @@ class LocalKnowledgeBase:
                         # 提取文档内容（从字典中获取）
                         doc_contents = [cand['content'] for cand in filtered_candidates]
                         
-                        # 重排序
-                        scores = self.reranker.predict([
-                            (query, content) for content in doc_contents
+                        # 重排序：只计算未缓存的 (问题, chunk)，与并发的其他检索合批
+                        passages = [(cand.get('chunk_id'), cand['content']) for cand in filtered_candidates]
+                        cached = self.rerank_cache.get_many(self.reranker_model_name, query, passages)
+                        missing = [i for i in range(len(passages)) if i not in cached]
+                        new_scores = self.rerank_batcher.score([
+                            (query, doc_contents[i]) for i in missing
                         ])
+                        self.rerank_cache.put_many(self.reranker_model_name, query,
+                                                   [passages[i] for i in missing], new_scores)
+                        cached.update(zip(missing, new_scores))
+                        scores = [cached[i] for i in range(len(passages))]
                         
                         # 组合候选文档和分数，并排序
                         ranked_pairs = list(zip(filtered_candidates, scores))
@@ -585,11 +1569,14 @@ class LocalKnowledgeBase:
             # 第三步：格式化结果（不再需要硬阈值！）
             results = []
             for doc, score in candidates[:top_k]:
-                results.append({
+                result = {
                     'content': doc.get('content') if isinstance(doc, dict) else doc.page_content,
                     'source': doc.get('source') if isinstance(doc, dict) else doc.metadata.get('source', 'Unknown'),
-                    'score': float(score),  # 现在是重排序分数而不是向量距离
-                })
+                    'score': float(score),  # 重排序分数（未重排序时为向量相似度）
+                }
+                if isinstance(doc, dict) and 'rrf_score' in doc:
+                    result['rrf_score'] = doc['rrf_score']  # 混合检索的融合得分
+                results.append(result)
             
             has_results = len(results) > 0
             
@@ -610,9 +1597,57 @@ class LocalKnowledgeBase:
             return {
                 'question': query,
                 'results': [],
-                'has_results': False
+                'has_results': False,
+                'error': str(e)
             }
 
+    @staticmethod
+    def _to_similarity(distance: float, metric: str) -> float:
+        if metric == 'cosine':
+            # 内积索引（向量已归一化）的得分就是余弦相似度，范围 [-1, 1]
+            return distance
+        # l2 索引返回距离，越小越相似：similarity = 1 / (1 + distance)，范围 (0, 1]
+        return 1 / (1 + distance)
+
+    def _fuse_candidates(self, vector_candidates: List[Dict], lexical_hits: List[Tuple],
+                         lexical_distances: Dict[int, float], metric: str) -> List[Dict]:
+        """
+        倒数排名融合向量候选与 BM25 候选（按 chunk id 合并），按融合得分排序
+
+        score 仍为向量相似度（只被 BM25 命中的 chunk 由 lexical_distances 换算），融合得分
+        记在 rrf_score 中。只被 BM25 命中的 chunk 不受相似度阈值限制：它们已按
+        lexical_min_match 过滤，包含查询中的大部分关键词项。
+        """
+        by_id = {cand['chunk_id']: cand for cand in vector_candidates}
+        for doc, bm25_score in lexical_hits:
+            chunk_id = doc.metadata.get('chunk_id')
+            cand = by_id.get(chunk_id)
+            if cand is None:
+                distance = lexical_distances.get(chunk_id)
+                cand = by_id[chunk_id] = {
+                    'content': doc.page_content,
+                    'source': doc.metadata.get('source', 'Unknown'),
+                    'score': self._to_similarity(distance, metric) if distance is not None else 0.0,
+                    'distance': distance,
+                    'chunk_id': chunk_id
+                }
+            cand['bm25'] = bm25_score
+        fused = reciprocal_rank_fusion([
+            [cand['chunk_id'] for cand in vector_candidates],
+            [doc.metadata.get('chunk_id') for doc, _ in lexical_hits]
+        ], self.rrf_k)
+        results = []
+        for chunk_id, rrf_score in fused:
+            cand = by_id[chunk_id]
+            cand['rrf_score'] = rrf_score
+            results.append(cand)
+        print(f"🔀 混合检索: 向量 {len(vector_candidates)} + BM25 {len(lexical_hits)} -> {len(results)} 个候选")
+        return results
+
+    def _search_store(self):
+        """检索使用的向量库：全量重建期间为旧向量库"""
+        return self._serving_store if self._serving_store is not None else self.vector_store
+
     def query(self, question: str, top_k: int = 3) -> Dict:
         """
         查询知识库
@@ -646,71 +1681,154 @@ class LocalKnowledgeBase:
             'has_sources': has_sources  # ✅ 新增：是否有相关文档
         }
     
+    @staticmethod
+    def _file_info(filename: str, metadata: Dict) -> Dict:
+        """对外返回的文件信息"""
+        return {
+            'name': filename,
+            'path': metadata.get('path', ''),
+            'added_time': metadata.get('added_time', ''),
+            'upload_time': metadata.get('added_time', ''),
+            'size': metadata.get('size'),
+            'chunks': metadata.get('chunks') or metadata.get('doc_count') or 0,
+            'status': metadata.get('status', 'unknown')
+        }
+
+    def list_documents(self, status: Optional[str] = None) -> List[Dict]:
+        """列出文件（读取统计缓存，可按 status 过滤）"""
+        self._refresh_stats()
+        return self.stats.list_files(status)
+
+    def get_document(self, filename: str) -> Optional[Dict]:
+        """单个文件的信息及分块预览（chunks_detail），文件不存在时返回 None"""
+        with self.lock.read():
+            metadata = self.file_metadata.get(filename)
+            if metadata is None:
+                return None
+            return {
+                **self._file_info(filename, metadata),
+                'chunks_detail': self.file_metadata.get_chunk_previews(filename)
+            }
+
     def get_stats(self) -> Dict:
         """获取知识库统计信息"""
         try:
-            self.load_vector_store()
-            
-            total_chunks = self.vector_store.index.ntotal if self.vector_store else 0
-            files = [
-                {
-                    'name': filename,
-                    'path': metadata.get('path', ''),
-                    'added_time': metadata.get('added_time', ''),
-                    'upload_time': metadata.get('added_time', ''),
-                    'size': metadata.get('size'),
-                    'chunks': metadata.get('chunks') or metadata.get('doc_count') or 0,
-                    'status': metadata.get('status', 'unknown')
-                }
-                for filename, metadata in self.file_metadata.items()
-            ]
-            
+            # 只检查版本号，不再每次从磁盘反序列化索引
+            self._refresh_stats()
+            store = self._search_store()
             return {
-                'total_chunks': total_chunks,
-                'total_files': len(files),
-                'files': files
+                **self.stats.snapshot(),
+                'embedding_throughput': self.embedding_batcher.stats(),
+                'index_memory': store.memory_usage() if store is not None else None,
+                'query_embedding_cache': self.query_cache.stats(),
+                'search_result_cache': self.result_cache.stats(),
+                'rerank_batching': self.rerank_batcher.stats(),
+                'rerank_score_cache': self.rerank_cache.stats(),
+                'lock_metrics': self.lock.stats()
             }
         except Exception as e:
             print(f"Error getting stats: {e}")
             return {'total_chunks': 0, 'total_files': 0, 'files': []}
     
+    @_serialized
     def clear(self):
-        """清空知识库"""
+        """清空知识库（期间检索等待，清空后返回空结果；后台任务队列和待处理的上传文件保留）"""
+        with self.lock.write():
+            self._clear()
+
+    def _clear(self):
         try:
             import shutil
+            # 先关闭缓存和元数据库连接，再删除文件
+            self.embedding_cache.close()
+            self.file_metadata.close()
+            # 向量库不直接删除目录：移除 CURRENT 指针，正在检索的旧快照释放后再回收
+            self.vector_store = None
             if self.db_path.exists():
-                shutil.rmtree(self.db_path)
-                self.db_path.mkdir(parents=True, exist_ok=True)
+                for child in self.db_path.iterdir():
+                    if child == self.vector_store_path or child.name.startswith(CLEAR_PRESERVED_PREFIXES):
+                        continue
+                    if child.is_dir():
+                        shutil.rmtree(child)
+                    else:
+                        child.unlink()
+            FaissVectorStore.destroy(self.vector_store_path)
+            self.db_path.mkdir(parents=True, exist_ok=True)
             
-            self.vector_store = None
-            self.file_metadata = {}
-            self._save_metadata()
+            self.file_metadata.reopen()
+            self.embedding_cache.reopen()
+            self.query_cache.clear()
+            self.result_cache.clear()
+            self.rerank_cache.clear()
+            self._record_index_stats(None)
+            self.checkpoints = IngestCheckpoint(self.db_path / "ingest_checkpoint.json")
             print("✅ 知识库已清空")
         except Exception as e:
             print(f"❌ 清空失败: {e}")
     
+    @_serialized
     def delete_document(self, filename: str):
-        """删除指定文档"""
-        if filename in self.file_metadata:
+        """删除指定文档（按 chunk id 直接移除向量，无需重建索引）"""
+        meta = self.file_metadata.get(filename)
+        if meta is not None:
             # 尝试删除物理文件
             try:
-                path = Path(self.file_metadata[filename].get('path', ''))
+                path = Path(meta.get('path', ''))
                 if path.exists():
                     path.unlink()
                     # 如果所在目录变空可选择删除目录，但这里不做额外删除
             except Exception as e:
                 print(f"⚠️ 删除物理文件失败: {e}")
 
-            # 从元数据中移除并保存
-            del self.file_metadata[filename]
-            self._save_metadata()
+            aliases = self.file_metadata.aliases_of(filename)
+            if meta.get('alias_of'):
+                # 别名没有自己的向量，只需移除元数据
+                pass
+            elif aliases and self.vector_store is not None:
+                # 还有别名引用这些向量：把向量转交给第一个别名
+                heir = aliases[0]
+                with self.lock.write():
+                    self.vector_store.rename_file(filename, heir)
+                self.file_metadata.update(heir, alias_of=None)
+                for name in aliases[1:]:
+                    self.file_metadata.update(name, alias_of=heir)
+                self.save_vector_store()
+                print(f"🔗 {filename} 的向量已转交给别名 {heir}")
+            elif self.vector_store is not None:
+                # 只移除该文件的向量，耗时与该文件的 chunk 数成正比
+                with self.lock.write():
+                    removed = self._remove_file(filename)
+                self.save_vector_store()
+                print(f"🗑️ 已移除 {filename} 的 {removed} 个向量")
 
-            # 重新构建向量库以移除该文档的向量（较重，但确保索引一致）
-            rebuilt = self._rebuild_vector_store()
-            if not rebuilt:
-                print("⚠️ 重建向量库失败，尝试加载原有向量库")
-                self.load_vector_store()
+            # 从元数据库中移除
+            self.file_metadata.delete(filename)
     
+    @_serialized
+    def persist_uploaded_files(self, file_paths: List[str]):
+        """将上传的临时文件复制到知识库 documents 目录，并更新元数据中的路径和大小"""
+        import shutil
+
+        print(f"\n💾 保存文件到知识库...")
+        for file_path in file_paths:
+            try:
+                path = Path(file_path)
+                clean_name = self._clean_filename(path.name)
+                dest_path = self.documents_dir / clean_name
+                dest_path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(file_path, dest_path)
+                print(f"  ✅ {clean_name}")
+                # 更新元数据中的路径和大小（如果存在）
+                if clean_name in self.file_metadata:
+                    try:
+                        # 保持 status 为 indexed（如果之前已设置）
+                        self.file_metadata.update(clean_name, path=str(dest_path), size=dest_path.stat().st_size)
+                    except Exception as e:
+                        print(f"  ⚠️ 更新元数据大小/路径失败: {e}")
+            except Exception as e:
+                print(f"  ⚠️  保存失败: {e}")
+
+    @_serialized
     def add_documents_from_upload(self, files) -> Dict:
         """从上传的文件添加文档"""
         import tempfile
@@ -756,31 +1874,7 @@ class LocalKnowledgeBase:
             result = self.add_documents(file_paths)
             
             # 保存文件到知识库目录
-            print(f"\n💾 保存文件到知识库...")
-            for file_path in file_paths:
-                try:
-                    path = Path(file_path)
-                    dest_path = self.db_path / "documents" / path.name
-                    dest_path.parent.mkdir(parents=True, exist_ok=True)
-                    shutil.copy2(file_path, dest_path)
-                    print(f"  ✅ {path.name}")
-                    # 更新元数据中的路径和大小（如果存在）
-                    clean_name = self._clean_filename(path.name)
-                    if clean_name in self.file_metadata:
-                        try:
-                            self.file_metadata[clean_name]['path'] = str(dest_path)
-                            self.file_metadata[clean_name]['size'] = dest_path.stat().st_size
-                            # 保持 status 为 indexed（如果之前已设置）
-                        except Exception as e:
-                            print(f"  ⚠️ 更新元数据大小/路径失败: {e}")
-                except Exception as e:
-                    print(f"  ⚠️  保存失败: {e}")
-
-            # 保存更新后的元数据
-            try:
-                self._save_metadata()
-            except Exception as e:
-                print(f"⚠️ 保存元数据失败: {e}")
+            self.persist_uploaded_files(file_paths)
             
             print(f"\n✅ 上传完成!\n")
             return result
@@ -0,0 +1,293 @@
+# backend/lexical_index.py
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+# 中日韩文字：按相邻两字（bigram）切分，无需分词词典
+_CJK = '぀-ヿ㐀-䶿一-鿿豈-﫿가-힯'
+_TOKEN_RE = re.compile(f"([{_CJK}]+)|([^\\W_{_CJK}]+)")
+# 词项按 UTF-8 定长存储，超出的部分截断（足够容纳英文单词、型号和 CJK bigram）
+MAX_TERM_BYTES = 32
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    切分为 BM25 词项
+
+    文本先做 NFKC 归一化并转小写；连续的中日韩文字切为相邻两字的 bigram
+    （单独一个字时保留单字），其余按字母数字串切分，如 "HNSW索引参数" ->
+    ['hnsw', '索引', '引参', '参数']。
+    """
+    tokens = []
+    for cjk, word in _TOKEN_RE.findall(unicodedata.normalize('NFKC', text).lower()):
+        if word:
+            tokens.append(word)
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return tokens
+
+
+def _encode_term(term: str) -> bytes:
+    return term.encode('utf-8')[:MAX_TERM_BYTES]
+
+
+class _Segment:
+    """BM25Index 的一份完整状态：已保存的 CSR 数组 + 上次保存之后的增量和墓碑"""
+
+    FILES = ('terms', 'offsets', 'posting_ids', 'posting_tfs', 'doc_ids', 'doc_lens')
+
+    def __init__(self, arrays: Optional[Dict[str, np.ndarray]] = None):
+        arrays = arrays or {}
+        self.terms = arrays.get('terms', np.zeros(0, dtype=f"S{MAX_TERM_BYTES}"))
+        self.offsets = arrays.get('offsets', np.zeros(1, dtype=np.int64))
+        self.posting_ids = arrays.get('posting_ids', np.zeros(0, dtype=np.int64))
+        self.posting_tfs = arrays.get('posting_tfs', np.zeros(0, dtype=np.uint32))
+        self.doc_ids = arrays.get('doc_ids', np.zeros(0, dtype=np.int64))
+        self.doc_lens = arrays.get('doc_lens', np.zeros(0, dtype=np.uint32))
+        # 增量：词项 -> [(chunk id, 词频)]，chunk id -> 长度
+        self.added: Dict[bytes, List[Tuple[int, int]]] = {}
+        self.added_lens: Dict[int, int] = {}
+        # 已删除但仍在 CSR 数组中的 chunk id
+        self.removed = set()
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in self.FILES}
+
+    def saved_length(self, chunk_id: int) -> Optional[int]:
+        row = int(np.searchsorted(self.doc_ids, chunk_id))
+        if row < len(self.doc_ids) and self.doc_ids[row] == chunk_id:
+            return int(self.doc_lens[row])
+        return None
+
+    def postings(self, term: bytes) -> Tuple[np.ndarray, np.ndarray]:
+        """某个词项的全部有效 posting (chunk id, 词频)"""
+        row = int(np.searchsorted(self.terms, term))
+        if row < len(self.terms) and self.terms[row] == term:
+            start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+            ids, tfs = np.asarray(self.posting_ids[start:end]), np.asarray(self.posting_tfs[start:end])
+            if self.removed:
+                keep = ~np.isin(ids, np.fromiter(self.removed, dtype=np.int64))
+                ids, tfs = ids[keep], tfs[keep]
+        else:
+            ids, tfs = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint32)
+        # 增量中已删除的 chunk 不在 added_lens 中
+        added = [(chunk_id, tf) for chunk_id, tf in self.added.get(term, ()) if chunk_id in self.added_lens]
+        if added:
+            ids = np.concatenate([ids, np.asarray([p[0] for p in added], dtype=np.int64)])
+            tfs = np.concatenate([tfs, np.asarray([p[1] for p in added], dtype=np.uint32)])
+        return ids, tfs
+
+    def lengths(self, ids: np.ndarray) -> np.ndarray:
+        lengths = np.zeros(len(ids), dtype=np.float64)
+        if len(self.doc_ids):
+            rows = np.minimum(np.searchsorted(self.doc_ids, ids), len(self.doc_ids) - 1)
+            saved = self.doc_ids[rows] == ids
+            lengths[saved] = self.doc_lens[rows[saved]]
+        for i, chunk_id in enumerate(ids.tolist()):
+            if chunk_id in self.added_lens:
+                lengths[i] = self.added_lens[chunk_id]
+        return lengths
+
+    def merged(self) -> "_Segment":
+        """把增量和墓碑合并进 CSR 数组，返回新的状态（本对象不变）"""
+        if not self.added and not self.removed:
+            return self
+        term_rows = np.repeat(np.arange(len(self.terms)), np.diff(self.offsets))
+        ids, tfs = np.asarray(self.posting_ids), np.asarray(self.posting_tfs)
+        doc_ids, doc_lens = np.asarray(self.doc_ids), np.asarray(self.doc_lens)
+        if self.removed:
+            removed = np.fromiter(self.removed, dtype=np.int64)
+            keep = ~np.isin(ids, removed)
+            term_rows, ids, tfs = term_rows[keep], ids[keep], tfs[keep]
+            keep = ~np.isin(doc_ids, removed)
+            doc_ids, doc_lens = doc_ids[keep], doc_lens[keep]
+
+        added = [(term, chunk_id, tf) for term, postings in self.added.items()
+                 for chunk_id, tf in postings if chunk_id in self.added_lens]
+        terms = np.asarray(self.terms)
+        if added:
+            added_terms = np.asarray([p[0] for p in added], dtype=terms.dtype)
+            terms = np.union1d(terms, added_terms)
+            # 旧词项在新词表中的行号
+            term_rows = np.searchsorted(terms, self.terms)[term_rows]
+            term_rows = np.concatenate([term_rows, np.searchsorted(terms, added_terms)])
+            ids = np.concatenate([ids, np.asarray([p[1] for p in added], dtype=np.int64)])
+            tfs = np.concatenate([tfs, np.asarray([p[2] for p in added], dtype=np.uint32)])
+        doc_ids = np.concatenate([doc_ids, np.fromiter(self.added_lens.keys(), dtype=np.int64)])
+        doc_lens = np.concatenate([doc_lens, np.fromiter(self.added_lens.values(), dtype=np.uint32)])
+
+        order = np.lexsort((ids, term_rows))
+        counts = np.bincount(term_rows[order], minlength=len(terms))
+        # 去掉已没有 posting 的词项
+        used = counts > 0
+        doc_order = np.argsort(doc_ids, kind='stable')
+        return _Segment({
+            'terms': terms[used],
+            'offsets': np.concatenate([[0], np.cumsum(counts[used])]).astype(np.int64),
+            'posting_ids': ids[order],
+            'posting_tfs': tfs[order].astype(np.uint32),
+            'doc_ids': doc_ids[doc_order],
+            'doc_lens': doc_lens[doc_order].astype(np.uint32)
+        })
+
+    def copy(self) -> "_Segment":
+        """副本：CSR 数组共用（只读），增量和墓碑各自独立"""
+        other = _Segment(self.arrays())
+        other.added = {term: list(postings) for term, postings in self.added.items()}
+        other.added_lens = dict(self.added_lens)
+        other.removed = set(self.removed)
+        return other
+
+
+class BM25Index:
+    """
+    chunk 文本的 BM25 倒排索引
+
+    已保存的部分为紧凑的 CSR 布局：按字节序排序的定长词项数组、每个词项的
+    posting 起止位置、posting 的 chunk id 与词频，以及每个 chunk 的长度，
+    分别存为 .npy 文件，加载时不逐条反序列化，mmap 时启动耗时与语料大小无关。
+    上次保存之后写入的 chunk 保存在内存增量中，删除记为墓碑，save() 时合并为
+    新的 CSR 数组。
+
+    写入（add / remove）由调用方与检索互斥；save() 可以与检索并行：合并结果是
+    新的状态对象，整体替换，检索开始时取得的状态在检索期间保持不变。
+    """
+
+    FILE_PREFIX = "bm25_"
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._segment = _Segment()
+        self._num_docs = 0
+        self._total_len = 0
+
+    def __len__(self) -> int:
+        return self._num_docs
+
+    def add(self, ids: Iterable[int], texts: Iterable[str]):
+        """写入 chunk（id 不应已存在）"""
+        segment = self._segment
+        for chunk_id, text in zip(ids, texts):
+            chunk_id = int(chunk_id)
+            counts = Counter(_encode_term(token) for token in tokenize(text))
+            for term, tf in counts.items():
+                segment.added.setdefault(term, []).append((chunk_id, tf))
+            length = sum(counts.values())
+            segment.added_lens[chunk_id] = length
+            self._num_docs += 1
+            self._total_len += length
+
+    def remove(self, ids: Iterable[int]):
+        """删除 chunk（不存在的 id 忽略）"""
+        segment = self._segment
+        for chunk_id in ids:
+            chunk_id = int(chunk_id)
+            if chunk_id in segment.removed:
+                continue
+            length = segment.added_lens.pop(chunk_id, None)
+            if length is None:
+                length = segment.saved_length(chunk_id)
+                if length is None:
+                    continue
+                segment.removed.add(chunk_id)
+            self._num_docs -= 1
+            self._total_len -= length
+
+    def search(self, query: str, k: int, min_match: float = 0.0) -> List[Tuple[int, float]]:
+        """
+        返回 BM25 得分最高的 k 个 (chunk id, 得分)，得分从高到低（不含 0 分）
+
+        Args:
+            min_match: chunk 至少包含的查询词项比例（按 idf 加权），0 时不限制。
+                       只命中 "的"、"the" 之类常见词的 chunk 比例很低，会被过滤掉
+        """
+        segment, num_docs = self._segment, self._num_docs
+        if not num_docs or k <= 0:
+            return []
+        avg_len = self._total_len / num_docs or 1.0
+        all_ids, all_scores, all_idfs = [], [], []
+        total_idf = 0.0
+        for term in dict.fromkeys(_encode_term(token) for token in tokenize(query)):
+            ids, tfs = segment.postings(term)
+            if not len(ids):
+                # 语料中没有的词项（包括跨词边界的 bigram）按 df=1 计入分母
+                total_idf += math.log(1 + (num_docs - 0.5) / 1.5)
+                continue
+            idf = math.log(1 + (num_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+            total_idf += idf
+            tfs = tfs.astype(np.float64)
+            norm = self.k1 * (1 - self.b + self.b * segment.lengths(ids) / avg_len)
+            all_ids.append(ids)
+            all_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+            all_idfs.append(np.full(len(ids), idf))
+        if not all_ids:
+            return []
+        unique_ids, inverse = np.unique(np.concatenate(all_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        if min_match > 0:
+            matched = np.bincount(inverse, weights=np.concatenate(all_idfs))
+            scores[matched < min_match * total_idf] = 0.0
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(unique_ids[row]), float(scores[row])) for row in top if scores[row] > 0]
+
+    def copy(self) -> "BM25Index":
+        other = type(self)(self.k1, self.b)
+        other._segment = self._segment.copy()
+        other._num_docs, other._total_len = self._num_docs, self._total_len
+        return other
+
+    def save(self, path: Path) -> List[Path]:
+        """合并增量后写入 path 目录（每个数组一个 .npy 文件），返回写入的文件（由调用方 fsync）"""
+        self._segment = self._segment.merged()
+        written = []
+        for name, array in self._segment.arrays().items():
+            file = Path(path) / f"{self.FILE_PREFIX}{name}.npy"
+            np.save(file, np.asarray(array))
+            written.append(file)
+        return written
+
+    @classmethod
+    def exists(cls, path: Path) -> bool:
+        return all((Path(path) / f"{cls.FILE_PREFIX}{name}.npy").exists() for name in _Segment.FILES)
+
+    @classmethod
+    def load(cls, path: Path, mmap: bool = False) -> "BM25Index":
+        """从 path 目录加载（mmap 时只读映射，不读入内存）"""
+        index = cls()
+        index._segment = _Segment({
+            name: np.load(Path(path) / f"{cls.FILE_PREFIX}{name}.npy", mmap_mode='r' if mmap else None)
+            for name in _Segment.FILES
+        })
+        index._num_docs = len(index._segment.doc_ids)
+        index._total_len = int(np.asarray(index._segment.doc_lens, dtype=np.int64).sum())
+        return index
+
+    def memory_bytes(self) -> int:
+        """CSR 数组的字节数（mmap 时为映射的文件大小）"""
+        return sum(np.asarray(array).nbytes for array in self._segment.arrays().values())
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """
+    倒数排名融合（RRF）：每个排名列表中排第 r 位（从 1 开始）的条目得 1 / (k + r) 分，
+    按总分从高到低返回 (条目, 得分)；只依赖名次，不需要统一各路得分的量纲
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            scores[key] = scores.get(key, 0.0) + 1 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,247 @@
+# backend/metadata_store.py
+
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class MetadataStore:
+    """
+    文件元数据存储（SQLite，WAL）
+
+    取代原来的 metadata.json：每个文件一行，分块预览单独成表，上传、删除、
+    查看详情时只更新涉及的行，写入耗时与知识库大小无关。files 表以文件名为
+    主键，并在 status / hash / alias_of 上建索引，列表和统计直接用 SQL 查询。
+
+    读取接口与原来的字典保持一致（get / in / items / len），写入必须通过
+    update / put / delete 等方法，修改 get() 返回的字典不会落盘。每次写入
+    提交后调用 on_change(文件名)（清空时为 None），用于增量更新统计缓存。
+    """
+
+    FILE = "metadata.sqlite"
+
+    # 有独立列的字段，其余字段存入 extra（JSON）
+    COLUMNS = ('path', 'hash', 'alias_of', 'added_time', 'chunks', 'size', 'status')
+
+    def __init__(self, db_file: Path, on_change: Optional[Callable[[Optional[str]], None]] = None):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._conn = None
+        self._connect()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                name TEXT PRIMARY KEY,
+                path TEXT,
+                hash TEXT,
+                alias_of TEXT,
+                added_time TEXT,
+                chunks INTEGER,
+                size INTEGER,
+                status TEXT,
+                extra TEXT
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_status ON files (status)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_hash ON files (hash)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_alias_of ON files (alias_of)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunk_previews (
+                file TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (file, chunk_index)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.commit()
+
+    @classmethod
+    def _split(cls, meta: Dict) -> Tuple[Dict, Dict]:
+        """拆分为 (独立列, extra)，分块预览不在这里保存"""
+        columns = {key: meta.get(key) for key in cls.COLUMNS if key in meta}
+        extra = {k: v for k, v in meta.items() if k not in cls.COLUMNS and k != 'chunks_detail'}
+        return columns, extra
+
+    @classmethod
+    def _to_dict(cls, row: Tuple) -> Dict:
+        name, *values, extra = row
+        meta = json.loads(extra) if extra else {}
+        meta.update({key: value for key, value in zip(cls.COLUMNS, values) if value is not None})
+        return meta
+
+    _SELECT = f"SELECT name, {', '.join(COLUMNS)}, extra FROM files"
+
+    # ===== 读取 =====
+
+    def get(self, name: str, default: Optional[Dict] = None) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(f"{self._SELECT} WHERE name = ?", (name,)).fetchone()
+        return self._to_dict(row) if row else default
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM files WHERE name = ?", (name,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def items(self, status: Optional[str] = None) -> List[Tuple[str, Dict]]:
+        """全部文件 (文件名, 元数据)，按首次写入顺序；可按 status 过滤"""
+        with self._lock:
+            if status:
+                rows = self._conn.execute(f"{self._SELECT} WHERE status = ? ORDER BY rowid", (status,)).fetchall()
+            else:
+                rows = self._conn.execute(f"{self._SELECT} ORDER BY rowid").fetchall()
+        return [(row[0], self._to_dict(row)) for row in rows]
+
+    def aliases_of(self, name: str) -> List[str]:
+        """登记为 name 别名的文件"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name FROM files WHERE alias_of = ? ORDER BY rowid", (name,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def data_version(self) -> int:
+        """其他连接（进程）每次提交写入后都会变化，本连接自己的写入不影响"""
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def get_chunk_previews(self, name: str) -> List[Dict]:
+        """分块预览 [{'id': 序号, 'content': 预览文本}]"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_index, content FROM chunk_previews WHERE file = ? ORDER BY chunk_index", (name,)
+            ).fetchall()
+        return [{'id': index, 'content': content} for index, content in rows]
+
+    # ===== 写入（每次调用为一个事务） =====
+
+    def _changed(self, name: Optional[str]):
+        # 在释放锁之后调用，回调中可以再读取本库
+        if self.on_change is not None:
+            self.on_change(name)
+
+    def _upsert(self, name: str, meta: Dict, replace: bool):
+        columns, extra = self._split(meta)
+        if replace:
+            columns = {key: columns.get(key) for key in self.COLUMNS}
+        else:
+            row = self._conn.execute("SELECT extra FROM files WHERE name = ?", (name,)).fetchone()
+            if row and row[0]:
+                extra = {**json.loads(row[0]), **extra}
+            extra = {k: v for k, v in extra.items() if v is not None}
+        columns['extra'] = json.dumps(extra, ensure_ascii=False) if extra else None
+        names = ', '.join(columns)
+        placeholders = ', '.join('?' * (len(columns) + 1))
+        updates = ', '.join(f"{key} = excluded.{key}" for key in columns)
+        self._conn.execute(
+            f"INSERT INTO files (name, {names}) VALUES ({placeholders}) "
+            f"ON CONFLICT(name) DO UPDATE SET {updates}",
+            (name, *columns.values())
+        )
+
+    def update(self, name: str, **fields):
+        """更新文件的部分字段（文件不存在时新建）；字段值为 None 表示删除该字段"""
+        with self._lock, self._conn:
+            self._upsert(name, fields, replace=False)
+        self._changed(name)
+
+    def put(self, name: str, meta: Dict):
+        """整体替换文件的元数据（原有字段和分块预览全部丢弃，meta 中的 chunks_detail 一并写入）"""
+        with self._lock, self._conn:
+            self._upsert(name, meta, replace=True)
+            self._write_previews(name, meta.get('chunks_detail') or [])
+        self._changed(name)
+
+    def _write_previews(self, name: str, previews: List):
+        self._conn.execute("DELETE FROM chunk_previews WHERE file = ?", (name,))
+        self._conn.executemany(
+            "INSERT INTO chunk_previews (file, chunk_index, content) VALUES (?, ?, ?)",
+            [
+                (name, index, item['content'] if isinstance(item, dict) else item)
+                for index, item in enumerate(previews)
+            ]
+        )
+
+    def set_chunk_previews(self, name: str, previews: List):
+        """替换文件的分块预览（预览文本列表，或 {'content': ...} 字典列表）并记录 chunks 数"""
+        with self._lock, self._conn:
+            self._upsert(name, {'chunks': len(previews)}, replace=False)
+            self._write_previews(name, previews)
+        self._changed(name)
+
+    def delete(self, name: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunk_previews WHERE file = ?", (name,))
+            self._conn.execute("DELETE FROM files WHERE name = ?", (name,))
+        self._changed(name)
+
+    def import_json(self, json_file: Path) -> int:
+        """
+        从旧版 metadata.json 导入（一次性迁移），返回导入的文件数
+
+        与 fix_metadata_chunks.py 一致：有 chunks_detail 时以其长度作为 chunks。
+        全部文件在一个事务中写入（中途失败时不留下部分数据），提交后只通知
+        一次整体变化（on_change(None)）。
+        """
+        with open(json_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        with self._lock, self._conn:
+            for name, meta in data.items():
+                meta = dict(meta)
+                if meta.get('chunks_detail'):
+                    meta['chunks'] = len(meta['chunks_detail'])
+                elif meta.get('chunks') is None and meta.get('doc_count'):
+                    meta['chunks'] = meta['doc_count']
+                self._upsert(name, meta, replace=True)
+                self._write_previews(name, meta.get('chunks_detail') or [])
+        self._changed(None)
+        return len(data)
+
+    def migrate_json(self, json_file: Path) -> bool:
+        """
+        库为空且存在旧版 metadata.json 时导入，并把 JSON 改名为 .migrated 备份
+
+        Returns:
+            是否执行了迁移
+        """
+        json_file = Path(json_file)
+        if not json_file.exists() or len(self):
+            return False
+        count = self.import_json(json_file)
+        os.replace(json_file, json_file.with_suffix('.json.migrated'))
+        print(f"✅ 已将 {count} 个文件的元数据从 {json_file.name} 迁移到 {self.FILE}")
+        return True
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunk_previews")
+            self._conn.execute("DELETE FROM files")
+        self._changed(None)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def reopen(self):
+        """关闭后重新连接（例如知识库目录被清空后）"""
+        self.close()
+        with self._lock:
+            self._connect()
+        self._changed(None)
@@ -0,0 +1,321 @@
+# backend/query_cache.py
+
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from embedding_cache import EmbeddingCache
+
+
+def normalize_query(query: str) -> str:
+    """查询文本归一化：全角/半角统一（NFKC）、折叠连续空白、去掉首尾空白"""
+    return ' '.join(unicodedata.normalize('NFKC', query).split())
+
+
+class QueryEmbeddingCache:
+    """
+    查询向量缓存
+
+    两级：
+        内存 - 有界 LRU，条目超过 ttl 秒后失效（重新向量化）
+        磁盘 - 可选，复用 EmbeddingCache（embedding_cache.sqlite），重启后仍可命中；
+               向量只取决于 (模型, 文本)，磁盘条目不设过期
+
+    键为 (模型, 归一化后的查询文本)，模型部分见 cache_model_key。检测到模型变化时
+    清空内存中的条目，磁盘条目按模型分开存放，互不影响。
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600,
+                 disk_cache: Optional[EmbeddingCache] = None):
+        self.max_entries = max(0, max_entries)
+        self.ttl = ttl
+        self.disk_cache = disk_cache
+        self._entries = OrderedDict()   # (model, text) -> (向量, 写入时间)
+        self._model = None
+        self._lock = threading.Lock()
+
+        # 累计统计（进程生命周期内）
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_or_embed(self, model: str, query: str, embed: Callable[[str], List[float]]) -> List[float]:
+        """
+        返回查询向量：依次查内存、磁盘，都未命中时调用 embed(归一化文本) 并写回两级缓存
+        """
+        text = normalize_query(query)
+        key = (model, text)
+        with self._lock:
+            if model != self._model:
+                if self._model is not None:
+                    print(f"🔄 Embedding 模型变化 ({self._model} -> {model})，清空查询向量缓存")
+                self._entries.clear()
+                self._model = model
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, stored_at = entry
+                if self.ttl and time.monotonic() - stored_at > self.ttl:
+                    del self._entries[key]
+                    self.expirations += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return vector
+
+        vector = None
+        text_hash = EmbeddingCache.text_hash(text)
+        if self.disk_cache is not None:
+            vector = self.disk_cache.get_many(model, [text_hash]).get(text_hash)
+        if vector is not None:
+            with self._lock:
+                self.disk_hits += 1
+        else:
+            vector = embed(text)
+            if self.disk_cache is not None:
+                self.disk_cache.put_many(model, {text_hash: vector})
+            with self._lock:
+                self.misses += 1
+
+        with self._lock:
+            if self.max_entries and model == self._model:
+                self._entries[key] = (vector, time.monotonic())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return vector
+
+    def clear(self):
+        """清空内存中的条目（磁盘条目随 embedding_cache.sqlite 一起管理）"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'disk_tier': self.disk_cache is not None,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class SearchResultCache:
+    """
+    检索结果缓存
+
+    键为 (归一化后的查询文本, top_k, use_reranking, 相关性阈值, 检索参数, 索引代号)，
+    值为最终排序后的结果，命中时跳过向量化、检索、阈值过滤和重排序。索引代号由本进程
+    的写代号（ReadWriteLock.generation，每次导入、删除、重建、清空后递增）和所检索快照
+    的磁盘代号组成，后者随其他进程发布的新快照变化；旧代号的条目不会再被命中，按 LRU 淘汰。
+
+    容量按条目数和字节数（结果中文本的 UTF-8 字节数加固定开销的估算）双重限制，
+    超过 max_entry_bytes 的单个结果不缓存。
+    """
+
+    # 每个条目除文本外的估算开销（键、字典、分数等）
+    _ENTRY_OVERHEAD = 256
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 32 * 1024 * 1024,
+                 max_entry_bytes: int = 1024 * 1024):
+        self.max_entries = max(0, max_entries)
+        self.max_bytes = max(0, max_bytes)
+        self.max_entry_bytes = max(0, max_entry_bytes)
+        self._entries = OrderedDict()   # 键 -> (结果, 字节数)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # 累计统计（进程生命周期内）
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    @staticmethod
+    def make_key(query: str, top_k: int, use_reranking: bool, threshold: float,
+                 search_params: Optional[Dict], generation) -> tuple:
+        params = tuple(sorted((search_params or {}).items()))
+        return normalize_query(query), top_k, bool(use_reranking), threshold, params, generation
+
+    @classmethod
+    def _entry_bytes(cls, results: List[Dict]) -> int:
+        size = cls._ENTRY_OVERHEAD
+        for result in results:
+            size += cls._ENTRY_OVERHEAD
+            for value in result.values():
+                if isinstance(value, str):
+                    size += len(value.encode('utf-8'))
+        return size
+
+    def get(self, key: tuple) -> Optional[List[Dict]]:
+        """命中时返回结果列表（调用方不应修改），未命中返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: tuple, results: List[Dict]):
+        if not self.max_entries or not self.max_bytes:
+            return
+        size = self._entry_bytes(results)
+        with self._lock:
+            if size > min(self.max_entry_bytes or size, self.max_bytes):
+                self.rejected += 1
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (results, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'max_entry_bytes': self.max_entry_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'rejected': self.rejected
+            }
+
+
+class RerankScoreCache:
+    """
+    重排序得分缓存
+
+    键为 (重排序模型, 归一化查询的哈希, chunk id, chunk 文本的哈希)，值为 CrossEncoder
+    得分，有界 LRU。哈希取 8 字节 BLAKE2b 摘要，条目常驻内存的开销与文本长度无关。
+    chunk 被删除时按 chunk id 失效（invalidate_chunks）；检测到模型变化时清空全部条目。
+    """
+
+    def __init__(self, max_entries: int = 20000):
+        self.max_entries = max(0, max_entries)
+        self._entries = OrderedDict()   # 键 -> 得分
+        self._by_chunk: Dict[int, set] = {}
+        self._model = None
+        self._lock = threading.Lock()
+
+        # 累计统计（进程生命周期内）
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _digest(text: str) -> bytes:
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+
+    def _switch_model(self, model: str):
+        if model != self._model:
+            if self._model is not None:
+                print(f"🔄 重排序模型变化 ({self._model} -> {model})，清空重排序得分缓存")
+            self._entries.clear()
+            self._by_chunk.clear()
+            self._model = model
+
+    def _keys(self, model: str, query: str, passages: List[Tuple[Optional[int], str]]) -> List[tuple]:
+        query_hash = self._digest(normalize_query(query))
+        return [(model, query_hash, chunk_id, self._digest(content)) for chunk_id, content in passages]
+
+    def get_many(self, model: str, query: str, passages: List[Tuple[Optional[int], str]]) -> Dict[int, float]:
+        """
+        查询缓存的得分
+
+        Args:
+            passages: [(chunk id, chunk 文本)]
+
+        Returns:
+            {passages 中的下标: 得分}，未命中的下标不出现在结果中
+        """
+        keys = self._keys(model, query, passages)
+        found = {}
+        with self._lock:
+            self._switch_model(model)
+            for i, key in enumerate(keys):
+                score = self._entries.get(key)
+                if score is not None:
+                    self._entries.move_to_end(key)
+                    found[i] = score
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, model: str, query: str, passages: List[Tuple[Optional[int], str]], scores: List[float]):
+        if not self.max_entries:
+            return
+        keys = self._keys(model, query, passages)
+        with self._lock:
+            self._switch_model(model)
+            for key, score in zip(keys, scores):
+                self._entries[key] = float(score)
+                self._entries.move_to_end(key)
+                self._by_chunk.setdefault(key[2], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                key, _ = self._entries.popitem(last=False)
+                self._discard_chunk_key(key)
+                self.evictions += 1
+
+    def _discard_chunk_key(self, key: tuple):
+        keys = self._by_chunk.get(key[2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_chunk[key[2]]
+
+    def invalidate_chunks(self, ids: Iterable[int]):
+        """删除这些 chunk 的全部得分"""
+        with self._lock:
+            for chunk_id in ids:
+                for key in self._by_chunk.pop(int(chunk_id), ()):
+                    if self._entries.pop(key, None) is not None:
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_chunk.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'model': self._model,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
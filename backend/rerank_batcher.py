@@ -0,0 +1,146 @@
+# backend/rerank_batcher.py
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Sequence, Tuple
+
+
+class _Request:
+    def __init__(self, pairs: List[Tuple[str, str]]):
+        self.pairs = pairs
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class RerankBatcher:
+    """
+    跨请求合批的重排序服务
+
+    并发的检索各自提交 (query, passage) 对，后台线程从第一个请求到达起最多等待
+    max_wait_ms 毫秒（或凑满 max_batch_size 对），把期间到达的全部请求合并为一次
+    CrossEncoder 前向计算，再把得分按请求拆分交回各调用方。模型在多次小批量
+    推理之间的固定开销被摊薄，并发时 CPU 吞吐明显提高；单个请求最多多等
+    max_wait_ms。
+
+    一个请求的 pair 不会被拆到两个批次中（超过 max_batch_size 时单独成批）。
+    模型推理抛出的异常会交给该批次的每个调用方。
+    """
+
+    def __init__(self, predict: Callable[[List[Tuple[str, str]]], Sequence[float]],
+                 max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        """
+        Args:
+            predict: 批量打分函数（如 CrossEncoder.predict），输入 pair 列表，返回等长得分
+            max_batch_size: 每次前向计算的最大 pair 数
+            max_wait_ms: 第一个请求到达后等待后续请求合批的最长时间（毫秒）
+        """
+        self.predict = predict
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+        # 累计统计（进程生命周期内）
+        self._batches = 0
+        self._pairs = 0
+        self._requests = 0
+        self._max_queue_depth = 0
+        self._total_wait = 0.0
+        self._total_predict = 0.0
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='rerank-batcher', daemon=True)
+            self._thread.start()
+
+    def score(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        """提交 pair 并等待得分（与其他并发请求合批计算），顺序与 pairs 一致"""
+        if not pairs:
+            return []
+        request = _Request(list(pairs))
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("重排序服务已关闭")
+            self._start()
+            self._queue.append(request)
+            self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+            self._cond.notify_all()
+        return request.future.result()
+
+    def _take_batch(self) -> List[_Request]:
+        """等待第一个请求，再在 max_wait 内收集后续请求，直到凑满 max_batch_size 对"""
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return []
+            deadline = self._queue[0].enqueued_at + self.max_wait
+            while True:
+                queued_pairs = sum(len(request.pairs) for request in self._queue)
+                remaining = deadline - time.perf_counter()
+                if queued_pairs >= self.max_batch_size or remaining <= 0 or self._closed:
+                    break
+                self._cond.wait(remaining)
+
+            batch = [self._queue.popleft()]
+            size = len(batch[0].pairs)
+            while self._queue and size + len(self._queue[0].pairs) <= self.max_batch_size:
+                request = self._queue.popleft()
+                batch.append(request)
+                size += len(request.pairs)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            pairs = [pair for request in batch for pair in request.pairs]
+            started = time.perf_counter()
+            try:
+                scores = [float(score) for score in self.predict(pairs)]
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+
+            offset = 0
+            for request in batch:
+                request.future.set_result(scores[offset:offset + len(request.pairs)])
+                offset += len(request.pairs)
+            with self._cond:
+                self._batches += 1
+                self._pairs += len(pairs)
+                self._requests += len(batch)
+                self._total_wait += sum(started - request.enqueued_at for request in batch)
+                self._total_predict += finished - started
+
+    def close(self):
+        """处理完已提交的请求后停止后台线程"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                'queue_depth': len(self._queue),
+                'queued_pairs': sum(len(request.pairs) for request in self._queue),
+                'max_queue_depth': self._max_queue_depth,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'batches': self._batches,
+                'requests': self._requests,
+                'pairs': self._pairs,
+                'avg_batch_pairs': round(self._pairs / self._batches, 2) if self._batches else 0.0,
+                'avg_requests_per_batch': round(self._requests / self._batches, 2) if self._batches else 0.0,
+                'avg_queue_wait_ms': round(self._total_wait / self._requests * 1000, 3) if self._requests else 0.0,
+                'avg_predict_ms': round(self._total_predict / self._batches * 1000, 3) if self._batches else 0.0
+            }
@@ -0,0 +1,138 @@
+# backend/rw_lock.py
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class _WaitStats:
+    """某一类锁的获取次数与等待耗时"""
+
+    def __init__(self):
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float):
+        self.acquired += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def to_dict(self) -> Dict:
+        return {
+            'acquired': self.acquired,
+            'total_wait_ms': round(self.total_wait * 1000, 3),
+            'avg_wait_ms': round(self.total_wait / self.acquired * 1000, 3) if self.acquired else 0.0,
+            'max_wait_ms': round(self.max_wait * 1000, 3)
+        }
+
+
+class ReadWriteLock:
+    """
+    知识库读写锁
+
+    三种持有方式：
+        read()   - 共享：检索时持有，多个检索可以并行
+        write()  - 独占：修改内存中的向量库（写入/删除向量、切换向量库）时短暂持有，
+                   等待进行中的检索结束，期间新的检索排队（写优先，避免写者饿死）
+        writer() - 写者互斥：导入、删除、重建、清空等写操作全程持有，保证同一时刻
+                   只有一个写者；不阻塞检索，耗时的向量化和重建都在其中进行
+
+    同一线程可以重入：持有 writer() 时再进入 writer()，或持有 write() 时再进入
+    read() / write()，都直接通过。各方式的获取次数和等待耗时通过 stats() 查看。
+
+    generation 在每次（最外层）write() 结束时加一：检索结果只在两次 write() 之间有效，
+    结果缓存以此判断是否过期。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing_thread = None
+        self._write_depth = 0
+        self._waiting_writes = 0
+        self.generation = 0
+        self._writer_mutex = threading.RLock()
+        self._metrics = {'read': _WaitStats(), 'write': _WaitStats(), 'writer': _WaitStats()}
+        self._metrics_lock = threading.Lock()
+
+    def _record(self, kind: str, wait: float):
+        with self._metrics_lock:
+            self._metrics[kind].record(wait)
+
+    @contextmanager
+    def read(self):
+        if self._writing_thread == threading.get_ident():
+            yield
+            return
+        started = time.perf_counter()
+        with self._cond:
+            while self._writing_thread is not None or self._waiting_writes:
+                self._cond.wait()
+            self._readers += 1
+        self._record('read', time.perf_counter() - started)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        if self._writing_thread == me:
+            self._write_depth += 1
+            try:
+                yield
+            finally:
+                self._write_depth -= 1
+            return
+        started = time.perf_counter()
+        with self._cond:
+            self._waiting_writes += 1
+            try:
+                while self._writing_thread is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writes -= 1
+            self._writing_thread = me
+        self._record('write', time.perf_counter() - started)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.generation += 1
+                self._writing_thread = None
+                self._cond.notify_all()
+
+    @contextmanager
+    def writer(self, blocking: bool = True):
+        """
+        写者互斥
+
+        blocking=False 时不等待，返回的值表示是否取得（未取得时不执行任何写操作）。
+        """
+        started = time.perf_counter()
+        acquired = self._writer_mutex.acquire(blocking)
+        if acquired:
+            self._record('writer', time.perf_counter() - started)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self._writer_mutex.release()
+
+    def stats(self) -> Dict:
+        with self._metrics_lock:
+            metrics = {kind: stats.to_dict() for kind, stats in self._metrics.items()}
+        with self._cond:
+            metrics.update({
+                'active_readers': self._readers,
+                'waiting_writes': self._waiting_writes,
+                'writing': self._writing_thread is not None,
+                'generation': self.generation
+            })
+        return metrics
@@ -0,0 +1,96 @@
+# backend/stats_cache.py
+
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+class StatsCache:
+    """
+    知识库统计缓存
+
+    缓存向量数、文件数、字节数和每个文件的 chunk 数，在导入、删除、重建时
+    增量更新。/api/kb/stats 和 /api/documents/list 直接读取缓存，不再反序列化
+    索引或逐行读取元数据库，耗时只与文件数相关。
+
+    其他进程对知识库的修改通过两个廉价的版本号发现：向量库的磁盘签名
+    （FaissVectorStore.signature）和元数据库的 data_version，版本变化时
+    调用方才重新加载对应部分。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 文件名 -> 对外返回的文件信息；None 表示尚未读取或已失效
+        self._files: Optional[Dict[str, Dict]] = None
+        self._document_bytes = 0
+        self.metadata_version: Optional[int] = None
+        self.index_signature: Optional[Tuple] = None
+        self.total_vectors = 0
+        self.index_bytes = 0
+
+    # ===== 版本检查 =====
+
+    def index_stale(self, signature: Optional[Tuple]) -> bool:
+        with self._lock:
+            return signature != self.index_signature
+
+    def metadata_stale(self, version: int) -> bool:
+        with self._lock:
+            return self._files is None or version != self.metadata_version
+
+    # ===== 更新 =====
+
+    def set_index(self, signature: Optional[Tuple], total_vectors: int, index_bytes: int):
+        """记录刚保存或加载的向量库"""
+        with self._lock:
+            self.index_signature = signature
+            self.total_vectors = total_vectors
+            self.index_bytes = index_bytes
+
+    def set_files(self, files: Dict[str, Dict], version: int):
+        """整体替换文件列表（首次读取或元数据库被其他进程修改后）"""
+        with self._lock:
+            self._files = dict(files)
+            self._document_bytes = sum(info.get('size') or 0 for info in self._files.values())
+            self.metadata_version = version
+
+    def update_file(self, name: str, info: Optional[Dict]):
+        """单个文件新增、修改（info）或删除（None）"""
+        with self._lock:
+            if self._files is None:
+                return
+            # 已有的文件原位更新，保持列表顺序
+            old = self._files.pop(name, None) if info is None else self._files.get(name)
+            if old is not None:
+                self._document_bytes -= old.get('size') or 0
+            if info is not None:
+                self._files[name] = info
+                self._document_bytes += info.get('size') or 0
+
+    def invalidate_files(self):
+        with self._lock:
+            self._files = None
+
+    # ===== 读取 =====
+
+    def list_files(self, status: Optional[str] = None) -> List[Dict]:
+        with self._lock:
+            files = list(self._files.values()) if self._files is not None else []
+        if status:
+            files = [info for info in files if info.get('status') == status]
+        return files
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            files = list(self._files.values()) if self._files is not None else []
+            status_counts = {}
+            for info in files:
+                status = info.get('status', 'unknown')
+                status_counts[status] = status_counts.get(status, 0) + 1
+            return {
+                'total_chunks': self.total_vectors,
+                'total_files': len(files),
+                'files': files,
+                'status_counts': status_counts,
+                'document_bytes': self._document_bytes,
+                'index_bytes': self.index_bytes
+            }
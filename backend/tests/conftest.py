@@ -0,0 +1,91 @@
+# backend/tests/conftest.py
+
+import hashlib
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# 后端模块以模块名直接导入（与 app.py 相同）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('OPENAI_API_KEY', 'sk-test')
+
+import knowledge_base as kbm  # noqa: E402
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+DIMENSIONS = 64
+
+
+class FakeEmbeddings(Embeddings):
+    """按文本哈希生成确定性向量的假嵌入模型，不访问网络"""
+
+    model = 'text-embedding-3-small'
+
+    def __init__(self, dimensions: int = DIMENSIONS):
+        self.dimensions = dimensions
+        self.calls = 0
+        self.query_calls = 0
+        self.texts = []
+        self.fail_after = None  # 第 N 次 embed_documents 调用时抛出异常，模拟导入中断
+
+    def _vector(self, text: str):
+        seed = int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).standard_normal(self.dimensions).astype('float32').tolist()
+
+    def embed_documents(self, texts):
+        if self.fail_after is not None and self.calls >= self.fail_after:
+            raise RuntimeError('模拟的向量化失败')
+        self.calls += 1
+        self.texts.extend(texts)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        self.query_calls += 1
+        return self._vector(text)
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    fake = FakeEmbeddings()
+    monkeypatch.setattr(kbm.LocalKnowledgeBase, '_init_embeddings', lambda self: fake)
+    return fake
+
+
+@pytest.fixture
+def make_kb(tmp_path, embeddings):
+    """在临时目录中创建知识库；同一测试内多次调用时打开同一个库（模拟重启）"""
+    created = []
+
+    def factory(**kwargs):
+        kwargs.setdefault('embedding_dimensions', DIMENSIONS)
+        kwargs.setdefault('load_max_workers', 1)
+        kwargs.setdefault('query_cache_disk', False)
+        kb = kbm.LocalKnowledgeBase(db_path=str(tmp_path / 'db'), **kwargs)
+        created.append(kb)
+        return kb
+
+    yield factory
+    for kb in created:
+        if kb.vector_store is not None:
+            kb.vector_store.close()
+
+
+@pytest.fixture
+def write_doc(tmp_path):
+    """写入一个测试文档，返回路径"""
+    docs_dir = tmp_path / 'docs'
+    docs_dir.mkdir(exist_ok=True)
+
+    def writer(name: str, text: str) -> str:
+        path = docs_dir / name
+        path.write_text(text, encoding='utf-8')
+        return str(path)
+
+    return writer
+
+
+def paragraphs(tag: str, count: int = 5) -> str:
+    """生成可被分割为多个 chunk 的文本"""
+    return '\n\n'.join(f'{tag} 段落{i} ' + f'{tag} 内容{i} ' * 60 for i in range(count))
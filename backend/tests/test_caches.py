@@ -0,0 +1,105 @@
+# backend/tests/test_caches.py
+
+from conftest import paragraphs
+from embedding_cache import EmbeddingCache
+from query_cache import QueryEmbeddingCache, RerankScoreCache
+
+
+def sources(result):
+    return [item['source'] for item in result['results']]
+
+
+def test_result_cache_hit_and_write_invalidation(make_kb, write_doc, embeddings):
+    kb = make_kb()
+    kb.add_documents([write_doc('a.md', paragraphs('苹果'))])
+    kb.search('橙子 段落1', top_k=3, use_reranking=False)
+    kb.search('  橙子   段落1 ', top_k=3, use_reranking=False)
+    assert kb.result_cache.hits == 1
+
+    kb.add_documents([write_doc('b.md', paragraphs('橙子'))])
+    result = kb.search('橙子 段落1', top_k=3, use_reranking=False)
+
+    assert kb.result_cache.hits == 1
+    assert 'b.md' in sources(result)
+
+
+def test_search_reloads_snapshot_published_by_other_process(make_kb, write_doc):
+    writer = make_kb()
+    writer.add_documents([write_doc('a.md', paragraphs('苹果'))])
+    reader = make_kb()
+    assert set(sources(reader.search('橙子 段落1', top_k=3, use_reranking=False))) == {'a.md'}
+    generation = reader.vector_store.generation
+
+    # 另一个 worker 导入新文档并发布新快照；本进程的写代号不变
+    writer.add_documents([write_doc('b.md', paragraphs('橙子'))])
+    result = reader.search('橙子 段落1', top_k=3, use_reranking=False)
+
+    assert reader.vector_store.generation > generation
+    assert 'b.md' in sources(result)
+
+
+def test_query_embedding_cache_lru_and_normalization():
+    embedded = []
+    cache = QueryEmbeddingCache(max_entries=2, ttl=0)
+
+    def embed(text):
+        embedded.append(text)
+        return [float(len(embedded))]
+
+    cache.get_or_embed('m', '向量 检索', embed)
+    cache.get_or_embed('m', '  向量\u3000检索 ', embed)
+    cache.get_or_embed('m', 'ＨＮＳＷ', embed)
+    cache.get_or_embed('m', '第三个', embed)
+    cache.get_or_embed('m', '向量 检索', embed)
+
+    assert embedded == ['向量 检索', 'HNSW', '第三个', '向量 检索']
+    assert (cache.memory_hits, cache.evictions) == (1, 2)
+    # 模型变化时内存条目全部失效
+    cache.get_or_embed('other', '第三个', embed)
+    assert embedded[-1] == '第三个' and cache.stats()['entries'] == 1
+
+
+def test_query_embedding_disk_tier_survives_restart(tmp_path):
+    disk = EmbeddingCache(tmp_path / 'embedding_cache.sqlite')
+    QueryEmbeddingCache(disk_cache=disk).get_or_embed('m', '查询', lambda text: [1.0, 2.0])
+
+    restarted = QueryEmbeddingCache(disk_cache=disk)
+    vector = restarted.get_or_embed('m', '查询', lambda text: [9.0, 9.0])
+
+    assert list(vector) == [1.0, 2.0] and restarted.disk_hits == 1
+    disk.close()
+
+
+def test_search_reuses_query_embedding(make_kb, write_doc, embeddings):
+    kb = make_kb()
+    kb.add_documents([write_doc('a.md', paragraphs('苹果'))])
+
+    kb.search('苹果 段落1', top_k=1, use_reranking=False)
+    kb.search('苹果 段落1', top_k=3, use_reranking=False)
+
+    assert embeddings.query_calls == 1
+
+
+def test_rerank_score_cache_keys_and_invalidation():
+    cache = RerankScoreCache(max_entries=3)
+    cache.put_many('m', '问题', [(1, '甲'), (2, '乙')], [0.9, 0.1])
+
+    assert cache.get_many('m', ' 问题 ', [(2, '乙'), (1, '甲'), (3, '丙')]) == {0: 0.1, 1: 0.9}
+    # chunk 文本变化（同一 id）或模型变化时不命中
+    assert cache.get_many('m', '问题', [(1, '甲改')]) == {}
+    cache.invalidate_chunks([1])
+    assert cache.get_many('m', '问题', [(1, '甲')]) == {} and cache.invalidations == 1
+    assert cache.get_many('other', '问题', [(2, '乙')]) == {} and cache.stats()['entries'] == 0
+
+
+def test_deleting_document_invalidates_rerank_scores(make_kb, write_doc):
+    kb = make_kb()
+    kb.add_documents([write_doc('a.md', paragraphs('苹果')), write_doc('b.md', paragraphs('橙子'))])
+    ids = kb.vector_store.chunk_ids_for('a.md') + kb.vector_store.chunk_ids_for('b.md')
+    passages = [(doc.metadata['chunk_id'], doc.page_content) for doc in kb.vector_store.get_documents(ids)]
+    kb.rerank_cache.put_many('m', '水果', passages, [1.0] * len(passages))
+
+    kb.delete_document('a.md')
+
+    kept = kb.rerank_cache.get_many('m', '水果', passages)
+    assert {passages[i][0] for i in kept} == set(kb.vector_store.chunk_ids_for('b.md'))
@@ -0,0 +1,47 @@
+# backend/tests/test_checkpoint.py
+
+from conftest import paragraphs
+
+
+def test_resume_after_failed_vectorization(make_kb, write_doc, embeddings, caplog):
+    # 每段向量化一次（checkpoint_interval 个 chunk），第 3 段失败
+    kb = make_kb(checkpoint_interval=4, embedding_batch_size=4, embedding_max_workers=1)
+    path = write_doc('a.md', paragraphs('苹果', 24))
+    embeddings.fail_after = 2
+
+    result = kb.add_documents([path])
+
+    assert result['errors'] and '断点' in result['errors'][0]['error']
+    assert [record.exc_info[1].args[0] for record in caplog.records if record.name == 'knowledge_base'] == [
+        '模拟的向量化失败']
+    entry = kb.checkpoints.get('a.md')
+    assert len(entry['chunk_ids']) == 8
+    assert kb.file_metadata.get('a.md', {}).get('status') != 'indexed'
+
+    # 重启后重新导入：只向量化尚未完成的 chunk
+    embeddings.fail_after = None
+    embedded = len(embeddings.texts)
+    kb = make_kb(checkpoint_interval=4, embedding_batch_size=4, embedding_max_workers=1)
+    result = kb.add_documents([path])
+
+    assert result['errors'] == [] and result['resumed'] == ['a.md']
+    total = len(kb.vector_store.chunk_ids_for('a.md'))
+    assert len(embeddings.texts) - embedded == total - 8
+    assert kb.vector_store.ntotal == total
+    assert kb.file_metadata.get('a.md')['status'] == 'indexed'
+    assert kb.checkpoints.get('a.md') is None
+
+
+def test_changed_file_discards_stale_checkpoint(make_kb, write_doc, embeddings):
+    kb = make_kb(checkpoint_interval=4, embedding_batch_size=4, embedding_max_workers=1)
+    embeddings.fail_after = 1
+    kb.add_documents([write_doc('a.md', paragraphs('苹果', 24))])
+    assert kb.checkpoints.get('a.md') is not None
+
+    embeddings.fail_after = None
+    result = kb.add_documents([write_doc('a.md', paragraphs('香蕉', 6))])
+
+    assert result['errors'] == [] and result['resumed'] == []
+    texts = [doc.page_content for doc in kb.vector_store.get_documents(kb.vector_store.chunk_ids_for('a.md'))]
+    assert texts and all('香蕉' in text for text in texts)
+    assert kb.vector_store.ntotal == len(texts)
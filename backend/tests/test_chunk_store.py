@@ -0,0 +1,59 @@
+# backend/tests/test_chunk_store.py
+
+from langchain_core.documents import Document
+
+from chunk_store import ChunkStore
+
+
+def doc(text, source='a.md', **metadata):
+    return Document(page_content=text, metadata={'source': source, **metadata})
+
+
+def test_round_trip_and_metadata(tmp_path):
+    store = ChunkStore(tmp_path / ChunkStore.FILE)
+    store.put_many([(1, doc('第一段', page=3)), (2, doc('第二段')), (5, doc('其他', source='b.md'))])
+    store.commit()
+
+    found = store.get_many([1, 2, 5, 9])
+    assert set(found) == {1, 2, 5}
+    assert found[1].page_content == '第一段' and found[1].metadata == {'source': 'a.md', 'page': 3}
+    assert store.ids_for_source('a.md') == [1, 2]
+    assert store.max_id() == 5 and len(store) == 3
+    store.close()
+
+
+def test_uncommitted_writes_are_invisible_and_roll_back(tmp_path):
+    writer = ChunkStore(tmp_path / ChunkStore.FILE)
+    writer.put_many([(1, doc('已提交'))])
+    writer.commit()
+    writer.put_many([(2, doc('未提交'))])
+
+    reader = ChunkStore(tmp_path / ChunkStore.FILE, read_only=True)
+    assert set(reader.get_many([1, 2])) == {1}
+
+    writer.rollback()
+    assert writer.get(2) is None and writer.get(1) is not None
+    reader.close()
+    writer.close()
+
+
+def test_tombstones_stay_readable_until_purged(tmp_path):
+    store = ChunkStore(tmp_path / ChunkStore.FILE)
+    store.put_many([(1, doc('旧')), (2, doc('保留'))])
+    store.commit()
+
+    store.delete_many([1], generation=3)
+    store.commit()
+    # 旧快照的读者仍按 id 读取墓碑行，其他查询只返回未删除的行
+    assert store.get(1).page_content == '旧'
+    assert store.existing([1, 2]) == [2] and list(store.ids()) == [2]
+
+    store.purge(oldest_generation=2)
+    assert store.get(1) is not None
+    store.purge(oldest_generation=3)
+    assert store.get(1) is None
+
+    store.delete_before(10, generation=4)
+    store.restore_after(3)
+    assert store.existing([2]) == [2]
+    store.close()
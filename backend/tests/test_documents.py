@@ -0,0 +1,120 @@
+# backend/tests/test_documents.py
+
+from conftest import paragraphs
+
+
+def chunk_texts(kb, filename):
+    store = kb.vector_store
+    return [doc.page_content for doc in store.get_documents(store.chunk_ids_for(filename))]
+
+
+def test_add_and_search(make_kb, write_doc):
+    kb = make_kb()
+    result = kb.add_documents([write_doc('a.md', paragraphs('苹果'))])
+
+    assert result['errors'] == [] and len(result['files']) == 1
+    assert kb.file_metadata.get('a.md')['status'] == 'indexed'
+    texts = chunk_texts(kb, 'a.md')
+    assert texts and all('苹果' in text for text in texts)
+    hits = kb.search('苹果 段落1', top_k=2, use_reranking=False)
+    assert hits['results'] and hits['results'][0]['source'] == 'a.md'
+
+
+def test_unchanged_file_is_skipped(make_kb, write_doc, embeddings):
+    kb = make_kb()
+    path = write_doc('a.md', paragraphs('苹果'))
+    kb.add_documents([path])
+    calls = embeddings.calls
+
+    result = kb.add_documents([path])
+
+    assert result['skipped'] == ['a.md']
+    assert embeddings.calls == calls
+
+
+def test_replace_swaps_vectors(make_kb, write_doc):
+    kb = make_kb()
+    kb.add_documents([write_doc('a.md', paragraphs('苹果'))])
+
+    result = kb.add_documents([write_doc('a.md', paragraphs('香蕉', 3))])
+
+    assert result['replaced'] == ['a.md']
+    texts = chunk_texts(kb, 'a.md')
+    assert texts and all('香蕉' in text and '苹果' not in text for text in texts)
+    assert kb.vector_store.ntotal == len(texts)
+
+
+def test_alias_shares_owner_vectors(make_kb, write_doc, embeddings):
+    kb = make_kb()
+    kb.add_documents([write_doc('a.md', paragraphs('苹果'))])
+    calls = embeddings.calls
+    total = kb.vector_store.ntotal
+
+    kb.add_documents([write_doc('c.md', paragraphs('苹果'))])
+
+    assert kb.file_metadata.get('c.md').get('alias_of') == 'a.md'
+    assert embeddings.calls == calls
+    assert kb.vector_store.ntotal == total
+
+
+def test_delete_owner_hands_vectors_to_alias(make_kb, write_doc):
+    kb = make_kb()
+    kb.add_documents([write_doc('a.md', paragraphs('苹果')), write_doc('c.md', paragraphs('苹果'))])
+
+    kb.delete_document('a.md')
+
+    assert kb.file_metadata.get('a.md') is None
+    assert kb.file_metadata.get('c.md').get('alias_of') is None
+    assert chunk_texts(kb, 'c.md')
+
+
+def test_replace_owner_reembeds_stale_alias(make_kb, write_doc):
+    kb = make_kb()
+    kb.add_documents([write_doc('a.md', paragraphs('苹果')), write_doc('c.md', paragraphs('苹果'))])
+    assert kb.file_metadata.get('c.md').get('alias_of') == 'a.md'
+
+    kb.add_documents([write_doc('a.md', paragraphs('香蕉', 3))])
+
+    # c.md 内容未变，不能继续指向 a.md 的新向量
+    assert kb.file_metadata.get('c.md').get('alias_of') is None
+    assert all('苹果' in text for text in chunk_texts(kb, 'c.md'))
+    assert all('香蕉' in text for text in chunk_texts(kb, 'a.md'))
+
+
+def test_replace_sync_delete_keeps_alias_content(make_kb):
+    kb = make_kb()
+    kb.documents_dir.mkdir(parents=True, exist_ok=True)
+    (kb.documents_dir / 'a.md').write_text(paragraphs('苹果'), encoding='utf-8')
+    (kb.documents_dir / 'c.md').write_text(paragraphs('苹果'), encoding='utf-8')
+    kb.sync_documents()
+    assert kb.file_metadata.get('c.md').get('alias_of') == 'a.md'
+
+    (kb.documents_dir / 'a.md').write_text(paragraphs('香蕉', 3), encoding='utf-8')
+    result = kb.sync_documents()
+
+    assert result['updated'] == 2 and result['unchanged'] == 0
+    assert kb.file_metadata.get('c.md').get('alias_of') is None
+
+    kb.delete_document('a.md')
+
+    texts = chunk_texts(kb, 'c.md')
+    assert texts and all('苹果' in text and '香蕉' not in text for text in texts)
+    assert kb.vector_store.ntotal == len(texts)
+    assert kb.sync_documents()['unchanged'] == 1
+
+
+def test_sync_adds_updates_and_removes(make_kb):
+    kb = make_kb()
+    kb.documents_dir.mkdir(parents=True, exist_ok=True)
+    (kb.documents_dir / 'a.md').write_text(paragraphs('苹果'), encoding='utf-8')
+    (kb.documents_dir / 'b.md').write_text(paragraphs('橙子'), encoding='utf-8')
+    assert kb.sync_documents()['added'] == 2
+
+    (kb.documents_dir / 'a.md').write_text(paragraphs('香蕉'), encoding='utf-8')
+    (kb.documents_dir / 'b.md').unlink()
+    result = kb.sync_documents()
+
+    assert (result['updated'], result['removed'], result['unchanged']) == (1, 1, 0)
+    assert kb.file_metadata.get('b.md') is None
+    assert not kb.vector_store.chunk_ids_for('b.md')
+    assert all('香蕉' in text for text in chunk_texts(kb, 'a.md'))
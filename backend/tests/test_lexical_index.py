@@ -0,0 +1,64 @@
+# backend/tests/test_lexical_index.py
+
+import pytest
+
+from conftest import paragraphs
+from lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_cjk_bigrams_and_words():
+    assert tokenize('HNSW索引参数') == ['hnsw', '索引', '引参', '参数']
+    assert tokenize('Ｆａｉｓｓ 的 IVF_PQ') == ['faiss', '的', 'ivf', 'pq']
+
+
+@pytest.fixture
+def index():
+    index = BM25Index()
+    index.add([1, 2, 3, 4], [
+        '向量索引使用 HNSW 图结构',
+        '倒排索引支持中文分词检索',
+        '中文分词的 bigram 切分',
+        '的 的 的 常见词',
+    ])
+    return index
+
+
+def test_search_ranks_by_bm25_and_filters_weak_matches(index):
+    assert [chunk_id for chunk_id, _ in index.search('中文分词', k=3)] == [3, 2]
+    # 只命中常见词 "的" 的 chunk 被 min_match 过滤
+    assert index.search('的中文分词', k=4, min_match=0.5)[-1][0] != 4
+    assert index.search('完全无关', k=3) == []
+
+
+def test_remove_and_save_round_trip(index, tmp_path):
+    index.save(tmp_path)
+    index.remove([3])
+    index.add([5], ['HNSW 参数 ef_search'])
+    assert [chunk_id for chunk_id, _ in index.search('中文分词', k=3)] == [2]
+
+    index.save(tmp_path)
+    for mmap in (False, True):
+        loaded = BM25Index.load(tmp_path, mmap=mmap)
+        assert len(loaded) == 4
+        assert loaded.search('hnsw', k=3) == index.search('hnsw', k=3)
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+    assert [key for key, _ in fused] == [1, 3, 2]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+
+
+def test_hybrid_search_surfaces_keyword_match(make_kb, write_doc):
+    kb = make_kb()
+    kb.add_documents([write_doc('a.md', paragraphs('苹果')),
+                      write_doc('b.md', '部署说明\n\n使用 IVFPQ 压缩向量并调整 nprobe 参数')])
+    # 假嵌入模型的向量与内容无关：相似度阈值之上没有向量候选，只能由 BM25 召回
+    kb.relevance_threshold = 1.0
+
+    results = kb.search('IVFPQ nprobe', top_k=2, use_reranking=False)['results']
+    assert [result['source'] for result in results] == ['b.md'] and results[0]['rrf_score'] > 0
+
+    vector_only = make_kb(hybrid_search=False)
+    vector_only.relevance_threshold = 1.0
+    assert vector_only.search('IVFPQ nprobe', top_k=2, use_reranking=False)['results'] == []
@@ -0,0 +1,54 @@
+# backend/tests/test_metadata_store.py
+
+import json
+
+from metadata_store import MetadataStore
+
+
+def test_update_merges_fields_and_notifies(tmp_path):
+    changed = []
+    store = MetadataStore(tmp_path / MetadataStore.FILE, on_change=changed.append)
+    store.put('a.md', {'path': '/docs/a.md', 'hash': 'h1', 'status': 'indexed', 'note': '附加字段'})
+    store.update('a.md', chunks=3)
+    store.put('c.md', {'hash': 'h1', 'alias_of': 'a.md', 'status': 'indexed'})
+
+    assert store.get('a.md') == {'path': '/docs/a.md', 'hash': 'h1', 'status': 'indexed',
+                                 'note': '附加字段', 'chunks': 3}
+    assert store.aliases_of('a.md') == ['c.md']
+    assert [name for name, _ in store.items(status='indexed')] == ['a.md', 'c.md']
+    assert changed == ['a.md', 'a.md', 'c.md']
+
+    store.delete('c.md')
+    assert 'c.md' not in store and len(store) == 1 and changed[-1] == 'c.md'
+    store.close()
+
+
+def test_data_version_tracks_other_connections(tmp_path):
+    first = MetadataStore(tmp_path / MetadataStore.FILE)
+    second = MetadataStore(tmp_path / MetadataStore.FILE)
+    version = first.data_version()
+
+    second.put('a.md', {'status': 'indexed'})
+
+    assert first.data_version() != version
+    assert first.get('a.md') == {'status': 'indexed'}
+    first.close()
+    second.close()
+
+
+def test_migrate_json_imports_previews_once(tmp_path):
+    json_file = tmp_path / 'metadata.json'
+    json_file.write_text(json.dumps({
+        'a.md': {'path': '/docs/a.md', 'hash': 'h1', 'status': 'indexed',
+                 'chunks_detail': [{'id': 0, 'content': '第一段'}, {'id': 1, 'content': '第二段'}]},
+        'b.md': {'path': '/docs/b.md', 'doc_count': 4}
+    }, ensure_ascii=False), encoding='utf-8')
+    store = MetadataStore(tmp_path / MetadataStore.FILE)
+
+    assert store.migrate_json(json_file)
+
+    assert store.get('a.md')['chunks'] == 2 and store.get('b.md')['chunks'] == 4
+    assert [preview['content'] for preview in store.get_chunk_previews('a.md')] == ['第一段', '第二段']
+    assert not json_file.exists() and json_file.with_suffix('.json.migrated').exists()
+    assert not store.migrate_json(json_file)
+    store.close()
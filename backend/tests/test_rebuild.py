@@ -0,0 +1,56 @@
+# backend/tests/test_rebuild.py
+
+import pytest
+
+from conftest import paragraphs
+
+
+@pytest.fixture
+def kb(make_kb, write_doc):
+    kb = make_kb()
+    kb.add_documents([write_doc('a.md', paragraphs('苹果')), write_doc('b.md', paragraphs('橙子'))])
+    return kb
+
+
+def test_rebuild_reassigns_chunk_ids(kb):
+    old_ids = set(kb.vector_store.chunk_ids_for('a.md'))
+    total = kb.vector_store.ntotal
+
+    assert kb._rebuild_vector_store()
+
+    assert kb.last_rebuild_error is None
+    assert kb.vector_store.ntotal == total
+    assert not old_ids & set(kb.vector_store.chunk_ids_for('a.md'))
+    assert kb.search('苹果 段落1', top_k=1, use_reranking=False)['results'][0]['source'] == 'a.md'
+
+
+def test_failed_rebuild_keeps_serving_old_store(kb, monkeypatch):
+    previous = kb.vector_store
+    old_ids = kb.vector_store.chunk_ids_for('a.md')
+    add_vectors = kb._add_vectors_to_store
+    load_vector_store = kb.load_vector_store
+    searched = []
+
+    def failing_add(docs, vectors):
+        add_vectors(docs, vectors)
+        raise RuntimeError('模拟的重建失败')
+
+    def reload_after_search():
+        # 切换到重新加载的库之前，检索仍由旧库提供
+        searched.append(kb.search('苹果 段落2', top_k=1, use_reranking=False))
+        load_vector_store()
+
+    monkeypatch.setattr(kb, '_add_vectors_to_store', failing_add)
+    monkeypatch.setattr(kb, 'load_vector_store', reload_after_search)
+
+    assert kb._rebuild_vector_store() is False
+
+    assert '模拟的重建失败' in kb.last_rebuild_error
+    assert 'error' not in searched[0] and searched[0]['results'][0]['source'] == 'a.md'
+    assert kb.vector_store is not previous
+    assert kb.vector_store.chunk_ids_for('a.md') == old_ids
+    assert len(kb.vector_store.chunks) == kb.vector_store.ntotal
+    # 被取代的旧库已关闭，快照持有随之释放
+    assert previous.chunks._conn is None and previous._holder is None
+    result = kb.search('橙子 段落3', top_k=1, use_reranking=False)
+    assert result['results'][0]['source'] == 'b.md'
@@ -0,0 +1,81 @@
+# backend/tests/test_snapshots.py
+
+import os
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+import vector_store as vs
+from vector_store import FaissVectorStore
+
+DIM = 8
+
+
+def add(store, source, texts):
+    vectors = np.random.default_rng(len(store.files)).standard_normal((len(texts), DIM))
+    return store.add_file_chunks(source, [Document(page_content=t) for t in texts], vectors.tolist())
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / 'vector_store'
+
+
+def test_reader_keeps_its_generation_while_writer_publishes(path):
+    writer = FaissVectorStore.create(path, DIM)
+    old_ids = add(writer, 'a.md', ['旧内容'])
+    writer.save(path)
+    reader = FaissVectorStore.load(path)
+
+    writer.remove_file('a.md')
+    add(writer, 'b.md', ['新内容'])
+    writer.save(path)
+    for _ in range(FaissVectorStore.KEEP_GENERATIONS + 1):
+        writer.save(path)
+
+    # 读者持有的一代及其 chunk 墓碑不会被回收
+    assert reader.generation in FaissVectorStore._generations(path)
+    assert reader.get_documents(old_ids)[0].page_content == '旧内容'
+    assert FaissVectorStore.load(path).chunk_ids_for('a.md') == []
+
+    stale = reader.generation
+    reader.close()
+    writer.save(path)
+    assert stale not in FaissVectorStore._generations(path)
+    assert writer.chunks.get(old_ids[0]) is None
+    writer.close()
+
+
+def test_lease_held_by_another_process_blocks_collection(path):
+    writer = FaissVectorStore.create(path, DIM)
+    add(writer, 'a.md', ['内容'])
+    writer.save(path)
+    generation = writer.generation
+    # 另一个进程的读者：独立打开的租约文件上的共享锁
+    lease = vs._acquire_lease(path, generation)
+
+    for _ in range(FaissVectorStore.KEEP_GENERATIONS + 1):
+        writer.save(path)
+    assert generation in FaissVectorStore._generations(path)
+
+    os.close(lease)
+    writer.save(path)
+    assert generation not in FaissVectorStore._generations(path)
+    writer.close()
+
+
+def test_destroy_keeps_held_snapshot_until_released(path):
+    writer = FaissVectorStore.create(path, DIM)
+    ids = add(writer, 'a.md', ['内容'])
+    writer.save(path)
+    reader = FaissVectorStore.load(path)
+    writer.close()
+
+    FaissVectorStore.destroy(path)
+
+    assert not FaissVectorStore.exists(path)
+    assert reader.get_documents(ids)[0].page_content == '内容'
+    reader.close()
+    FaissVectorStore.destroy(path)
+    assert FaissVectorStore._generations(path) == []
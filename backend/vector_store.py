@@ -0,0 +1,1059 @@
+# backend/vector_store.py
+
+import json
+import math
+import os
+import shutil
+import threading
+import weakref
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows：只能跟踪本进程内的读者
+    fcntl = None
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from chunk_store import ChunkFileReader, ChunkStore
+from lexical_index import BM25Index
+
+
+# chunk id 的低位存放文件内序号，高位存放文件 id：
+#   chunk_id = file_id << CHUNK_ID_BITS | seq
+# 这样每个 chunk 的 id 稳定且能直接映射回来源文件
+CHUNK_ID_BITS = 20
+MAX_CHUNKS_PER_FILE = 1 << CHUNK_ID_BITS
+
+
+def make_chunk_id(file_id: int, seq: int) -> int:
+    """由文件 id 和文件内序号生成 chunk id"""
+    if seq >= MAX_CHUNKS_PER_FILE:
+        raise ValueError(f"单个文件的 chunk 数超过上限 {MAX_CHUNKS_PER_FILE}")
+    return (file_id << CHUNK_ID_BITS) | seq
+
+
+def file_id_of(chunk_id: int) -> int:
+    """从 chunk id 取出文件 id"""
+    return chunk_id >> CHUNK_ID_BITS
+
+
+# 支持的索引类型：
+#   flat  - 精确检索（IndexFlatL2 / IndexFlatIP），检索耗时与向量数成正比
+#   ivf   - 倒排聚类（IndexIVFFlat），检索时只扫描 nprobe 个聚类
+#   hnsw  - 图索引（IndexHNSWFlat），无需训练，不支持删除（删除的向量记为墓碑）
+#   ivfpq - 倒排 + 乘积量化（IndexIVFPQ），向量压缩存储，内存占用最小
+#   sq8    - 标量量化（IndexScalarQuantizer，每维 1 字节），内存约为 flat 的 1/4
+#   sqfp16 - 半精度存储（每维 2 字节），内存约为 flat 的 1/2
+# sq8 / sqfp16 在量化向量上精确扫描，候选再用保存在 chunk 库中的 float32 原始向量重排
+INDEX_TYPES = ('flat', 'ivf', 'hnsw', 'ivfpq', 'sq8', 'sqfp16')
+
+# 需要保存原始向量、检索时精确重排的索引类型
+RESCORED_INDEX_TYPES = ('sq8', 'sqfp16')
+
+# 倒排索引：IO_FLAG_MMAP 映射倒排表（向量编码所在），其余类型的编码须用 IO_FLAG_MMAP_IFC
+# （faiss-cpu >= 1.10）映射，否则 IO_FLAG_MMAP 仍会把编码读入进程内存
+IVF_INDEX_TYPES = ('ivf', 'ivfpq')
+
+DEFAULT_INDEX_PARAMS = {
+    'nlist': None,          # IVF 聚类数，None 时按向量数自动选择（约 4 * sqrt(n)）
+    'nprobe': 16,           # IVF 检索时扫描的聚类数
+    'hnsw_m': 32,           # HNSW 每个节点的邻居数
+    'ef_construction': 40,  # HNSW 建图时的候选队列长度
+    'ef_search': 64,        # HNSW 检索时的候选队列长度
+    'pq_m': None,           # PQ 子向量数，None 时自动选择能整除维度的值
+    'pq_nbits': 8,          # 每个子向量的编码位数
+    'rescore_factor': 4,    # 量化索引先取 k * rescore_factor 个候选再用原始向量重排，0 表示不重排
+}
+
+# 相似度度量：
+#   l2     - 欧氏距离（平方），越小越相似；早期版本的向量库均为此度量
+#   cosine - 写入和检索时把向量 L2 归一化，使用内积索引，得分即余弦相似度 [-1, 1]，越大越相似
+METRICS = ('l2', 'cosine')
+
+# k-means 训练时每个聚类至少需要的样本数（FAISS 的建议值）
+MIN_POINTS_PER_CENTROID = 39
+
+
+def _auto_nlist(num_vectors: int) -> int:
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // MIN_POINTS_PER_CENTROID))
+
+
+def _auto_pq_m(dim: int) -> int:
+    return next(m for m in (64, 48, 32, 24, 16, 12, 8, 4, 2, 1) if dim % m == 0)
+
+
+def normalize_vectors(matrix: np.ndarray) -> np.ndarray:
+    """按行 L2 归一化（返回 float32 副本，零向量保持不变）"""
+    matrix = np.array(matrix, dtype=np.float32, copy=True)
+    if len(matrix):
+        faiss.normalize_L2(matrix)
+    return matrix
+
+
+def _training_sample(matrix: np.ndarray, train_sample_size: int) -> np.ndarray:
+    if len(matrix) <= train_sample_size:
+        return matrix
+    rows = np.random.default_rng(0).choice(len(matrix), train_sample_size, replace=False)
+    return matrix[np.sort(rows)]
+
+
+def exact_scores(query: np.ndarray, matrix: np.ndarray, metric: str) -> np.ndarray:
+    """float32 精确得分：l2 为平方欧氏距离，cosine 为内积（向量均已归一化）"""
+    if metric == 'cosine':
+        return matrix @ query
+    return ((matrix - query) ** 2).sum(axis=1)
+
+
+def build_index(index_type: str, dim: int, ids: np.ndarray, matrix: np.ndarray,
+                params: Optional[Dict] = None, train_sample_size: int = 100_000,
+                metric: str = 'l2') -> Tuple[object, str, Dict]:
+    """
+    按索引类型构建索引并写入全部向量
+
+    IVF 类索引先在随机抽取的 train_sample_size 个向量上训练聚类中心（及 PQ 码本），
+    向量数不足以训练时退回 flat。metric 为 cosine 时使用内积索引，matrix 须已归一化。
+
+    Returns:
+        (索引, 实际使用的索引类型, 实际使用的参数)
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"不支持的索引类型: {index_type}（可选: {', '.join(INDEX_TYPES)}）")
+    if metric not in METRICS:
+        raise ValueError(f"不支持的相似度度量: {metric}（可选: {', '.join(METRICS)}）")
+    faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == 'cosine' else faiss.METRIC_L2
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    num_vectors = len(ids)
+
+    if index_type in ('ivf', 'ivfpq'):
+        params['nlist'] = params['nlist'] or _auto_nlist(num_vectors)
+        if index_type == 'ivfpq':
+            params['pq_m'] = params['pq_m'] or _auto_pq_m(dim)
+        min_points = max(params['nlist'], 2 ** params['pq_nbits'] if index_type == 'ivfpq' else 1)
+        if num_vectors < min_points:
+            print(f"⚠️ 向量数 {num_vectors} 不足以训练 {index_type} 索引（至少 {min_points}），使用 flat")
+            index_type = 'flat'
+    elif index_type == 'sq8' and not num_vectors:
+        print("⚠️ 没有向量可用于训练 sq8 的量化范围，使用 flat")
+        index_type = 'flat'
+
+    if index_type == 'flat':
+        index = faiss.IndexIDMap2(faiss.IndexFlat(dim, faiss_metric))
+    elif index_type == 'hnsw':
+        base = faiss.IndexHNSWFlat(dim, params['hnsw_m'], faiss_metric)
+        base.hnsw.efConstruction = params['ef_construction']
+        index = faiss.IndexIDMap2(base)
+    elif index_type in RESCORED_INDEX_TYPES:
+        quantizer_type = faiss.ScalarQuantizer.QT_8bit if index_type == 'sq8' else faiss.ScalarQuantizer.QT_fp16
+        base = faiss.IndexScalarQuantizer(dim, quantizer_type, faiss_metric)
+        if index_type == 'sq8':
+            # 训练每一维的取值范围；之后写入的超出范围的值会被截断，由重排弥补
+            base.train(_training_sample(matrix, train_sample_size))
+        index = faiss.IndexIDMap2(base)
+    else:
+        # IVF 原生支持 add_with_ids / remove_ids，不需要 IndexIDMap2；
+        # 哈希表形式的 direct map 让 reconstruct 可以按 chunk id 取回向量
+        quantizer = faiss.IndexFlat(dim, faiss_metric)
+        if index_type == 'ivf':
+            index = faiss.IndexIVFFlat(quantizer, dim, params['nlist'], faiss_metric)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, params['nlist'], params['pq_m'], params['pq_nbits'],
+                                     faiss_metric)
+        sample = _training_sample(matrix, train_sample_size)
+        print(f"  🎯 训练 {index_type} 索引: {len(sample)} 个样本, nlist={params['nlist']}")
+        index.train(sample)
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+
+    if num_vectors:
+        index.add_with_ids(matrix, ids)
+    return index, index_type, params
+
+
+def search_parameters(index_type: str, params: Dict):
+    """把 nprobe / ef_search 转成 FAISS 的检索参数对象（按请求传入，不修改共享索引）"""
+    if index_type in ('ivf', 'ivfpq') and params.get('nprobe'):
+        return faiss.SearchParametersIVF(nprobe=int(params['nprobe']))
+    if index_type == 'hnsw' and params.get('ef_search'):
+        return faiss.SearchParametersHNSW(efSearch=int(params['ef_search']))
+    return None
+
+
+# 本进程内各向量库对象正在使用的快照：(向量库目录, 代号) -> [引用数, 租约文件描述符]
+_held_generations: Dict[Tuple[str, int], list] = {}
+_held_lock = threading.Lock()
+
+# 跨进程的读者租约：leases/gen-<代号>.lease，持有快照的进程对其加共享锁（flock），
+# 回收前须能加上排他锁；进程退出（包括崩溃）时由操作系统自动释放
+LEASE_DIR = "leases"
+
+
+def _lease_file(path: Path, generation: int) -> Path:
+    return Path(path) / LEASE_DIR / f"gen-{generation:06d}.lease"
+
+
+def _acquire_lease(path: Path, generation: int) -> Optional[int]:
+    if fcntl is None:
+        return None
+    lease = _lease_file(path, generation)
+    lease.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(lease, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH)
+    except OSError:
+        os.close(fd)
+        raise
+    return fd
+
+
+def _try_reclaim_lease(path: Path, generation: int) -> Optional[int]:
+    """对快照的租约加排他锁（不等待）：成功时返回文件描述符，仍有读者（任何进程）时返回 None"""
+    if fcntl is None:
+        return -1
+    lease = _lease_file(path, generation)
+    lease.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(lease, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _hold_generation(path: Path, generation: int) -> Tuple[str, int]:
+    key = (str(Path(path).resolve()), generation)
+    with _held_lock:
+        entry = _held_generations.get(key)
+        if entry is None:
+            entry = _held_generations[key] = [0, _acquire_lease(path, generation)]
+        entry[0] += 1
+    return key
+
+
+def _release_generation(key: Tuple[str, int]):
+    with _held_lock:
+        entry = _held_generations.get(key)
+        if entry is None:
+            return
+        entry[0] -= 1
+        if entry[0] <= 0:
+            del _held_generations[key]
+            if entry[1] is not None:
+                os.close(entry[1])
+
+
+def held_generations(path: Path) -> List[int]:
+    """本进程内仍被向量库对象使用的快照代号"""
+    resolved = str(Path(path).resolve())
+    with _held_lock:
+        return sorted(generation for (held_path, generation) in _held_generations if held_path == resolved)
+
+
+def _fsync(path: Path):
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+class FaissVectorStore:
+    """
+    以 chunk id 为键的 FAISS 向量库
+
+    与 LangChain FAISS 不同，这里向量以稳定的 int64 chunk id 存入索引，
+    并记录每个来源文件分配到的 id，删除文件时直接 remove_ids，
+    无需重新加载、分割和向量化整个语料。chunk 文本保存在 ChunkStore（SQLite）
+    中，检索时只读取 Top-k 候选的文本。
+
+    新建的向量库使用 flat 索引；build_ann_index 可以把全部向量转入
+    IVF / HNSW / IVF-PQ 索引（见 INDEX_TYPES），之后的增量写入直接进入新索引。
+    metric 为 cosine 时向量在写入和检索前归一化，检索得分为余弦相似度（见 METRICS）；
+    with_metric 可以把已有向量转换到另一种度量，不重新向量化。
+    chunk 文本同时写入 BM25 倒排索引（见 BM25Index），lexical_search 按词项检索，
+    与向量检索互补（型号、缩写等精确词项）。
+
+    load(path, mmap=True) 以只读方式映射索引中的向量编码和 chunk 库，多个进程
+    共享操作系统页缓存（hnsw 的邻接图等结构仍在各进程内存中，见 _read_index_mmap）；
+    第一次写入前会自动从磁盘完整加载为可写的内存副本。
+
+    磁盘上按代（generation）保存快照：每次保存把索引和 store.json 写入临时目录，
+    原子重命名为 gen-<代号>/，再原子替换指针文件 CURRENT。崩溃只会留下未发布的
+    临时目录，读者始终看到完整的某一代；正在使用旧代的读者不受影响，旧代在
+    任何进程都不再持有（leases/ 下的租约文件加共享锁，见 _acquire_lease）、且不在
+    最近 KEEP_GENERATIONS 代之内时才被回收。
+    chunk 文本共用一个 chunks.sqlite，删除以代号标记（见 ChunkStore）。
+    """
+
+    INDEX_FILE = "index.faiss"
+    STORE_FILE = "store.json"
+    CURRENT_FILE = "CURRENT"
+    GENERATION_PREFIX = "gen-"
+    # 保留最近几代快照，供其他进程中尚未切换的读者使用
+    KEEP_GENERATIONS = 2
+    # 旧版 chunk 文本文件，加载时迁移到 ChunkStore
+    LEGACY_CHUNKS_FILE = "chunks.dat"
+    LEGACY_CHUNKS_INDEX_FILE = "chunks.idx"
+
+    # 迁移旧数据时每批写入的 chunk 数
+    _MIGRATE_BATCH = 1000
+
+    def __init__(self,
+                 dim: int,
+                 chunks: ChunkStore,
+                 index=None,
+                 files: Optional[Dict[str, Dict]] = None,
+                 next_file_id: int = 1,
+                 index_type: str = 'flat',
+                 index_params: Optional[Dict] = None,
+                 deleted: Optional[List[int]] = None,
+                 metric: str = 'l2',
+                 lexical: Optional[BM25Index] = None):
+        """
+        Args:
+            dim: 向量维度
+            chunks: chunk 文本存储
+            index: 已有的 faiss 索引（为 None 时按 metric 创建 flat 索引）
+            files: 来源文件名 -> {'file_id': int, 'count': 已分配的序号数}
+            next_file_id: 下一个可分配的文件 id
+            index_type: 索引类型（INDEX_TYPES 之一）
+            index_params: 构建索引时使用的参数，也是检索参数的默认值
+            deleted: 已删除但仍留在索引中的 chunk id（HNSW 不支持删除）
+            metric: 相似度度量（METRICS 之一）
+            lexical: 已有的 BM25 倒排索引（为 None 时新建空索引）
+        """
+        if metric not in METRICS:
+            raise ValueError(f"不支持的相似度度量: {metric}（可选: {', '.join(METRICS)}）")
+        self.dim = dim
+        self.chunks = chunks
+        self.metric = metric
+        if index is None:
+            index, _, _ = build_index('flat', dim, np.zeros(0, dtype=np.int64),
+                                      np.zeros((0, dim), dtype=np.float32), metric=metric)
+        self.index = index
+        self.files = files if files is not None else {}
+        self.next_file_id = next_file_id
+        self.index_type = index_type
+        self.index_params = {**DEFAULT_INDEX_PARAMS, **(index_params or {})}
+        self.deleted = set(deleted or [])
+        self.lexical = lexical if lexical is not None else BM25Index()
+        # 加载或保存时记录向量库目录（mmap 只读加载的库写入前据此重新加载）
+        self.path: Optional[Path] = None
+        self.read_only = False
+        # 内存中的内容基于哪一代快照（新建且从未保存过的库为 None）
+        self.generation: Optional[int] = None
+        # 保存时删除 id 小于该值的 chunk（替换整个旧库时使用）
+        self._drop_chunks_before: Optional[int] = None
+        # 持有 generation 对应的快照，对象关闭或被回收时释放
+        self._holder = None
+
+    def _hold(self, path: Path, generation: Optional[int], key: Optional[Tuple[str, int]] = None):
+        """登记本对象正在使用某一代快照（先释放之前持有的）；key 为已取得的持有"""
+        self._release()
+        if key is None and generation is not None:
+            key = _hold_generation(path, generation)
+        if key is not None:
+            self._holder = weakref.finalize(self, _release_generation, key)
+
+    def _release(self):
+        if self._holder is not None:
+            self._holder()
+            self._holder = None
+
+    @property
+    def _pending_generation(self) -> int:
+        """下一次保存将发布的代号（chunk 墓碑据此标记）"""
+        return (self.generation or 0) + 1
+
+    def _make_writable(self):
+        """mmap 只读加载的向量库在第一次写入前从磁盘完整加载到内存"""
+        if not self.read_only:
+            return
+        print(f"🔓 向量库转为可写：从磁盘完整加载 {self.path}")
+        writable = type(self).load(self.path)
+        # 接管 writable 对快照的持有，改为随本对象释放
+        holder, writable._holder = writable._holder, None
+        self._release()
+        self.chunks.close()
+        self.__dict__.update(writable.__dict__)
+        if holder is not None:
+            _, func, args, _ = holder.detach()
+            self._holder = weakref.finalize(self, func, *args)
+
+    @classmethod
+    def create(cls, path: Path, dim: int, metric: str = 'l2') -> "FaissVectorStore":
+        """
+        在 path 下新建空向量库（尚未保存）
+
+        chunk 库中残留的 chunk 全部标记删除；新库从已使用过的最大 id 之后分配，
+        不会与旧快照的读者仍在读取的 chunk 冲突。
+        """
+        chunks = ChunkStore(Path(path) / ChunkStore.FILE)
+        store = cls(dim, chunks, next_file_id=file_id_of(chunks.max_id()) + 1, metric=metric)
+        store.generation = cls.current_generation(path)
+        chunks.clear(store._pending_generation)
+        return store
+
+    def successor(self, dim: int, metric: Optional[str] = None) -> "FaissVectorStore":
+        """
+        创建替换本库的空向量库（全量重建时使用，metric 为 None 时沿用本库的度量）
+
+        新库共用本库的 chunk 库，并从本库的 next_file_id 之后分配 id，新旧 chunk id
+        不会冲突；新库保存时才标记删除本库的 chunk，旧快照的读者仍能读到旧数据。
+        """
+        self._make_writable()
+        store = type(self)(dim, self.chunks, next_file_id=self.next_file_id, metric=metric or self.metric)
+        store.generation = self.generation
+        store._drop_chunks_before = make_chunk_id(self.next_file_id, 0)
+        return store
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal - len(self.deleted)
+
+    def chunk_ids_for(self, source: str) -> List[int]:
+        """返回某个来源文件当前拥有的全部 chunk id"""
+        if source not in self.files:
+            return []
+        return self.chunks.ids_for_source(source)
+
+    def get_documents(self, ids: List[int]) -> List[Document]:
+        """按 chunk id 读取文本，顺序与 ids 一致（不存在的 id 跳过）"""
+        found = self.chunks.get_many(ids)
+        return [found[chunk_id] for chunk_id in ids if chunk_id in found]
+
+    def add_file_chunks(self, source: str, docs: List[Document], vectors: List[List[float]]) -> List[int]:
+        """
+        追加某个文件的 chunk 及向量
+
+        同一文件多次追加时序号连续递增，返回本次分配的 chunk id。
+        """
+        if not docs:
+            return []
+        self._make_writable()
+        entry = self.files.get(source)
+        if entry is None:
+            entry = {'file_id': self.next_file_id, 'count': 0}
+            self.files[source] = entry
+            self.next_file_id += 1
+
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.shape != (len(docs), self.dim):
+            raise ValueError(f"向量维度 {matrix.shape[-1]} 与向量库维度 {self.dim} 不一致，不能混用")
+        ids = [make_chunk_id(entry['file_id'], entry['count'] + i) for i in range(len(docs))]
+        if self.metric == 'cosine':
+            matrix = normalize_vectors(matrix)
+        self.index.add_with_ids(matrix, np.asarray(ids, dtype=np.int64))
+        entry['count'] += len(docs)
+
+        for chunk_id, doc in zip(ids, docs):
+            doc.metadata['source'] = source
+            doc.metadata['chunk_id'] = chunk_id
+        # 量化索引另存原始向量，供检索时精确重排
+        self.chunks.put_many(zip(ids, docs), matrix if self.index_type in RESCORED_INDEX_TYPES else None)
+        self.lexical.add(ids, (doc.page_content for doc in docs))
+        return ids
+
+    def remove_file(self, source: str) -> int:
+        """删除某个来源文件的全部向量，返回删除的数量"""
+        removed = self.remove_chunks(self.chunk_ids_for(source))
+        self.files.pop(source, None)
+        return removed
+
+    def remove_chunks(self, ids: List[int]) -> int:
+        """按 chunk id 删除向量（文件的 id 分配记录保持不变）"""
+        if not ids:
+            return 0
+        self._make_writable()
+        if self.index_type == 'hnsw':
+            # HNSW 图不支持删除：记为墓碑，检索时跳过，下次重建索引时清除
+            live = [chunk_id for chunk_id in self.chunks.existing(ids) if chunk_id not in self.deleted]
+            self.deleted.update(live)
+            removed = len(live)
+        else:
+            removed = self.index.remove_ids(np.asarray(ids, dtype=np.int64))
+        self.chunks.delete_many(ids, self._pending_generation)
+        self.lexical.remove(ids)
+        return int(removed)
+
+    def rename_file(self, source: str, new_source: str):
+        """把某个文件的向量转到新的来源文件名下（不改动向量本身）"""
+        self._make_writable()
+        entry = self.files.pop(source, None)
+        if entry is None:
+            return
+        self.files[new_source] = entry
+        self.chunks.rename_source(source, new_source)
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               search_params: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """
+        按向量检索，返回 (Document, 得分) 列表（只读取命中的 chunk 文本）
+
+        得分随 metric 而定：l2 为平方欧氏距离（越小越相似），cosine 为余弦相似度（越大越相似）。
+
+        Args:
+            embedding: 查询向量
+            k: 返回数量
+            search_params: 本次检索的 nprobe（IVF）/ ef_search（HNSW）/ rescore_factor（sq8 / sqfp16），
+                           未传入时使用建索引时的参数
+        """
+        if self.ntotal == 0:
+            return []
+        query = np.asarray([embedding], dtype=np.float32)
+        if query.shape[1] != self.dim:
+            raise ValueError(f"查询向量维度 {query.shape[1]} 与向量库维度 {self.dim} 不一致")
+        if self.metric == 'cosine':
+            query = normalize_vectors(query)
+        search_params = {**self.index_params, **(search_params or {})}
+        params = search_parameters(self.index_type, search_params)
+        rescore_factor = int(search_params.get('rescore_factor') or 0)
+        if self.index_type not in RESCORED_INDEX_TYPES:
+            rescore_factor = 0
+        shortlist = k * rescore_factor if rescore_factor > 1 else k
+        # 墓碑仍会被检索到，多取一些再过滤
+        fetch = min(shortlist + len(self.deleted), self.index.ntotal)
+        distances, labels = self.index.search(query, fetch, params=params)
+        hits = [
+            (int(chunk_id), float(distance))
+            for distance, chunk_id in zip(distances[0], labels[0])
+            if chunk_id != -1 and int(chunk_id) not in self.deleted
+        ][:shortlist]
+        if rescore_factor:
+            hits = self._rescore(query[0], hits)[:k]
+        docs = self.chunks.get_many(chunk_id for chunk_id, _ in hits)
+        return [(docs[chunk_id], distance) for chunk_id, distance in hits if chunk_id in docs]
+
+    def lexical_search(self, query: str, k: int = 4, min_match: float = 0.0) -> List[Tuple[Document, float]]:
+        """
+        按 BM25 检索，返回 (Document, 得分) 列表，得分越大越相关（只读取命中的 chunk 文本）
+
+        min_match 见 BM25Index.search：chunk 至少包含的查询词项比例（按 idf 加权）
+        """
+        hits = self.lexical.search(query, k, min_match=min_match)
+        docs = self.chunks.get_many(chunk_id for chunk_id, _ in hits)
+        return [(docs[chunk_id], score) for chunk_id, score in hits if chunk_id in docs]
+
+    def scores_for(self, embedding: List[float], ids: List[int]) -> Dict[int, float]:
+        """
+        查询向量与指定 chunk 的精确得分（与 similarity_search_with_score_by_vector 的得分同一量纲），
+        用于给只被 BM25 命中的 chunk 补上向量得分；已删除或不在索引中的 id 不出现在结果中
+        """
+        ids = [int(chunk_id) for chunk_id in ids if int(chunk_id) not in self.deleted]
+        if not ids or self.ntotal == 0:
+            return {}
+        query = np.asarray(embedding, dtype=np.float32)
+        if self.metric == 'cosine':
+            query = normalize_vectors(query[None, :])[0]
+        vectors = self.chunks.get_vectors(ids) if self.index_type in RESCORED_INDEX_TYPES else {}
+        missing = np.asarray([chunk_id for chunk_id in ids if chunk_id not in vectors], dtype=np.int64)
+        if len(missing):
+            try:
+                vectors.update(zip(missing.tolist(), self.index.reconstruct_batch(missing)))
+            except RuntimeError:
+                # 索引不支持按 id 取回向量（或 id 不在索引中）时逐个尝试
+                for chunk_id in missing.tolist():
+                    try:
+                        vectors[chunk_id] = self.index.reconstruct(chunk_id)
+                    except RuntimeError:
+                        pass
+        if not vectors:
+            return {}
+        found = list(vectors)
+        matrix = np.stack([np.asarray(vectors[chunk_id], dtype=np.float32) for chunk_id in found])
+        return dict(zip(found, exact_scores(query, matrix, self.metric).tolist()))
+
+    def _rescore(self, query: np.ndarray, hits: List[Tuple[int, float]]) -> List[Tuple[int, float]]:
+        """用 chunk 库中的 float32 原始向量重新计算候选得分并排序（没有原始向量的候选保留近似得分）"""
+        vectors = self.chunks.get_vectors(chunk_id for chunk_id, _ in hits)
+        exact = [chunk_id for chunk_id, _ in hits if chunk_id in vectors]
+        scores = dict(hits)
+        if exact:
+            matrix = np.stack([vectors[chunk_id] for chunk_id in exact])
+            scores.update(zip(exact, exact_scores(query, matrix, self.metric).tolist()))
+        return sorted(scores.items(), key=lambda item: item[1], reverse=self.metric == 'cosine')
+
+    def export_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        取回全部有效向量（按 chunk id 排序）
+
+        flat / ivf / hnsw 返回写入索引的向量（cosine 时为归一化后的向量）；
+        sq8 / sqfp16 优先读取 chunk 库中的原始向量；ivfpq 返回的是量化后的近似值。
+        """
+        ids = self.chunks.ids()
+        if self._drop_chunks_before is not None:
+            # 全量重建中的新库：共用的 chunk 库里还有旧库的 chunk
+            ids = ids[ids >= self._drop_chunks_before]
+        if self.deleted:
+            ids = ids[~np.isin(ids, np.asarray(sorted(self.deleted), dtype=np.int64))]
+        if len(ids) == 0:
+            return ids, np.zeros((0, self.dim), dtype=np.float32)
+        matrix = self.index.reconstruct_batch(ids)
+        if self.index_type in RESCORED_INDEX_TYPES:
+            vectors = self.chunks.get_vectors(ids)
+            for row, chunk_id in enumerate(ids.tolist()):
+                if chunk_id in vectors:
+                    matrix[row] = vectors[chunk_id]
+        return ids, matrix
+
+    def memory_usage(self) -> Dict:
+        """索引中向量编码的内存占用（估算）与同样数量的 float32 向量对比"""
+        base = self.index.index if isinstance(self.index, faiss.IndexIDMap2) else self.index
+        try:
+            code_size = faiss.downcast_index(base).sa_code_size()
+        except Exception:
+            code_size = self.dim * 4
+        vector_bytes = self.index.ntotal * code_size
+        float32_bytes = self.index.ntotal * self.dim * 4
+        return {
+            'index_type': self.index_type,
+            'vector_bytes': vector_bytes,
+            'float32_bytes': float32_bytes,
+            'saved_ratio': round(1 - vector_bytes / float32_bytes, 3) if float32_bytes else 0.0,
+            'lexical_bytes': self.lexical.memory_bytes()
+        }
+
+    def build_ann_index(self, index_type: str, params: Optional[Dict] = None, train_sample_size: int = 100_000):
+        """把全部向量重新写入指定类型的索引（IVF 类在抽样向量上训练），同时清除墓碑"""
+        self._make_writable()
+        ids, matrix = self.export_vectors()
+        self.index, self.index_type, self.index_params = build_index(
+            index_type, self.dim, ids, matrix, params, train_sample_size, metric=self.metric
+        )
+        self.deleted = set()
+        self._store_raw_vectors(ids, matrix)
+        print(f"✅ 已构建 {self.index_type} 索引: {self.ntotal} 个向量")
+        self._print_memory_usage()
+
+    def _store_raw_vectors(self, ids: np.ndarray, matrix: np.ndarray):
+        """量化索引在 chunk 库中保存原始向量，其他索引类型清除不再需要的原始向量"""
+        if self.index_type in RESCORED_INDEX_TYPES:
+            self.chunks.set_vectors(ids, matrix)
+        else:
+            self.chunks.drop_vectors()
+
+    def _print_memory_usage(self):
+        usage = self.memory_usage()
+        if usage['float32_bytes']:
+            print(f"   向量占用 {usage['vector_bytes'] / 1024 / 1024:.1f} MB"
+                  f"（float32 为 {usage['float32_bytes'] / 1024 / 1024:.1f} MB，节省 {usage['saved_ratio']:.0%}）")
+
+    def with_metric(self, metric: str, train_sample_size: int = 100_000) -> "FaissVectorStore":
+        """
+        返回转换到另一种度量的副本（不调用 Embeddings API）
+
+        从本库的索引取回已存储的向量，转为 cosine 时先归一化，再按相同的索引类型和
+        参数重建。副本与本库共用 chunk 库和 chunk id，本库不做任何修改，转换期间
+        可以继续检索；副本保存后即成为新一代快照。ivfpq 只能取回量化后的近似向量。
+        """
+        ids, matrix = self.export_vectors()
+        if metric == 'cosine':
+            matrix = normalize_vectors(matrix)
+        index, index_type, index_params = build_index(
+            self.index_type, self.dim, ids, matrix, self.index_params, train_sample_size, metric=metric
+        )
+        # mmap 只读加载的库，副本另开可写的 chunk 库连接
+        chunks = ChunkStore(self.path / ChunkStore.FILE) if self.read_only else self.chunks
+        store = type(self)(
+            self.dim, chunks, index,
+            files=json.loads(json.dumps(self.files)),
+            next_file_id=self.next_file_id,
+            index_type=index_type,
+            index_params=index_params,
+            metric=metric,
+            lexical=self.lexical.copy()
+        )
+        store.path = self.path
+        store.generation = self.generation
+        # 共用的 chunk 库中的原始向量随之替换（提交前仅本连接可见）
+        store._store_raw_vectors(ids, matrix)
+        print(f"✅ 已转换为 {metric} 度量: {store.ntotal} 个向量")
+        return store
+
+    def save(self, path: Path):
+        """
+        保存为新一代快照：提交 chunk 库的写入，把索引（faiss 二进制）和文件映射（JSON）
+        写入临时目录并 fsync，原子重命名为 gen-<代号>/，最后原子替换 CURRENT 发布
+
+        发布前的任何一步中断，CURRENT 仍指向完整的上一代。
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        generation = max([self._pending_generation, *(g + 1 for g in self._generations(path))])
+        if self._drop_chunks_before is not None:
+            self.chunks.delete_before(self._drop_chunks_before, self._pending_generation)
+            self._drop_chunks_before = None
+        self.chunks.commit()
+
+        # 写入期间即持有新一代，其他进程回收时不会删除尚未发布的临时目录
+        key = _hold_generation(path, generation)
+        try:
+            generation_dir = self._generation_dir(path, generation)
+            tmp_dir = generation_dir.with_name(generation_dir.name + '.tmp')
+            if tmp_dir.exists():
+                shutil.rmtree(tmp_dir)
+            tmp_dir.mkdir()
+            faiss.write_index(self.index, str(tmp_dir / self.INDEX_FILE))
+            self._write_store_file(tmp_dir)
+            for file in [tmp_dir / self.INDEX_FILE, tmp_dir / self.STORE_FILE, *self.lexical.save(tmp_dir)]:
+                _fsync(file)
+            os.rename(tmp_dir, generation_dir)
+            self._publish(path, generation)
+        except BaseException:
+            _release_generation(key)
+            raise
+
+        self.path = path
+        self.generation = generation
+        self._hold(path, generation, key)
+        self.collect_garbage(path, self.chunks)
+
+    def _write_store_file(self, path: Path):
+        store = {
+            'dim': self.dim,
+            'next_file_id': self.next_file_id,
+            'index_type': self.index_type,
+            'index_params': self.index_params,
+            'metric': self.metric,
+            'deleted': sorted(self.deleted),
+            'files': self.files
+        }
+        tmp_store = path / (self.STORE_FILE + '.tmp')
+        with open(tmp_store, 'w', encoding='utf-8') as f:
+            json.dump(store, f, ensure_ascii=False)
+        os.replace(tmp_store, path / self.STORE_FILE)
+
+    def discard_changes(self):
+        """
+        撤销上次保存之后写入 chunk 库的内容（内存中的索引随之作废）
+
+        不关闭 chunk 库：successor 创建的新库与旧库共用同一连接，旧库可能仍在服务检索。
+        """
+        self.chunks.rollback()
+
+    def close(self):
+        self._release()
+        self.chunks.close()
+
+    # ===== 快照（generation）管理 =====
+
+    @classmethod
+    def _generation_dir(cls, path: Path, generation: int) -> Path:
+        if generation == 0:
+            # 第 0 代：未分代的旧版布局，文件直接位于向量库目录下
+            return Path(path)
+        return Path(path) / f"{cls.GENERATION_PREFIX}{generation:06d}"
+
+    @classmethod
+    def _generations(cls, path: Path) -> List[int]:
+        """磁盘上已有的全部代号（含未发布的临时目录和旧版布局的第 0 代）"""
+        path = Path(path)
+        if not path.exists():
+            return []
+        generations = set()
+        if (path / cls.INDEX_FILE).exists():
+            generations.add(0)
+        for child in path.iterdir():
+            name = child.name
+            if child.is_dir() and name.startswith(cls.GENERATION_PREFIX):
+                number = name[len(cls.GENERATION_PREFIX):].split('.')[0]
+                if number.isdigit():
+                    generations.add(int(number))
+        current = cls.current_generation(path)
+        if current is not None:
+            generations.add(current)
+        return sorted(generations)
+
+    @classmethod
+    def current_generation(cls, path: Path) -> Optional[int]:
+        """CURRENT 指向的代号；只有旧版布局时为 0，没有向量库时为 None"""
+        path = Path(path)
+        try:
+            return int((path / cls.CURRENT_FILE).read_text().strip())
+        except (OSError, ValueError):
+            pass
+        if (path / cls.INDEX_FILE).exists() and (path / cls.STORE_FILE).exists():
+            return 0
+        return None
+
+    @classmethod
+    def _publish(cls, path: Path, generation: int):
+        """原子替换 CURRENT，使第 generation 代成为当前快照"""
+        tmp_file = Path(path) / (cls.CURRENT_FILE + '.tmp')
+        with open(tmp_file, 'w') as f:
+            f.write(f"{generation}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, Path(path) / cls.CURRENT_FILE)
+
+    @classmethod
+    def _remove_generation(cls, path: Path, generation: int):
+        generation_dir = cls._generation_dir(path, generation)
+        if generation == 0:
+            for name in (cls.INDEX_FILE, cls.STORE_FILE):
+                if (generation_dir / name).exists():
+                    (generation_dir / name).unlink()
+            return
+        shutil.rmtree(generation_dir, ignore_errors=True)
+        shutil.rmtree(generation_dir.with_name(generation_dir.name + '.tmp'), ignore_errors=True)
+
+    @classmethod
+    def collect_garbage(cls, path: Path, chunks: Optional[ChunkStore] = None,
+                        keep: Optional[int] = None) -> List[int]:
+        """
+        回收旧快照
+
+        保留当前代及其之前共 keep 代（默认 KEEP_GENERATIONS）、以及任何进程仍持有租约
+        的代，其余目录删除；chunk 库中只被已回收的代引用的墓碑随之物理删除。
+
+        Returns:
+            保留下来的代号
+        """
+        path = Path(path)
+        keep = cls.KEEP_GENERATIONS if keep is None else keep
+        current = cls.current_generation(path)
+        published = [g for g in cls._generations(path) if current is not None and g <= current]
+        retained = set(published[-keep:]) if keep > 0 else set()
+        retained.update(held_generations(path))
+        for generation in cls._generations(path):
+            if generation in retained:
+                continue
+            lease = _try_reclaim_lease(path, generation)
+            if lease is None:
+                # 其他进程的读者仍在使用
+                retained.add(generation)
+                continue
+            try:
+                cls._remove_generation(path, generation)
+                if lease >= 0:
+                    # 持有排他锁时删除租约文件；之后才取得锁的读者加载时发现快照目录已不存在
+                    _lease_file(path, generation).unlink()
+            finally:
+                if lease >= 0:
+                    os.close(lease)
+
+        if chunks is not None:
+            chunks.purge(min(retained) if retained else None)
+        return sorted(retained)
+
+    @classmethod
+    def destroy(cls, path: Path):
+        """
+        删除向量库：先移除 CURRENT（此后不再有新的读者），再回收不再被持有的快照
+
+        仍有读者（任何进程）持有的快照和 chunk 保留到下次保存时回收。
+        """
+        path = Path(path)
+        if not path.exists():
+            return
+        current_file = path / cls.CURRENT_FILE
+        if current_file.exists():
+            current_file.unlink()
+        retained = cls.collect_garbage(path, keep=0)
+        if retained:
+            chunks = ChunkStore(path / ChunkStore.FILE)
+            chunks.clear(max(retained) + 1)
+            chunks.commit()
+            chunks.purge(min(retained))
+            chunks.close()
+            return
+        for chunk_file in path.glob(ChunkStore.FILE + '*'):
+            chunk_file.unlink()
+
+    @classmethod
+    def signature(cls, path: Path) -> Optional[Tuple[int, int]]:
+        """
+        磁盘上向量库的版本签名（当前代号及 CURRENT 的 mtime），不存在时为 None
+
+        每次保存都会发布新的一代，签名变化即说明向量库已被重新保存。
+        """
+        path = Path(path)
+        pointer = path / cls.CURRENT_FILE
+        if not pointer.exists():
+            pointer = path / cls.STORE_FILE
+        try:
+            mtime = pointer.stat().st_mtime_ns
+        except OSError:
+            return None
+        return cls.current_generation(path), mtime
+
+    @classmethod
+    def disk_bytes(cls, path: Path) -> int:
+        """向量库目录占用的字节数（各代快照、chunk 库及其 WAL）"""
+        path = Path(path)
+        if not path.exists():
+            return 0
+        return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+
+    @classmethod
+    def exists(cls, path: Path) -> bool:
+        generation = cls.current_generation(path)
+        if generation is None:
+            return False
+        generation_dir = cls._generation_dir(path, generation)
+        return (generation_dir / cls.INDEX_FILE).exists() and (generation_dir / cls.STORE_FILE).exists()
+
+    @classmethod
+    def stored_dim(cls, path: Path) -> Optional[int]:
+        """当前代向量库的向量维度（不加载索引），向量库不存在时为 None"""
+        if not cls.exists(path):
+            return None
+        with open(cls._generation_dir(Path(path), cls.current_generation(path)) / cls.STORE_FILE,
+                  'r', encoding='utf-8') as f:
+            return json.load(f).get('dim')
+
+    @classmethod
+    def load(cls, path: Path, mmap: bool = False) -> "FaissVectorStore":
+        """
+        加载当前代的向量库（不读取 chunk 文本）
+
+        Args:
+            path: 向量库目录
+            mmap: 为 True 时以只读方式映射索引中的向量编码（见 _read_index_mmap）并只读打开
+                  chunk 库，多个进程共享操作系统页缓存中的同一份编码；第一次写入时自动转为
+                  内存副本
+        """
+        path = Path(path)
+        generation = cls.current_generation(path)
+        if generation is None:
+            raise FileNotFoundError(f"向量库不存在: {path}")
+        key = _hold_generation(path, generation)
+        try:
+            return cls._load_generation(path, generation, mmap, key)
+        except BaseException:
+            _release_generation(key)
+            raise
+
+    @classmethod
+    def _load_generation(cls, path: Path, generation: int, mmap: bool, key: Tuple[str, int]) -> "FaissVectorStore":
+        """在已取得租约的前提下加载第 generation 代"""
+        generation_dir = cls._generation_dir(path, generation)
+        if not (generation_dir / cls.INDEX_FILE).exists():
+            # 读取 CURRENT 之后、取得租约之前该代已被其他进程回收（期间至少又发布了 KEEP_GENERATIONS 代）
+            raise FileNotFoundError(f"快照已被回收，请重新加载: {generation_dir}")
+        with open(generation_dir / cls.STORE_FILE, 'r', encoding='utf-8') as f:
+            store = json.load(f)
+        if mmap:
+            index = cls._read_index_mmap(generation_dir / cls.INDEX_FILE, store.get('index_type', 'flat'))
+        else:
+            index = faiss.read_index(str(generation_dir / cls.INDEX_FILE))
+
+        if not (path / ChunkStore.FILE).exists():
+            cls._migrate_chunks(path, store)
+
+        chunks = ChunkStore(path / ChunkStore.FILE, read_only=mmap)
+        if not mmap:
+            # 上次保存在发布前中断时遗留的墓碑不属于任何已发布的代
+            chunks.restore_after(generation)
+        vector_store = cls(
+            dim=store['dim'],
+            chunks=chunks,
+            index=index,
+            files=store.get('files', {}),
+            next_file_id=store.get('next_file_id', 1),
+            index_type=store.get('index_type', 'flat'),
+            index_params=store.get('index_params'),
+            deleted=store.get('deleted'),
+            metric=store.get('metric', 'l2'),
+            lexical=BM25Index.load(generation_dir, mmap) if BM25Index.exists(generation_dir) else None
+        )
+        if not BM25Index.exists(generation_dir):
+            # 早期版本的快照没有 BM25 索引：从 chunk 库建立，下次保存时一并写入
+            vector_store._build_lexical_index()
+        if 'docs' in store:
+            # chunk 文本已迁入 chunk 库，store.json 只保留文件映射
+            vector_store._write_store_file(generation_dir)
+        vector_store.path = path
+        vector_store.read_only = mmap
+        vector_store.generation = generation
+        vector_store._hold(path, generation, key)
+        return vector_store
+
+    @staticmethod
+    def _read_index_mmap(index_file: Path, index_type: str):
+        """
+        只读映射索引文件
+
+        ivf / ivfpq 用 IO_FLAG_MMAP 映射倒排表；flat / hnsw / sq8 / sqfp16 用 IO_FLAG_MMAP_IFC
+        映射向量编码（hnsw 的邻接图仍读入内存）。FAISS 版本不支持 IO_FLAG_MMAP_IFC 时
+        退回 IO_FLAG_MMAP，此时这些类型的编码会被完整读入每个进程的内存。
+        """
+        if index_type in IVF_INDEX_TYPES:
+            return faiss.read_index(str(index_file), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        mmap_codes = getattr(faiss, 'IO_FLAG_MMAP_IFC', None)
+        if mmap_codes is not None:
+            return faiss.read_index(str(index_file), mmap_codes | faiss.IO_FLAG_READ_ONLY)
+        print(f"⚠️ 当前 FAISS 版本 ({faiss.__version__}) 不支持映射 {index_type} 索引的向量编码，"
+              f"编码将读入进程内存（需要 faiss-cpu >= 1.10）")
+        return faiss.read_index(str(index_file), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+    def _build_lexical_index(self):
+        ids = self.chunks.ids()
+        if self.deleted:
+            ids = ids[~np.isin(ids, np.asarray(sorted(self.deleted), dtype=np.int64))]
+        print(f"🔄 建立 BM25 倒排索引: {len(ids)} 个 chunk...")
+        for i in range(0, len(ids), self._MIGRATE_BATCH):
+            docs = self.chunks.get_many(ids[i:i + self._MIGRATE_BATCH].tolist())
+            self.lexical.add(docs.keys(), (doc.page_content for doc in docs.values()))
+
+    @classmethod
+    def _migrate_chunks(cls, path: Path, store: Dict):
+        """把旧格式的 chunk 文本（store.json 中的 docs，或 chunks.dat + chunks.idx）迁入 chunk 库"""
+        legacy_data = path / cls.LEGACY_CHUNKS_FILE
+        legacy_index = path / cls.LEGACY_CHUNKS_INDEX_FILE
+        if 'docs' in store:
+            items = (
+                (int(chunk_id), Document(page_content=content, metadata=metadata))
+                for chunk_id, content, metadata in store['docs']
+            )
+        elif legacy_data.exists() and legacy_index.exists():
+            items = ChunkFileReader(legacy_data, legacy_index).items()
+        else:
+            return
+
+        print(f"🔄 迁移 chunk 文本到 {ChunkStore.FILE}...")
+        chunks = ChunkStore(path / ChunkStore.FILE)
+        batch = []
+        migrated = 0
+        for item in items:
+            batch.append(item)
+            if len(batch) >= cls._MIGRATE_BATCH:
+                chunks.put_many(batch)
+                migrated += len(batch)
+                batch = []
+        chunks.put_many(batch)
+        migrated += len(batch)
+        chunks.commit()
+        chunks.close()
+        for legacy_file in (legacy_data, legacy_index):
+            if legacy_file.exists():
+                legacy_file.unlink()
+        print(f"✅ 已迁移 {migrated} 个 chunk")
+
+    @classmethod
+    def from_langchain(cls, lc_store, path: Path, metric: str = 'l2') -> "FaissVectorStore":
+        """
+        从旧版 LangChain FAISS 索引迁移
+
+        直接从扁平索引中取回已存储的向量，不会重新调用 Embeddings API
+        （metric 为 cosine 时写入前归一化）。
+        """
+        ntotal = lc_store.index.ntotal
+        store = cls.create(path, lc_store.index.d, metric)
+        if ntotal == 0:
+            return store
+
+        matrix = lc_store.index.reconstruct_n(0, ntotal)
+        grouped: Dict[str, Tuple[List[Document], List]] = {}
+        for position in range(ntotal):
+            doc = lc_store.docstore.search(lc_store.index_to_docstore_id[position])
+            if not isinstance(doc, Document):
+                continue
+            source = doc.metadata.get('source', 'Unknown')
+            docs, vectors = grouped.setdefault(source, ([], []))
+            docs.append(Document(page_content=doc.page_content, metadata=dict(doc.metadata)))
+            vectors.append(matrix[position])
+
+        for source, (docs, vectors) in grouped.items():
+            store.add_file_chunks(source, docs, vectors)
+        return store